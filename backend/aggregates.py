@@ -0,0 +1,187 @@
+import json
+import asyncio
+import datetime
+import threading
+
+from backend.evidence import thumbnail_url
+
+# Skip-scan di atas idx_attendance_date_ts: setiap langkah mencari tanggal berikutnya
+# lewat index, jadi biayanya sebanding jumlah hari, bukan jumlah baris log.
+ATTENDED_DATES_QUERY = """
+    WITH RECURSIVE days(attendance_date) AS (
+        SELECT MIN(absent_date) FROM attendance_logs
+        UNION ALL
+        SELECT (SELECT MIN(absent_date) FROM attendance_logs WHERE absent_date > days.attendance_date)
+        FROM days WHERE days.attendance_date IS NOT NULL
+    )
+    SELECT attendance_date FROM days WHERE attendance_date IS NOT NULL
+"""
+
+
+class AttendanceAggregates:
+    """
+    Agregat dashboard yang disimpan di memori dan diperbarui oleh jalur tulis
+    /recognize, sehingga polling dashboard tidak perlu menyentuh SQLite.
+
+    Berisi roster hari ini (terbaru di depan), tanggal absensi pertama, dan
+    bitmap hari: bit ke-i menyala jika ada absensi pada `start_date + i hari`.
+    Setiap perubahan menaikkan `version`, yang dipakai sebagai ETag dan
+    dikirim ke pelanggan Server-Sent Events.
+    """
+
+    def __init__(self, timezone):
+        self.timezone = timezone
+        self.version = 0
+        self._lock = threading.Lock()
+        self._day = None
+        self._roster = []
+        self._first_absent_at = None
+        self._start_date = None
+        self._bitmap = bytearray()
+        self._attended_days = 0
+        self._subscribers = set()
+
+    def today(self) -> str:
+        return datetime.datetime.now(self.timezone).strftime('%Y-%m-%d')
+
+    # --- Pemuatan awal & pembaruan ---
+    def load(self, query_db):
+        """Mengisi agregat dari database sekali saat startup (query memakai index absent_date)."""
+        today = self.today()
+        roster = [self._roster_entry(row) for row in query_db(
+            "SELECT intern_name, universitas, kategori, absent_at, image_url, intern_id FROM attendance_logs "
+            "WHERE absent_date = ? ORDER BY absent_ts DESC", (today,))]
+        first = query_db("SELECT absent_at FROM attendance_logs ORDER BY absent_date, absent_ts LIMIT 1", one=True)
+        dates = [row['attendance_date'] for row in query_db(ATTENDED_DATES_QUERY)]
+        with self._lock:
+            self._day, self._roster = today, roster
+            self._first_absent_at = first['absent_at'] if first else None
+            self._start_date, self._bitmap, self._attended_days = None, bytearray(), 0
+            for date_str in dates:
+                self._mark_day(datetime.date.fromisoformat(date_str))
+            self.version += 1
+
+    def record(self, row: dict):
+        """Mencatat satu absensi baru yang sudah tersimpan di database lalu memberi tahu pelanggan SSE."""
+        entry = self._roster_entry(row)
+        with self._lock:
+            rolled = self._rollover_locked()
+            rollover = {"type": "rollover", "version": self.version, "date": self._day}
+            if row['absent_date'] == self._day:
+                self._roster.insert(0, entry)
+            if self._first_absent_at is None:
+                self._first_absent_at = row['absent_at']
+            self._mark_day(datetime.date.fromisoformat(row['absent_date']))
+            self.version += 1
+            event = {"type": "checkin", "version": self.version, "total_active": len(self._roster), "intern": entry}
+        if rolled:
+            self._publish("rollover", rollover)
+        self._publish("checkin", event)
+
+    @staticmethod
+    def _roster_entry(row) -> dict:
+        return {"name": row['intern_name'], "jobdesk": f"{row['kategori']} - {row['universitas']}",
+                "recognition_time": row['absent_at'], "capture_image": thumbnail_url(row['image_url']),
+                "intern_id": row['intern_id']}
+
+    def _rollover_locked(self) -> bool:
+        # Roster hanya berlaku untuk satu hari WIB; lewat tengah malam dikosongkan
+        today = self.today()
+        if today == self._day:
+            return False
+        self._day, self._roster = today, []
+        self.version += 1
+        return True
+
+    def ensure_day(self):
+        """Mengosongkan roster jika hari WIB sudah berganti dan memberi tahu pelanggan SSE."""
+        with self._lock:
+            rolled = self._rollover_locked()
+            event = {"type": "rollover", "version": self.version, "date": self._day}
+        if rolled:
+            self._publish("rollover", event)
+
+    def _mark_day(self, day: datetime.date):
+        if self._start_date is None:
+            self._start_date = day
+        elif day < self._start_date:
+            # Geser bitmap jika ada tanggal yang lebih awal dari start_date
+            shift = (self._start_date - day).days
+            old_bits = [i for i in range(len(self._bitmap) * 8) if self._bitmap[i >> 3] & (1 << (i & 7))]
+            self._start_date, self._bitmap = day, bytearray()
+            for i in old_bits:
+                self._set_bit(i + shift)
+        offset = (day - self._start_date).days
+        if not self._has_bit(offset):
+            self._set_bit(offset)
+            self._attended_days += 1
+
+    def _set_bit(self, offset: int):
+        if offset >> 3 >= len(self._bitmap):
+            self._bitmap.extend(bytes((offset >> 3) + 1 - len(self._bitmap)))
+        self._bitmap[offset >> 3] |= 1 << (offset & 7)
+
+    def _has_bit(self, offset: int) -> bool:
+        return 0 <= offset >> 3 < len(self._bitmap) and bool(self._bitmap[offset >> 3] & (1 << (offset & 7)))
+
+    # --- Snapshot untuk endpoint ---
+    def etag(self) -> str:
+        self.ensure_day()
+        with self._lock:
+            return f'W/"{self.version}-{self._day}"'
+
+    def today_snapshot(self) -> dict:
+        self.ensure_day()
+        with self._lock:
+            return {"total_active": len(self._roster), "active_interns": list(self._roster)}
+
+    def hello_event(self) -> dict:
+        """Event pembuka SSE: versi dan roster hari ini, agar klien yang tersambung ulang langsung sinkron."""
+        self.ensure_day()
+        with self._lock:
+            return {"type": "hello", "version": self.version, "date": self._day,
+                    "total_active": len(self._roster), "active_interns": list(self._roster)}
+
+    def first_absent_at(self):
+        return self._first_absent_at
+
+    def date_range(self) -> dict:
+        """Format sama dengan /api/attendance-dates-with-range: satu entri per hari sampai hari ini."""
+        self.ensure_day()
+        with self._lock:
+            if self._start_date is None:
+                return {"date_range": [], "total_dates": 0}
+            end_date = datetime.date.fromisoformat(self._day)
+            days = (end_date - self._start_date).days + 1
+            date_range = [{"date": (self._start_date + datetime.timedelta(days=i)).isoformat(), "has_attendance": self._has_bit(i)}
+                          for i in range(max(days, 0))]
+            return {"date_range": date_range, "total_dates": self._attended_days}
+
+    # --- Server-Sent Events ---
+    def subscribe(self) -> asyncio.Queue:
+        queue = asyncio.Queue(maxsize=100)
+        with self._lock:
+            self._subscribers.add((asyncio.get_running_loop(), queue))
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue):
+        with self._lock:
+            self._subscribers = {(loop, q) for loop, q in self._subscribers if q is not queue}
+
+    def _publish(self, event_type: str, data: dict):
+        message = f"event: {event_type}\ndata: {json.dumps(data)}\n\n"
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for loop, queue in subscribers:
+            # record() dipanggil dari threadpool, jadi antrean diisi lewat event loop pemiliknya
+            try:
+                loop.call_soon_threadsafe(self._offer, queue, message)
+            except RuntimeError:
+                # Event loop sudah ditutup (server berhenti)
+                self.unsubscribe(queue)
+
+    @staticmethod
+    def _offer(queue: asyncio.Queue, message: str):
+        # Dashboard yang terlalu lambat membaca akan kehilangan event, bukan menahan server
+        if not queue.full():
+            queue.put_nowait(message)
@@ -0,0 +1,64 @@
+import datetime
+import threading
+
+
+class DailyAttendanceCache:
+    """
+    Cache nama yang sudah absen, dengan kunci tanggal WIB.
+
+    Isinya hanya berlaku untuk satu hari. Saat tanggal berganti, cache
+    otomatis dikosongkan dan diisi ulang secara lazy dari log (query ber-index
+    pada absent_date) pada akses pertama di hari baru, jadi server tidak perlu
+    di-restart setiap tengah malam. Semua operasi aman dipanggil dari banyak thread.
+    """
+
+    def __init__(self, timezone, loader):
+        self.timezone = timezone
+        self._loader = loader
+        self._lock = threading.Lock()
+        self._day = None
+        self._names = set()
+
+    def today(self) -> str:
+        return datetime.datetime.now(self.timezone).strftime('%Y-%m-%d')
+
+    def _roll_to_locked(self, day: str):
+        if day != self._day:
+            # Memuat ulang dari database, bukan sekadar mengosongkan: proses lain
+            # (mis. worker uvicorn kedua) mungkin sudah mencatat absensi hari itu.
+            self._names = set(self._loader(day))
+            self._day = day
+
+    @property
+    def day(self) -> str:
+        with self._lock:
+            self._roll_to_locked(self.today())
+            return self._day
+
+    def __contains__(self, name: str) -> bool:
+        with self._lock:
+            self._roll_to_locked(self.today())
+            return name in self._names
+
+    def __len__(self) -> int:
+        with self._lock:
+            self._roll_to_locked(self.today())
+            return len(self._names)
+
+    def reserve(self, name: str, day: str) -> bool:
+        """
+        Cek-dan-tandai secara atomik untuk tanggal `day`. Mengembalikan False
+        jika orang tersebut sudah absen hari itu (duplikat).
+        """
+        with self._lock:
+            self._roll_to_locked(day)
+            if name in self._names:
+                return False
+            self._names.add(name)
+            return True
+
+    def release(self, name: str, day: str):
+        """Membatalkan reserve() jika penulisan ke database gagal."""
+        with self._lock:
+            if day == self._day:
+                self._names.discard(name)
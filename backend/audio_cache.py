@@ -0,0 +1,180 @@
+import json
+import time
+import hashlib
+import threading
+from pathlib import Path
+from collections import OrderedDict
+
+from gtts import gTTS
+
+# Teks klip duplikat per orang; dibuat saat training dan disimpan sebagai D<track>.mp3
+DUPLICATE_MESSAGE = "Anda Sudah Melakukan Absensi Hari Ini, {name}"
+# Klip umum "Anda Sudah Melakukan Absensi Hari Ini" tanpa nama
+GENERIC_DUPLICATE_TRACK = "S001"
+# Jeda sebelum gTTS dicoba lagi setelah gagal (detik), berlipat dua sampai batas atas
+SYNTH_RETRY_BASE = 60.0
+SYNTH_RETRY_MAX = 3600.0
+
+
+def duplicate_track_id(welcome_track: str) -> str:
+    """Track ID klip duplikat diturunkan dari track sambutan: 0001 -> D0001."""
+    return f"D{welcome_track}"
+
+
+def synthesize_duplicate_clip(person_name: str, audio_path: Path):
+    """Membuat klip duplikat dengan gTTS (butuh internet). Ditulis atomik lewat file .tmp."""
+    tmp_path = audio_path.with_suffix(".tmp")
+    try:
+        gTTS(text=DUPLICATE_MESSAGE.format(name=person_name), lang='id').save(str(tmp_path))
+        tmp_path.replace(audio_path)
+    finally:
+        tmp_path.unlink(missing_ok=True)
+
+
+def render_duplicate_clips(audio_dir: Path, audio_tracking: dict) -> list:
+    """
+    Membuat klip duplikat D<track>.mp3 yang belum ada untuk setiap nama di
+    audio_tracking. Mengembalikan list (nama, track ID, error) yang gagal.
+    """
+    failed = []
+    for name, welcome_track in sorted(audio_tracking.items()):
+        track_id = duplicate_track_id(welcome_track)
+        audio_path = Path(audio_dir) / f"{track_id}.mp3"
+        if audio_path.exists():
+            continue
+        try:
+            synthesize_duplicate_clip(name, audio_path)
+            print(f"      ✅ Berhasil membuat audio duplikat untuk {name} ({track_id}.mp3)")
+        except Exception as e:
+            failed.append((name, track_id, e))
+            print(f"      ❌ Gagal membuat {track_id}.mp3: {e}")
+    return failed
+
+
+class DuplicateAudioCache:
+    """
+    Cache LRU nama -> track ID klip duplikat di `generated_audio`.
+
+    Jalur request hanya melakukan lookup di memori (atau satu stat file saat
+    cache miss). Jika klip belum ada, respons langsung memakai klip umum
+    S001 dan klip pribadi dibuat di background untuk scan berikutnya.
+    Klip yang dibuat di server ikut dibatasi jumlahnya: saat entri keluar dari
+    LRU, file buatan server tersebut dihapus; klip hasil training tidak disentuh.
+
+    Kegagalan gTTS (biasanya karena offline) diingat: selama jeda backoff tidak
+    ada percobaan baru untuk nama mana pun, dan jedanya berlipat dua setiap
+    kali gagal lagi, sehingga scan duplikat di lokasi offline tidak terus
+    membuka thread yang pasti gagal.
+    """
+
+    def __init__(self, audio_dir: Path, audio_tracking: dict, max_entries: int = 256,
+                 retry_base: float = SYNTH_RETRY_BASE, retry_max: float = SYNTH_RETRY_MAX):
+        self.audio_dir = Path(audio_dir)
+        self.audio_tracking = audio_tracking
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._generated = set()
+        self._in_progress = set()
+        self.retry_base = retry_base
+        self.retry_max = retry_max
+        self._retry_at = 0.0
+        self._retry_delay = 0.0
+        self._lock = threading.Lock()
+
+    def track_for(self, person_name: str) -> str:
+        with self._lock:
+            if person_name in self._entries:
+                self._entries.move_to_end(person_name)
+                return self._entries[person_name]
+
+        welcome_track = self.audio_tracking.get(person_name)
+        if not welcome_track:
+            return GENERIC_DUPLICATE_TRACK
+        track_id = duplicate_track_id(welcome_track)
+        if (self.audio_dir / f"{track_id}.mp3").exists():
+            self._put(person_name, track_id)
+            return track_id
+
+        self._synthesize_in_background(person_name, track_id)
+        return GENERIC_DUPLICATE_TRACK
+
+    def _put(self, person_name: str, track_id: str):
+        with self._lock:
+            self._entries[person_name] = track_id
+            self._entries.move_to_end(person_name)
+            while len(self._entries) > self.max_entries:
+                _, evicted = self._entries.popitem(last=False)
+                if evicted in self._generated:
+                    self._generated.discard(evicted)
+                    (self.audio_dir / f"{evicted}.mp3").unlink(missing_ok=True)
+
+    def _synthesize_in_background(self, person_name: str, track_id: str):
+        with self._lock:
+            if track_id in self._in_progress or time.monotonic() < self._retry_at:
+                return
+            self._in_progress.add(track_id)
+
+        def run():
+            try:
+                synthesize_duplicate_clip(person_name, self.audio_dir / f"{track_id}.mp3")
+                with self._lock:
+                    self._generated.add(track_id)
+                    self._retry_delay = 0.0
+                self._put(person_name, track_id)
+            except Exception as e:
+                # Offline: tetap memakai klip umum sampai backoff habis atau training berikutnya membuatnya
+                with self._lock:
+                    self._retry_delay = min(max(self._retry_delay * 2, self.retry_base), self.retry_max)
+                    self._retry_at = time.monotonic() + self._retry_delay
+                print(f"⚠️ Gagal membuat audio duplikat untuk {person_name}: {e} "
+                      f"(dicoba lagi setelah {self._retry_delay:.0f} detik)")
+            finally:
+                with self._lock:
+                    self._in_progress.discard(track_id)
+
+        threading.Thread(target=run, name="tts-duplicate", daemon=True).start()
+
+
+class AudioManifest:
+    """
+    Daftar klip di `generated_audio` beserta hash isinya, dipakai kiosk untuk
+    menyinkronkan salinan lokalnya saat startup. Hash dihitung ulang hanya
+    jika ukuran atau mtime file berubah.
+    """
+
+    def __init__(self, audio_dir: Path):
+        self.audio_dir = Path(audio_dir)
+        self._hashes = {}
+        self._lock = threading.Lock()
+
+    def tracks(self) -> dict:
+        """track ID -> {"size", "hash"} (SHA-256 isi file, 16 karakter pertama)."""
+        tracks = {}
+        for path in sorted(self.audio_dir.glob("*.mp3")):
+            # MP3 sementara dari versi lama bukan track
+            if path.name.startswith("temp_"):
+                continue
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            key = (stat.st_mtime_ns, stat.st_size)
+            with self._lock:
+                cached = self._hashes.get(path.name)
+            if cached is None or cached[0] != key:
+                cached = (key, hashlib.sha256(path.read_bytes()).hexdigest()[:16])
+                with self._lock:
+                    self._hashes[path.name] = cached
+            tracks[path.stem] = {"size": stat.st_size, "hash": cached[1]}
+        return tracks
+
+
+if __name__ == "__main__":
+    # Membuat klip duplikat yang belum ada tanpa training ulang (butuh internet):
+    #   python -m backend.audio_cache
+    base_dir = Path(__file__).resolve().parent
+    with open(base_dir / "audio_tracking.json") as f:
+        tracking = json.load(f)
+    print(f"🔁 Membuat audio duplikat untuk {len(tracking)} nama...")
+    failed = render_duplicate_clips(base_dir / "generated_audio", tracking)
+    print(f"{'⚠️' if failed else '✅'} {len(tracking) - len(failed)}/{len(tracking)} klip duplikat tersedia.")
@@ -0,0 +1,85 @@
+import time
+import asyncio
+
+from backend.inference import InferenceBusyError
+
+
+class MicroBatcher:
+    """
+    Mengumpulkan frame dari request /recognize yang datang bersamaan menjadi
+    satu batch, lalu menjalankan embedding dan pencocokan sekali untuk semuanya.
+
+    Batch dikirim ketika jumlah frame mencapai `max_batch_size` atau ketika
+    jendela `window_ms` sejak frame pertama habis, mana yang lebih dulu.
+    Setiap request menunggu future miliknya sendiri.
+
+    embed_fn : dijalankan di InferenceExecutor, menerima list bytes dan list
+               flag pre_cropped, mengembalikan list dict hasil (satu per frame).
+    match_fn : dijalankan di threadpool default, menerima list hasil
+               embed_fn dan melengkapinya dengan hasil pencocokan.
+    """
+
+    def __init__(self, executor, embed_fn, match_fn, max_batch_size: int = 8, window_ms: float = 10):
+        self.executor = executor
+        self.embed_fn = embed_fn
+        self.match_fn = match_fn
+        self.max_batch_size = max(1, max_batch_size)
+        self.window = window_ms / 1000
+        self._pending = []
+        self._timer = None
+        self._tasks = set()
+
+    @property
+    def pending(self) -> int:
+        """Jumlah frame yang sedang menunggu jendela batch berikutnya."""
+        return len(self._pending)
+
+    async def submit(self, frame_bytes: bytes, pre_cropped: bool = False) -> dict:
+        # Tolak lebih awal jika executor sudah penuh, jangan sampai frame menumpuk di sini.
+        if self.executor.depth >= self.executor.capacity:
+            raise InferenceBusyError(self.executor.retry_after)
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((frame_bytes, pre_cropped, future, time.perf_counter()))
+
+        if len(self._pending) >= self.max_batch_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._pending:
+            return
+        batch, self._pending = self._pending, []
+        task = asyncio.create_task(self._run(batch))
+        # Simpan referensi task agar tidak dibersihkan garbage collector sebelum selesai
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, batch):
+        futures = [future for _, _, future, _ in batch]
+        try:
+            started = time.perf_counter()
+            results = await self.executor.run(self.embed_fn, [frame_bytes for frame_bytes, _, _, _ in batch],
+                                              [pre_cropped for _, pre_cropped, _, _ in batch])
+            worker_ms = (time.perf_counter() - started) * 1000
+            loop = asyncio.get_running_loop()
+            results = await loop.run_in_executor(None, self.match_fn, results)
+        except Exception as e:
+            for future in futures:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for (_, _, future, enqueued_at), result in zip(batch, results):
+            # Waktu tunggu = jendela batching + antrean executor, tanpa kerja aktual worker
+            waited_ms = (started - enqueued_at) * 1000 + worker_ms - sum(
+                v for k, v in result["timings"].items() if k in ("decode", "detect_fast", "embed"))
+            result["timings"]["queue"] = max(round(waited_ms, 2), 0)
+            if not future.done():
+                future.set_result(result)
@@ -0,0 +1,211 @@
+import queue
+import sqlite3
+import threading
+from pathlib import Path
+from contextlib import contextmanager
+from concurrent.futures import Future
+
+# Pragma untuk setiap koneksi. WAL membuat pembaca tidak terblokir oleh penulis,
+# synchronous=NORMAL aman di mode WAL dan jauh lebih cepat dari FULL.
+CONNECTION_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA busy_timeout=5000",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-16000",
+)
+
+
+# Versi skema disimpan di PRAGMA user_version
+SCHEMA_VERSION = 2
+
+SCHEMA_STATEMENTS = (
+    "CREATE TABLE IF NOT EXISTS interns (id INTEGER PRIMARY KEY, name TEXT UNIQUE, universitas TEXT, kategori TEXT)",
+    "CREATE TABLE IF NOT EXISTS attendance_logs (id INTEGER PRIMARY KEY, intern_id INTEGER, intern_name TEXT, universitas TEXT, kategori TEXT, image_url TEXT, absent_at TEXT)",
+)
+
+# Migrasi per versi. absent_date = tanggal lokal (WIB) 'YYYY-MM-DD', absent_ts = epoch detik.
+# absent_at disimpan sebagai ISO dengan offset +07:00, jadi 10 karakter pertamanya
+# sudah tanggal lokal, sedangkan strftime('%s') mengonversinya ke UTC dengan benar.
+MIGRATIONS = {
+    1: (
+        "ALTER TABLE attendance_logs ADD COLUMN absent_date TEXT",
+        "ALTER TABLE attendance_logs ADD COLUMN absent_ts INTEGER",
+        "UPDATE attendance_logs SET absent_date = substr(absent_at, 1, 10), "
+        "absent_ts = CAST(strftime('%s', absent_at) AS INTEGER) WHERE absent_date IS NULL",
+        # Dashboard: filter per hari + urut waktu, COUNT, MIN dan DISTINCT tanggal
+        "CREATE INDEX IF NOT EXISTS idx_attendance_date_ts ON attendance_logs (absent_date, absent_ts)",
+        # Cek absensi per orang per hari
+        "CREATE INDEX IF NOT EXISTS idx_attendance_intern_date ON attendance_logs (intern_name, absent_date)",
+    ),
+    2: (
+        # Riwayat/export keyset-paginated: urut (absent_ts, id) langsung dari index
+        "CREATE INDEX IF NOT EXISTS idx_attendance_ts ON attendance_logs (absent_ts)",
+    ),
+}
+
+
+def migrate_schema(conn: sqlite3.Connection) -> int:
+    """
+    Membuat tabel jika belum ada lalu menjalankan migrasi yang belum diterapkan.
+
+    Setiap versi berjalan dalam satu BEGIN IMMEDIATE eksplisit: modul sqlite3
+    tidak membuka transaksi untuk DDL, sehingga tanpa ini ALTER TABLE sudah
+    ter-commit sebelum user_version naik dan crash di antaranya membuat start
+    berikutnya gagal dengan "duplicate column".
+    """
+    for statement in SCHEMA_STATEMENTS:
+        conn.execute(statement)
+    conn.commit()
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    for target in sorted(v for v in MIGRATIONS if v > version):
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for statement in MIGRATIONS[target]:
+                conn.execute(statement)
+            conn.execute(f"PRAGMA user_version = {target}")
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        version = target
+    return version
+
+
+def attendance_time_columns(now) -> tuple:
+    """Nilai (absent_at, absent_date, absent_ts) dari datetime lokal yang timezone-aware."""
+    return now.isoformat(), now.strftime('%Y-%m-%d'), int(now.timestamp())
+
+
+def open_connection(db_path: Path) -> sqlite3.Connection:
+    """
+    Membuka koneksi SQLite dengan pragma di atas. `cached_statements` membuat
+    query yang sama (mis. INSERT absensi) tidak di-parse ulang selama
+    koneksinya dipakai ulang lewat pool.
+    """
+    conn = sqlite3.connect(str(db_path), check_same_thread=False, cached_statements=256)
+    conn.row_factory = sqlite3.Row
+    for pragma in CONNECTION_PRAGMAS:
+        conn.execute(pragma)
+    return conn
+
+
+class ConnectionPool:
+    """
+    Pool koneksi baca. Koneksi dibuat saat dibutuhkan sampai `size` buah,
+    lalu dipinjamkan ke satu thread pada satu waktu.
+    """
+
+    def __init__(self, db_path: Path, size: int = 4):
+        self.db_path = db_path
+        self.size = size
+        self._idle = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def connection(self):
+        conn = self._acquire()
+        try:
+            yield conn
+        finally:
+            # Jangan kembalikan koneksi dengan transaksi yang masih terbuka
+            if conn.in_transaction:
+                conn.rollback()
+            self._idle.put(conn)
+
+    def _acquire(self) -> sqlite3.Connection:
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._created < self.size:
+                self._created += 1
+                return open_connection(self.db_path)
+        return self._idle.get()
+
+    def close_all(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+
+class AttendanceWriter:
+    """
+    Satu thread penulis untuk semua INSERT/UPDATE. Permintaan dari banyak
+    thread masuk ke antrean lalu digabung (sampai `max_batch` buah) ke dalam
+    satu transaksi, sehingga hanya ada satu penulis yang memegang lock SQLite.
+    """
+
+    _STOP = object()
+
+    def __init__(self, db_path: Path, max_batch: int = 64):
+        self.db_path = db_path
+        self.max_batch = max_batch
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="sqlite-writer", daemon=True)
+        self._thread.start()
+
+    def submit(self, sql: str, params=()) -> Future:
+        """Menjadwalkan satu statement. Future berisi lastrowid setelah commit."""
+        future = Future()
+        self._queue.put((sql, params, False, future))
+        return future
+
+    def submit_many(self, sql: str, rows) -> Future:
+        """Menjadwalkan executemany; semua baris masuk transaksi yang sama."""
+        future = Future()
+        self._queue.put((sql, list(rows), True, future))
+        return future
+
+    def execute(self, sql: str, params=(), timeout: float = 10):
+        """Versi blocking dari submit()."""
+        return self.submit(sql, params).result(timeout=timeout)
+
+    def _run(self):
+        conn = open_connection(self.db_path)
+        stopping = False
+        while not stopping:
+            item = self._queue.get()
+            if item is self._STOP:
+                break
+            batch = [item]
+            while len(batch) < self.max_batch:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is self._STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+            self._write_batch(conn, batch)
+        conn.close()
+
+    def _write_batch(self, conn, batch):
+        results = []
+        try:
+            with conn:
+                for sql, params, many, _ in batch:
+                    cursor = conn.executemany(sql, params) if many else conn.execute(sql, params)
+                    results.append(cursor.rowcount if many else cursor.lastrowid)
+        except Exception:
+            # Satu statement gagal membatalkan seluruh transaksi; ulangi satu per satu
+            # agar hanya permintaan yang bermasalah yang menerima error.
+            for sql, params, many, future in batch:
+                try:
+                    with conn:
+                        cursor = conn.executemany(sql, params) if many else conn.execute(sql, params)
+                    future.set_result(cursor.rowcount if many else cursor.lastrowid)
+                except Exception as e:
+                    future.set_exception(e)
+            return
+        for (_, _, _, future), result in zip(batch, results):
+            future.set_result(result)
+
+    def close(self):
+        self._queue.put(self._STOP)
+        self._thread.join(timeout=10)
@@ -1,30 +1,171 @@
 import cv2
 import os
+import sys
+import math
 from pathlib import Path
 
+import numpy as np
+
 # --- Konfigurasi ---
 # Tentukan path ke folder dataset utama Anda
 PROJECT_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+from backend.utils import MODEL_NAME, extract_all_face_features, preload_models, laplacian_variance
+from backend.face_index import l2_normalize
+from backend.embedding_cache import EmbeddingCache, file_hash
+
 DATASET_DIR = PROJECT_ROOT / "data" / "dataset"
+# Cache embedding yang sama dengan train_model, agar training tidak mengekstrak ulang
+EMBEDDING_CACHE_PATH = PROJECT_ROOT / "backend" / "model" / "embedding_cache.db"
+# Folder (di dalam folder orang) untuk gambar yang disisihkan oleh --prune;
+# train_model hanya membaca *.jpg langsung di folder orang, jadi isinya tidak ikut dilatih
+REJECTED_DIR_NAME = "_rejected"
 
 # Jumlah gambar yang akan diambil per orang
 NUM_IMAGES_TO_COLLECT = 15
 
+# Tahap kualitas: gambar yang tidak lolos langsung ditolak saat capture
+MIN_FACE_RATIO = 0.12         # lebar wajah minimal relatif terhadap lebar frame
+MIN_SHARPNESS = 80.0          # variansi Laplacian minimal di area wajah (112x112)
+MIN_FACE_PX = 40              # wajah lebih kecil dari ini tidak dihitung (latar belakang)
+MAX_ROLL_DEG = 20.0           # kemiringan garis mata maksimal
+MAX_YAW_OFFSET = 0.15         # geser titik tengah mata dari tengah kotak, relatif lebar wajah
+# Keberagaman: gambar yang jarak cosine-nya ke gambar yang sudah diterima lebih
+# kecil dari ini dianggap hampir sama dan ditolak
+MIN_EMBEDDING_DISTANCE = 0.06
+JPEG_QUALITY = 95             # sama dengan default cv2.imwrite
+
+
+def estimate_pose(face):
+    """
+    Perkiraan pose kasar dari posisi mata RetinaFace.
+
+    Returns:
+        tuple: (roll dalam derajat, yaw sebagai geser titik tengah mata relatif
+               terhadap lebar wajah), atau (None, None) jika mata tidak tersedia.
+    """
+    left, right = face.get("left_eye"), face.get("right_eye")
+    if not left or not right:
+        return None, None
+    dx, dy = right[0] - left[0], right[1] - left[1]
+    roll = math.degrees(math.atan2(dy, dx))
+    # Urutan mata (kiri/kanan orang vs kiri/kanan gambar) tidak mempengaruhi besar sudut
+    if roll > 90: roll -= 180
+    elif roll < -90: roll += 180
+    x, _, w, _ = face["box"]
+    yaw = ((left[0] + right[0]) / 2 - (x + w / 2)) / max(w, 1)
+    return roll, yaw
+
+
+class CaptureQuality:
+    """
+    Tahap kualitas saat pendaftaran wajah. Setiap gambar diperiksa berurutan
+    dengan hasil RetinaFace + ArcFace (sama seperti training, bukan Haar, agar
+    gambar yang valid tidak ditolak detektor cepat): tepat satu wajah, wajah
+    cukup besar dan tajam, pose cukup frontal, lalu keberagaman (embedding
+    tidak terlalu dekat dengan gambar yang sudah diterima). Embedding gambar
+    yang diterima disimpan agar bisa langsung ditulis ke cache training.
+    """
+
+    OK, NO_FACE, MULTIPLE_FACES, TOO_SMALL, BLURRY, NO_LANDMARKS, POSE, REDUNDANT = (
+        "ok", "no_face", "multiple_faces", "too_small", "blurry", "no_landmarks", "pose", "redundant")
+
+    def __init__(self, min_face_ratio=MIN_FACE_RATIO, min_sharpness=MIN_SHARPNESS, max_roll=MAX_ROLL_DEG,
+                 max_yaw=MAX_YAW_OFFSET, min_distance=MIN_EMBEDDING_DISTANCE):
+        self.min_face_ratio = min_face_ratio
+        self.min_sharpness = min_sharpness
+        self.max_roll = max_roll
+        self.max_yaw = max_yaw
+        self.min_distance = min_distance
+        self.accepted = []
+
+    def evaluate(self, frame):
+        """
+        Returns:
+            tuple: (alasan, embedding float32 atau None). Alasan CaptureQuality.OK
+                   berarti gambar diterima dan embedding-nya ikut disimpan.
+        """
+        # Sama seperti training: RetinaFace pada frame penuh, tanpa kaskade.
+        # Region pengganti DeepFace sudah disaring oleh is_detected_face().
+        faces = extract_all_face_features(frame, min_face=MIN_FACE_PX)
+        if not faces:
+            return self.NO_FACE, None
+        if len(faces) > 1:
+            return self.MULTIPLE_FACES, None
+        x, y, w, h = faces[0]["box"]
+        if w / frame.shape[1] < self.min_face_ratio:
+            return self.TOO_SMALL, None
+        # Ketajaman di area wajah pada ukuran tetap, seperti FrameGate
+        face = cv2.resize(frame[max(y, 0):y + h, max(x, 0):x + w], (112, 112), interpolation=cv2.INTER_AREA)
+        if laplacian_variance(face) < self.min_sharpness:
+            return self.BLURRY, None
+        # RetinaFace selalu memberi posisi mata untuk wajah asli; tanpa mata
+        # pose tidak bisa diperiksa, jadi gambar ditolak, bukan dilewatkan
+        roll, yaw = estimate_pose(faces[0])
+        if roll is None:
+            return self.NO_LANDMARKS, None
+        if abs(roll) > self.max_roll or abs(yaw) > self.max_yaw:
+            return self.POSE, None
+
+        embedding = np.asarray(faces[0]["embedding"], dtype=np.float32)
+        normalized = l2_normalize(embedding)[0]
+        if self.accepted and 1.0 - float(np.max(np.stack(self.accepted) @ normalized)) < self.min_distance:
+            return self.REDUNDANT, None
+        self.accepted.append(normalized)
+        return self.OK, embedding
+
+
+def encode_jpeg(frame) -> bytes:
+    _, data = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, JPEG_QUALITY])
+    return data.tobytes()
+
+
+def save_with_embeddings(target_dir: Path, prefix: str, accepted):
+    """
+    Menyimpan list (bytes JPEG, embedding) ke folder dataset lalu menulis
+    embedding-nya ke cache training dengan kunci hash isi file.
+    """
+    os.makedirs(target_dir, exist_ok=True)
+    number = 1
+    entries = []
+    for image_bytes, embedding in accepted:
+        # Jangan menimpa gambar lama jika orang yang sama didaftarkan ulang
+        while (target_dir / f"{prefix}_{number}.jpg").exists():
+            number += 1
+        filename = target_dir / f"{prefix}_{number}.jpg"
+        filename.write_bytes(image_bytes)
+        entries.append((file_hash(filename), filename, embedding))
+    EMBEDDING_CACHE_PATH.parent.mkdir(parents=True, exist_ok=True)
+    cache = EmbeddingCache(EMBEDDING_CACHE_PATH, MODEL_NAME)
+    try:
+        cache.put_many(entries)
+    finally:
+        cache.close()
+
+
 def collect_new_person():
     """
-    Fungsi utama untuk membuka webcam, mengambil 15 gambar,
-    dan menyimpannya ke folder dataset baru.
+    Fungsi utama untuk membuka webcam, mengambil 15 gambar yang lolos tahap
+    kualitas, dan menyimpannya (beserta embedding-nya) ke folder dataset baru.
     """
+    print("⏳ Memuat model DeepFace...")
+    preload_models()
+    quality = CaptureQuality()
+
     # Inisialisasi webcam
     cap = cv2.VideoCapture(0)
     if not cap.isOpened():
         print("❌ Error: Tidak bisa membuka kamera.")
         return
 
+    # Disimpan sebagai bytes JPEG: embedding dihitung dari gambar yang sama
+    # persis dengan file yang nanti dibaca train_model
     captured_images = []
+    rejected = {}
+    last_reason = ""
     print("✅ Kamera siap.")
-    print(f"Tekan 'SPASI' untuk mengambil gambar. Butuh {NUM_IMAGES_TO_COLLECT} gambar.")
-    print("Tekan 'Q' untuk keluar jika belum selesai.")
+    print(f"Tekan 'SPASI' untuk mengambil gambar. Butuh {NUM_IMAGES_TO_COLLECT} gambar yang lolos pemeriksaan.")
+    print("Ubah sedikit posisi/ekspresi di setiap gambar. Tekan 'Q' untuk keluar jika belum selesai.")
 
     while len(captured_images) < NUM_IMAGES_TO_COLLECT:
         ret, frame = cap.read()
@@ -35,11 +176,13 @@ def collect_new_person():
         # Tampilkan frame webcam ke pengguna
         # Buat salinan frame agar teks tidak ikut tersimpan
         display_frame = frame.copy()
-        
+
         # Tambahkan teks informasi ke frame yang ditampilkan
         counter_text = f"Terkumpul: {len(captured_images)}/{NUM_IMAGES_TO_COLLECT}"
         cv2.putText(display_frame, counter_text, (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 0), 2)
         cv2.putText(display_frame, "Tekan 'SPASI' untuk capture", (10, 60), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 255), 2)
+        if last_reason:
+            cv2.putText(display_frame, f"Ditolak: {last_reason}", (10, 90), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 0, 255), 2)
 
         cv2.imshow("Dataset Collector", display_frame)
 
@@ -47,22 +190,31 @@ def collect_new_person():
         key = cv2.waitKey(1) & 0xFF
 
         if key == ord(' '):
-            # Simpan frame asli (tanpa teks)
-            captured_images.append(frame)
-            print(f"✅ Gambar ke-{len(captured_images)} berhasil diambil!")
-        
+            image_bytes = encode_jpeg(frame)
+            reason, embedding = quality.evaluate(cv2.imdecode(np.frombuffer(image_bytes, np.uint8), cv2.IMREAD_COLOR))
+            if reason == CaptureQuality.OK:
+                captured_images.append((image_bytes, embedding))
+                last_reason = ""
+                print(f"✅ Gambar ke-{len(captured_images)} berhasil diambil!")
+            else:
+                rejected[reason] = rejected.get(reason, 0) + 1
+                last_reason = reason
+                print(f"⚠️  Gambar ditolak ({reason}), coba lagi.")
+
         elif key == ord('q'):
             print("🛑 Proses dihentikan oleh pengguna.")
             break
-    
+
     # Matikan webcam dan tutup jendela
     cap.release()
     cv2.destroyAllWindows()
+    if rejected:
+        print(f"📋 Gambar yang ditolak: {rejected}")
 
     # Lanjutkan ke proses penyimpanan jika gambar sudah terkumpul 15
     if len(captured_images) == NUM_IMAGES_TO_COLLECT:
         print(f"\n✅ Pengambilan {NUM_IMAGES_TO_COLLECT} gambar selesai.")
-        
+
         # Minta nama untuk folder dataset
         person_name = input("➡️  Masukkan nama untuk folder dataset (contoh: Budi_Santoso): ").strip()
 
@@ -73,21 +225,51 @@ def collect_new_person():
         # Ganti spasi dengan underscore untuk nama folder yang aman
         safe_folder_name = person_name.replace(" ", "_")
         target_dir = DATASET_DIR / safe_folder_name
-        
-        # Buat folder baru
-        os.makedirs(target_dir, exist_ok=True)
-        
+
         print(f"\n💾 Menyimpan gambar ke folder '{target_dir}'...")
-        for i, img in enumerate(captured_images):
-            # Simpan setiap gambar dengan nama file yang unik
-            filename = target_dir / f"{safe_folder_name}_{i+1}.jpg"
-            cv2.imwrite(str(filename), img)
-        
-        print(f"\n🎉 Berhasil! {NUM_IMAGES_TO_COLLECT} gambar untuk '{person_name}' telah disimpan.")
+        save_with_embeddings(target_dir, safe_folder_name, captured_images)
+
+        print(f"\n🎉 Berhasil! {NUM_IMAGES_TO_COLLECT} gambar untuk '{person_name}' telah disimpan (embedding sudah di cache).")
         print("\nlangkah selanjutnya: Jalankan 'python -m backend.train_model' untuk melatih data baru ini.")
-    
+
     else:
         print("\n❌ Pengambilan gambar tidak selesai. Tidak ada gambar yang disimpan.")
 
+
+def prune_dataset(person_names=None):
+    """
+    Menjalankan tahap kualitas yang sama pada dataset yang sudah ada. Gambar
+    yang ditolak dipindah ke <folder orang>/_rejected (bukan dihapus), gambar
+    yang lolos ditulis embedding-nya ke cache training.
+    """
+    print("⏳ Memuat model DeepFace...")
+    preload_models()
+    person_dirs = [d for d in sorted(DATASET_DIR.iterdir()) if d.is_dir() and (not person_names or d.name in person_names)]
+    cache = EmbeddingCache(EMBEDDING_CACHE_PATH, MODEL_NAME)
+    try:
+        for person_dir in person_dirs:
+            quality = CaptureQuality()
+            kept, moved, entries = 0, {}, []
+            for img_path in sorted(person_dir.glob("*.jpg")):
+                frame = cv2.imread(str(img_path), cv2.IMREAD_COLOR)
+                reason, embedding = quality.evaluate(frame) if frame is not None else ("decode_error", None)
+                if reason == CaptureQuality.OK:
+                    kept += 1
+                    entries.append((file_hash(img_path), img_path, embedding))
+                    continue
+                moved[reason] = moved.get(reason, 0) + 1
+                (person_dir / REJECTED_DIR_NAME).mkdir(exist_ok=True)
+                img_path.rename(person_dir / REJECTED_DIR_NAME / img_path.name)
+            cache.put_many(entries)
+            print(f"   👤 {person_dir.name}: {kept} gambar dipertahankan, disisihkan: {moved or '-'}")
+    finally:
+        cache.close()
+    print("\nlangkah selanjutnya: Jalankan 'python -m backend.train_model' untuk melatih ulang dataset.")
+
+
 if __name__ == "__main__":
-    collect_new_person()
\ No newline at end of file
+    # 'python -m backend.dataset_collector --prune [nama ...]' untuk menyaring dataset yang sudah ada
+    if "--prune" in sys.argv[1:]:
+        prune_dataset([a for a in sys.argv[1:] if a != "--prune"])
+    else:
+        collect_new_person()
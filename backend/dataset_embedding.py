@@ -0,0 +1,117 @@
+import os
+import time
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+
+import cv2
+import numpy as np
+
+from backend.utils import extract_face_features_batch, preload_models
+
+# Status per gambar hasil ekstraksi
+OK, NO_FACE, DECODE_ERROR, FAILED = "ok", "no_face", "decode_error", "failed"
+
+
+def _decode_batch(batch):
+    """Membaca dan men-decode satu batch gambar: list (hash, path, frame atau None)."""
+    return [(h, path, cv2.imread(str(path), cv2.IMREAD_COLOR)) for h, path in batch]
+
+
+def _embed_decoded(decoded):
+    """Embedding satu batch yang sudah di-decode: list (hash, path, embedding, status, error)."""
+    results = []
+    valid = [(h, path, frame) for h, path, frame in decoded if frame is not None]
+    results.extend((h, path, None, DECODE_ERROR, "gambar tidak bisa dibaca") for h, path, frame in decoded if frame is None)
+    if not valid:
+        return results
+    try:
+        # Dataset training selalu memakai RetinaFace penuh: akurasi index lebih penting dari
+        # kecepatan, dan embedding di cache tidak bergantung pada mode kaskade server.
+        features = extract_face_features_batch([frame for _, _, frame in valid], cascade="off", return_errors=True)
+    except Exception as e:
+        return results + [(h, path, None, FAILED, str(e)) for h, path, _ in valid]
+    for (h, path, _), emb_list in zip(valid, features):
+        # Error per gambar (mis. kehabisan memori) bukan berarti tanpa wajah:
+        # FAILED tidak disimpan ke cache sehingga dicoba lagi di training berikutnya
+        if isinstance(emb_list, Exception):
+            results.append((h, path, None, FAILED, str(emb_list)))
+        elif emb_list:
+            results.append((h, path, np.asarray(emb_list[0], dtype=np.float32), OK, None))
+        else:
+            results.append((h, path, None, NO_FACE, None))
+    return results
+
+
+def embed_chunk(chunk, batch_size):
+    """
+    Memproses satu potongan dataset di dalam worker. Decode batch berikutnya
+    berjalan di thread terpisah selagi batch saat ini masuk ke DeepFace,
+    sehingga I/O dan decode JPEG tidak menahan inferensi.
+    """
+    batches = [chunk[i:i + batch_size] for i in range(0, len(chunk), batch_size)]
+    results = []
+    with ThreadPoolExecutor(max_workers=1, thread_name_prefix="decode") as decoder:
+        pending = decoder.submit(_decode_batch, batches[0]) if batches else None
+        for i in range(len(batches)):
+            decoded = pending.result()
+            if i + 1 < len(batches):
+                pending = decoder.submit(_decode_batch, batches[i + 1])
+            results.extend(_embed_decoded(decoded))
+    return results
+
+
+def _init_worker(intra_op_threads):
+    # Batasi thread TensorFlow per worker agar total thread = jumlah core,
+    # lalu muat model sekali per proses sebelum menerima pekerjaan.
+    import tensorflow as tf
+    tf.config.threading.set_intra_op_parallelism_threads(intra_op_threads)
+    tf.config.threading.set_inter_op_parallelism_threads(1)
+    preload_models()
+
+
+def embed_images(items, workers=None, batch_size=8):
+    """
+    Mengekstrak embedding untuk list (hash, path) secara paralel.
+
+    Args:
+        items: list tuple (hash, path) yang akan diekstrak.
+        workers: jumlah proses; default jumlah core. 1 berarti tanpa pool.
+        batch_size: jumlah gambar per forward pass ArcFace.
+
+    Returns:
+        list: tuple (hash, path, embedding atau None, status, pesan error).
+    """
+    items = list(items)
+    if not items:
+        return []
+    workers = max(1, min(workers or os.cpu_count() or 1, len(items)))
+    # Potongan kecil agar progres sering terlihat dan beban antar worker merata
+    chunk_size = batch_size * 4
+    chunks = [items[i:i + chunk_size] for i in range(0, len(items), chunk_size)]
+
+    results, started = [], time.perf_counter()
+
+    def report():
+        elapsed = time.perf_counter() - started
+        rate = len(results) / elapsed if elapsed > 0 else 0
+        print(f"   ⏳ {len(results)}/{len(items)} gambar ({rate:.1f} gambar/detik)")
+
+    if workers == 1:
+        preload_models()
+        for chunk in chunks:
+            results.extend(embed_chunk(chunk, batch_size)); report()
+        return results
+
+    # 'spawn' karena fork setelah TensorFlow dimuat bisa membuat worker macet
+    intra_op_threads = max(1, (os.cpu_count() or 1) // workers)
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"),
+                             initializer=_init_worker, initargs=(intra_op_threads,)) as pool:
+        futures = {pool.submit(embed_chunk, chunk, batch_size): chunk for chunk in chunks}
+        for future in as_completed(futures):
+            try:
+                results.extend(future.result())
+            except Exception as e:
+                # Worker mati (mis. kehabisan memori): tandai seluruh potongan sebagai gagal
+                results.extend((h, path, None, FAILED, str(e)) for h, path in futures[future])
+            report()
+    return results
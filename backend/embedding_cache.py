@@ -0,0 +1,79 @@
+import sqlite3
+import hashlib
+from pathlib import Path
+
+import numpy as np
+
+
+def file_hash(path) -> str:
+    """Hash SHA-256 dari isi file; nama file tidak ikut dihitung."""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class EmbeddingCache:
+    """
+    Cache embedding per gambar di SQLite, dengan kunci (hash isi file, nama model).
+
+    Gambar yang tidak mengandung wajah juga dicatat (embedding NULL) agar tidak
+    diekstrak ulang setiap training. Mengganti MODEL_NAME otomatis membuat
+    semua entri lama tidak terpakai karena kuncinya berbeda.
+    """
+
+    def __init__(self, db_path: Path, model_name: str):
+        self.model_name = model_name
+        self.conn = sqlite3.connect(str(db_path))
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "file_hash TEXT NOT NULL, model_name TEXT NOT NULL, path TEXT, "
+            "dim INTEGER, embedding BLOB, PRIMARY KEY (file_hash, model_name))"
+        )
+        self.conn.commit()
+
+    def get_many(self, hashes) -> dict:
+        """
+        Mengambil embedding untuk hash yang sudah ada di cache.
+
+        Returns:
+            dict: hash -> np.ndarray float32, atau None jika gambar tanpa wajah.
+                  Hash yang belum pernah diekstrak tidak ada di dict.
+        """
+        found = {}
+        hashes = list(hashes)
+        # Batas jumlah parameter SQLite, jadi query dipecah per 500 hash
+        for i in range(0, len(hashes), 500):
+            chunk = hashes[i:i + 500]
+            rows = self.conn.execute(
+                f"SELECT file_hash, embedding FROM embeddings WHERE model_name = ? AND file_hash IN ({','.join('?' * len(chunk))})",
+                [self.model_name, *chunk])
+            for h, blob in rows:
+                found[h] = np.frombuffer(blob, dtype=np.float32) if blob is not None else None
+        return found
+
+    def put_many(self, entries):
+        """Menyimpan list (hash, path, embedding atau None) dalam satu transaksi."""
+        rows = []
+        for h, path, embedding in entries:
+            if embedding is None:
+                rows.append((h, self.model_name, str(path), None, None))
+            else:
+                vector = np.asarray(embedding, dtype=np.float32).ravel()
+                rows.append((h, self.model_name, str(path), len(vector), vector.tobytes()))
+        with self.conn:
+            self.conn.executemany("INSERT OR REPLACE INTO embeddings (file_hash, model_name, path, dim, embedding) VALUES (?, ?, ?, ?, ?)", rows)
+
+    def prune(self, keep_hashes) -> int:
+        """Menghapus entri model ini yang gambarnya sudah tidak ada di dataset."""
+        keep_hashes = set(keep_hashes)
+        stale = [h for (h,) in self.conn.execute("SELECT file_hash FROM embeddings WHERE model_name = ?", (self.model_name,))
+                 if h not in keep_hashes]
+        with self.conn:
+            self.conn.executemany("DELETE FROM embeddings WHERE file_hash = ? AND model_name = ?",
+                                  [(h, self.model_name) for h in stale])
+        return len(stale)
+
+    def close(self):
+        self.conn.close()
@@ -0,0 +1,214 @@
+import os
+import queue
+import shutil
+import datetime
+import threading
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+from backend.utils import detect_face, crop_face_roi
+
+THUMBS_DIR = "thumbs"
+
+
+def evidence_relpath(person_name: str, absent_date: str, absent_ts: int) -> str:
+    """Lokasi bukti absensi relatif terhadap folder gambar: <tanggal>/<nama>_<epoch>.jpg."""
+    return f"{absent_date}/{person_name}_{absent_ts}.jpg"
+
+
+def thumbnail_url(image_url):
+    """URL thumbnail untuk image_url bukti; file lama (tanpa folder tanggal) tidak punya thumbnail."""
+    if not image_url:
+        return image_url
+    head, _, filename = image_url.rpartition("/")
+    try:
+        datetime.date.fromisoformat(head.rsplit("/", 1)[-1])
+    except ValueError:
+        return image_url
+    return f"{head}/{THUMBS_DIR}/{filename}"
+
+
+def _resize_max(image: np.ndarray, max_side: int) -> np.ndarray:
+    scale = min(1.0, max_side / max(image.shape[:2]))
+    return cv2.resize(image, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA) if scale < 1.0 else image
+
+
+def _write_jpeg(path: Path, image: np.ndarray, quality: int):
+    # Ditulis lewat file .tmp agar /images tidak pernah menyajikan file setengah jadi
+    ok, data = cv2.imencode(".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    if not ok:
+        raise ValueError("Gagal meng-encode JPEG")
+    tmp_path = path.with_suffix(".tmp")
+    try:
+        tmp_path.write_bytes(data.tobytes())
+        os.replace(tmp_path, path)
+    finally:
+        tmp_path.unlink(missing_ok=True)
+
+
+class EvidenceWriter:
+    """
+    Penulis bukti absensi di background dengan antrean terbatas.
+
+    Jalur request hanya menaruh bytes frame ke antrean (tanpa decode, tanpa
+    I/O). Thread penulis men-decode frame, memotong wajah (Haar, margin
+    `margin`), lalu menyimpan potongan wajah (maks `max_side` px) dan
+    thumbnail (`thumb_side` px) di folder per tanggal. Jika antrean penuh,
+    bukti untuk absensi itu dilewati; absensinya sendiri tetap tercatat.
+    """
+
+    _STOP = object()
+
+    def __init__(self, root: Path, max_queue: int = 64, max_side: int = 320, thumb_side: int = 96, margin: float = 0.3):
+        self.root = Path(root)
+        self.max_side = max_side
+        self.thumb_side = thumb_side
+        self.margin = margin
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._thread = threading.Thread(target=self._run, name="evidence-writer", daemon=True)
+        self._thread.start()
+
+    @property
+    def depth(self) -> int:
+        return self._queue.qsize()
+
+    def submit(self, frame_bytes: bytes, relpath: str, box=None) -> bool:
+        """
+        Menjadwalkan penulisan; False jika antrean penuh (tidak pernah menunggu).
+        `box` (x, y, w, h) memilih wajah yang dipotong, mis. pada frame grup.
+        """
+        try:
+            self._queue.put_nowait((frame_bytes, relpath, box))
+            return True
+        except queue.Full:
+            self.dropped += 1
+            return False
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is self._STOP:
+                break
+            try:
+                self._write(*item)
+                self.written += 1
+            except Exception as e:
+                self.failed += 1
+                print(f"⚠️ Gagal menyimpan bukti {item[1]}: {e}")
+
+    def _write(self, frame_bytes: bytes, relpath: str, box=None):
+        frame = cv2.imdecode(np.frombuffer(frame_bytes, np.uint8), cv2.IMREAD_COLOR)
+        if frame is None:
+            raise ValueError("frame tidak bisa di-decode")
+        boxes = [box] if box else detect_face(frame)
+        # Payload dari klien yang sudah memotong wajah biasanya tetap terdeteksi;
+        # jika tidak ada wajah, seluruh frame (diperkecil) yang disimpan
+        face = crop_face_roi(frame, boxes[0], self.margin) if boxes else frame
+        path = self.root / relpath
+        path.parent.mkdir(parents=True, exist_ok=True)
+        (path.parent / THUMBS_DIR).mkdir(exist_ok=True)
+        _write_jpeg(path, _resize_max(face, self.max_side), 85)
+        _write_jpeg(path.parent / THUMBS_DIR / path.name, _resize_max(face, self.thumb_side), 75)
+
+    def close(self, timeout: float = 10):
+        """Menunggu antrean habis ditulis lalu menghentikan thread."""
+        self._queue.put(self._STOP)
+        self._thread.join(timeout=timeout)
+
+
+def _dir_size(path: Path) -> int:
+    return sum(f.stat().st_size for f in path.rglob("*") if f.is_file())
+
+
+def sweep_evidence(root: Path, today: datetime.date, retention_days: int = 90,
+                   compact_after_days: int = 14, max_bytes: int = 0) -> dict:
+    """
+    Retensi & kompaksi folder bukti:
+
+    - folder tanggal lebih tua dari `compact_after_days`: potongan wajah dihapus,
+      thumbnail dipertahankan (dashboard hanya memakai thumbnail);
+    - folder tanggal lebih tua dari `retention_days`: dihapus;
+    - jika total ukuran masih di atas `max_bytes` (0 = tanpa batas), folder
+      tanggal terlama dihapus sampai di bawah batas (hari ini tidak pernah).
+
+    Returns:
+        dict: jumlah folder/file yang dihapus, ukuran akhir (byte), dan tanggal
+              yang foldernya dihapus karena batas ukuran (`removed_dates`).
+    """
+    root = Path(root)
+    stats = {"compacted_days": 0, "removed_days": 0, "removed_files": 0, "bytes": 0, "removed_dates": []}
+    if not root.is_dir():
+        return stats
+    day_dirs = []
+    for entry in root.iterdir():
+        if entry.is_dir():
+            try:
+                day_dirs.append((datetime.date.fromisoformat(entry.name), entry))
+            except ValueError:
+                continue
+        elif entry.name.startswith("temp_") and entry.suffix == ".mp3":
+            # Sisa MP3 sementara dari versi lama. File gambar datar format lama
+            # tidak disentuh: jumlahnya tidak bertambah lagi dan masih dirujuk database.
+            entry.unlink(missing_ok=True)
+            stats["removed_files"] += 1
+    day_dirs.sort()
+
+    kept = []
+    for day, path in day_dirs:
+        age = (today - day).days
+        if age > retention_days:
+            shutil.rmtree(path, ignore_errors=True)
+            stats["removed_days"] += 1
+            continue
+        if age > compact_after_days:
+            crops = list(path.glob("*.jpg"))
+            for f in crops:
+                f.unlink(missing_ok=True)
+            if crops:
+                stats["compacted_days"] += 1
+        kept.append((day, path))
+
+    total = _dir_size(root)
+    if max_bytes > 0:
+        for day, path in kept:
+            if total <= max_bytes or day >= today:
+                break
+            total -= _dir_size(path)
+            shutil.rmtree(path, ignore_errors=True)
+            stats["removed_days"] += 1
+            stats["removed_dates"].append(day.isoformat())
+    stats["bytes"] = total
+    return stats
+
+
+# image_url bukti berformat "/images/<YYYY-MM-DD>/<nama>_<epoch>.jpg"; 19 karakter
+# pertama adalah "/images/<tanggal>/", jadi thumbnail disisipkan setelahnya.
+_DAY_URL = "'/images/____-__-__/%'"
+
+
+def evidence_url_updates(today: datetime.date, retention_days: int, compact_after_days: int,
+                         removed_dates=()) -> list:
+    """
+    Statement (sql, params) yang menyelaraskan attendance_logs.image_url dengan
+    hasil sweep_evidence: hari yang sudah dikompaksi menunjuk ke thumbnail-nya,
+    hari yang foldernya sudah dihapus tidak punya gambar lagi (NULL).
+    Berbasis tanggal batas, jadi aman dijalankan ulang setiap sweep.
+    """
+    compact_cutoff = (today - datetime.timedelta(days=compact_after_days)).isoformat()
+    retention_cutoff = (today - datetime.timedelta(days=retention_days)).isoformat()
+    statements = [
+        (f"UPDATE attendance_logs SET image_url = NULL WHERE absent_date < ? AND image_url LIKE {_DAY_URL}",
+         (retention_cutoff,)),
+        (f"UPDATE attendance_logs SET image_url = substr(image_url, 1, 19) || '{THUMBS_DIR}/' || substr(image_url, 20) "
+         f"WHERE absent_date < ? AND image_url LIKE {_DAY_URL} AND image_url NOT LIKE '/images/____-__-__/{THUMBS_DIR}/%'",
+         (compact_cutoff,)),
+    ]
+    for day in removed_dates:
+        statements.append((f"UPDATE attendance_logs SET image_url = NULL WHERE absent_date = ? AND image_url LIKE {_DAY_URL}",
+                           (day,)))
+    return statements
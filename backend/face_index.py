@@ -0,0 +1,276 @@
+import json
+from pathlib import Path
+
+import numpy as np
+
+# Versi format file index, dinaikkan jika struktur file berubah
+INDEX_FORMAT_VERSION = 1
+# Tipe penyimpanan matriks: float32 (default), float16 (setengah ukuran) atau
+# int8 (seperempat ukuran, satu faktor skala float32 per baris di scales.npy).
+# Konversi float16 -> float32 di numpy lambat, jadi int8 lebih cepat dicari.
+INDEX_DTYPES = ("float32", "float16", "int8")
+# Jumlah baris yang di-dequantize sekaligus saat pencarian; memori sementara per
+# query tetap kecil berapa pun jumlah baris index
+SEARCH_CHUNK_ROWS = 1024
+
+
+def l2_normalize(vectors) -> np.ndarray:
+    """Mengubah vektor menjadi float32 ber-norma 1 (baris per baris)."""
+    vectors = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return np.ascontiguousarray(vectors / norms)
+
+
+def quantize(matrix: np.ndarray, dtype: str = "float32"):
+    """
+    Mengubah matriks float32 ter-normalisasi ke tipe penyimpanan `dtype`.
+
+    Returns:
+        tuple: (matriks tersimpan, skala per baris atau None). Untuk int8
+               dipakai kuantisasi simetris per baris: x ~= q * scale.
+    """
+    if dtype not in INDEX_DTYPES:
+        raise ValueError(f"Tipe index tidak dikenal: {dtype}")
+    matrix = np.asarray(matrix, dtype=np.float32)
+    if dtype != "int8":
+        return np.ascontiguousarray(matrix.astype(dtype)), None
+    scales = np.abs(matrix).max(axis=1) / 127.0
+    scales[scales == 0] = 1.0
+    q = np.clip(np.rint(matrix / scales[:, None]), -127, 127).astype(np.int8)
+    return np.ascontiguousarray(q), scales.astype(np.float32)
+
+
+def dequantize(matrix: np.ndarray, scales=None) -> np.ndarray:
+    """Kebalikan quantize(): baris float32 (untuk satu potongan atau seluruh matriks)."""
+    block = np.asarray(matrix, dtype=np.float32)
+    return block * scales[:, None] if scales is not None else block
+
+
+class ExactBackend:
+    """
+    Pencarian brute-force: perkalian matriks untuk semua query. Matriks
+    float32 dipakai langsung; matriks float16/int8 di-dequantize per potongan
+    SEARCH_CHUNK_ROWS baris, jadi tidak pernah ada salinan float32 penuh.
+    """
+
+    name = "exact"
+
+    def __init__(self, matrix: np.ndarray, scales=None):
+        self.matrix = matrix
+        self.scales = scales
+
+    def similarities(self, queries: np.ndarray) -> np.ndarray:
+        if self.matrix.dtype == np.float32 and self.scales is None:
+            return queries @ self.matrix.T
+        sims = np.empty((len(queries), len(self.matrix)), dtype=np.float32)
+        for start in range(0, len(self.matrix), SEARCH_CHUNK_ROWS):
+            end = start + SEARCH_CHUNK_ROWS
+            # Skala int8 dikalikan ke hasil (query x baris), bukan ke seluruh potongan matriks
+            sims[:, start:end] = queries @ np.asarray(self.matrix[start:end], dtype=np.float32).T
+            if self.scales is not None:
+                sims[:, start:end] *= self.scales[start:end]
+        return sims
+
+    def search(self, queries: np.ndarray, k: int = 1):
+        """Mengembalikan (similarity, index) k tetangga terdekat per query."""
+        sims = self.similarities(queries)
+        k = min(k, sims.shape[1])
+        if k == 1:
+            idx = np.argmax(sims, axis=1)[:, None]
+        else:
+            idx = np.argpartition(-sims, k - 1, axis=1)[:, :k]
+            order = np.argsort(-np.take_along_axis(sims, idx, axis=1), axis=1)
+            idx = np.take_along_axis(idx, order, axis=1)
+        return np.take_along_axis(sims, idx, axis=1), idx
+
+
+class HnswBackend:
+    """
+    Backend aproksimasi (HNSW) untuk roster besar. Membutuhkan paket opsional
+    `hnswlib`; graf dibangun saat index dimuat.
+    """
+
+    name = "hnsw"
+
+    def __init__(self, matrix: np.ndarray, scales=None, ef: int = 64, m: int = 16):
+        try:
+            import hnswlib
+        except ImportError as e:
+            raise ImportError("Backend 'hnsw' membutuhkan paket hnswlib (pip install hnswlib).") from e
+        # Graf HNSW menyimpan salinan float32 sendiri, jadi matriksnya di-dequantize sekali
+        matrix = dequantize(matrix, scales)
+        self.matrix = matrix
+        self._graph = hnswlib.Index(space="ip", dim=matrix.shape[1])
+        self._graph.init_index(max_elements=max(len(matrix), 1), ef_construction=max(ef, 100), M=m)
+        self._graph.add_items(matrix, np.arange(len(matrix)))
+        self._graph.set_ef(ef)
+
+    def similarities(self, queries: np.ndarray) -> np.ndarray:
+        return queries @ self.matrix.T
+
+    def search(self, queries: np.ndarray, k: int = 1):
+        k = min(k, len(self.matrix))
+        idx, dist = self._graph.knn_query(queries, k=k)
+        # Ruang "ip" di hnswlib mengembalikan 1 - inner product
+        return 1.0 - dist, idx.astype(np.int64)
+
+
+BACKENDS = {ExactBackend.name: ExactBackend, HnswBackend.name: HnswBackend}
+
+
+class EmbeddingIndex:
+    """
+    Index embedding wajah berbasis matriks float32 ter-normalisasi L2.
+
+    Baris matriks diurutkan per identitas sehingga `offsets[i]` menunjuk baris
+    pertama milik `names[i]`. Jarak yang dilaporkan adalah jarak cosine
+    (1 - cosine similarity), sama dengan metrik KNN lama, sehingga
+    DISTANCE_THRESHOLD tidak perlu diubah.
+
+    mode="samples"  : satu baris per foto dataset.
+    mode="centroid" : satu baris per orang (rata-rata embedding, dinormalisasi ulang).
+
+    Matriks bisa disimpan sebagai float32, float16 atau int8 (lihat quantize());
+    `scales` hanya ada untuk int8.
+    """
+
+    def __init__(self, matrix, labels, names, mode="samples", backend="exact", model_name=None, scales=None):
+        if backend not in BACKENDS:
+            raise ValueError(f"Backend index tidak dikenal: {backend}")
+        self.matrix = matrix
+        self.scales = scales
+        self.labels = labels
+        self.names = list(names)
+        self.mode = mode
+        self.model_name = model_name
+        self.offsets = np.searchsorted(labels, np.arange(len(self.names)))
+        self.backend = BACKENDS[backend](matrix, scales)
+
+    def __len__(self):
+        return len(self.matrix)
+
+    @property
+    def dim(self) -> int:
+        return self.matrix.shape[1]
+
+    @property
+    def dtype(self) -> str:
+        return str(self.matrix.dtype)
+
+    @property
+    def nbytes(self) -> int:
+        """Ukuran matriks (dan skala) di disk/page cache."""
+        return self.matrix.nbytes + (self.scales.nbytes if self.scales is not None else 0)
+
+    def vectors(self) -> np.ndarray:
+        """Seluruh matriks sebagai float32 (salinan penuh; hanya untuk tooling)."""
+        return dequantize(self.matrix, self.scales)
+
+    def quantized(self, dtype: str, backend="exact"):
+        """Salinan index ini dengan tipe penyimpanan `dtype`."""
+        matrix, scales = quantize(self.vectors(), dtype)
+        return EmbeddingIndex(matrix, self.labels, self.names, mode=self.mode, backend=backend,
+                              model_name=self.model_name, scales=scales)
+
+    @classmethod
+    def build(cls, embeddings, person_names, mode="samples", backend="exact", model_name=None, dtype="float32"):
+        """Membangun index dari list embedding dan list nama (satu nama per embedding)."""
+        if mode not in ("samples", "centroid"):
+            raise ValueError(f"Mode index tidak dikenal: {mode}")
+        names = sorted({str(name) for name in person_names})
+        labels = np.searchsorted(names, np.asarray(person_names)).astype(np.int32)
+        matrix = l2_normalize(embeddings)
+
+        order = np.argsort(labels, kind="stable")
+        matrix, labels = matrix[order], labels[order]
+
+        if mode == "centroid":
+            offsets = np.searchsorted(labels, np.arange(len(names)))
+            matrix = l2_normalize(np.add.reduceat(matrix, offsets, axis=0))
+            labels = np.arange(len(names), dtype=np.int32)
+
+        matrix, scales = quantize(matrix, dtype)
+        return cls(matrix, labels, names, mode=mode, backend=backend, model_name=model_name, scales=scales)
+
+    @classmethod
+    def from_legacy_knn(cls, knn_model, label_encoder, backend="exact", model_name=None):
+        """Konversi satu kali dari KNeighborsClassifier + LabelEncoder (format joblib lama)."""
+        person_names = label_encoder.inverse_transform(knn_model._y)
+        return cls.build(knn_model._fit_X, person_names, backend=backend, model_name=model_name)
+
+    def search(self, queries):
+        """
+        Mencari identitas terdekat untuk setiap query.
+
+        Returns:
+            tuple: (list nama, np.ndarray jarak cosine), satu elemen per query.
+        """
+        queries = l2_normalize(queries)
+        sims, idx = self.backend.search(queries, k=1)
+        best = idx[:, 0]
+        names = [self.names[label] for label in self.labels[best]]
+        return names, 1.0 - sims[:, 0]
+
+    def top_k_per_identity(self, query, k: int = 3):
+        """
+        Mengembalikan k identitas terdekat untuk satu query, masing-masing
+        diwakili oleh foto terdekatnya: list of (nama, jarak cosine).
+        """
+        sims = self.backend.similarities(l2_normalize(query))[0]
+        # Baris sudah terurut per identitas, jadi maksimum per identitas cukup satu reduceat
+        per_identity = np.maximum.reduceat(sims, self.offsets)
+        k = min(k, len(self.names))
+        best = np.argsort(-per_identity)[:k]
+        return [(self.names[i], float(1.0 - per_identity[i])) for i in best]
+
+    def save(self, index_dir: Path):
+        """Menyimpan index sebagai file .npy (bisa di-memory-map) + metadata JSON."""
+        index_dir = Path(index_dir)
+        index_dir.mkdir(parents=True, exist_ok=True)
+        np.save(index_dir / "embeddings.npy", self.matrix)
+        np.save(index_dir / "labels.npy", self.labels)
+        scales_path = index_dir / "scales.npy"
+        if self.scales is not None:
+            np.save(scales_path, self.scales)
+        elif scales_path.exists():
+            scales_path.unlink()
+        meta = {
+            "format_version": INDEX_FORMAT_VERSION,
+            "model_name": self.model_name,
+            "mode": self.mode,
+            "dtype": self.dtype,
+            "dim": self.dim,
+            "count": len(self),
+            "names": self.names,
+            # Baris pertama tiap identitas (baris terurut per nama)
+            "offsets": [int(o) for o in self.offsets],
+        }
+        with open(index_dir / "meta.json", "w") as f:
+            json.dump(meta, f, indent=2)
+
+    @classmethod
+    def load(cls, index_dir: Path, backend="exact", mmap=True):
+        """
+        Memuat index; dengan mmap=True matriks dibaca langsung dari page cache,
+        sehingga beberapa worker uvicorn berbagi satu salinan di memori.
+        """
+        index_dir = Path(index_dir)
+        with open(index_dir / "meta.json", "r") as f:
+            meta = json.load(f)
+        if meta.get("format_version") != INDEX_FORMAT_VERSION:
+            raise ValueError(f"Versi format index tidak didukung: {meta.get('format_version')}")
+        mmap_mode = "r" if mmap else None
+        matrix = np.load(index_dir / "embeddings.npy", mmap_mode=mmap_mode)
+        # Index lama tidak punya field dtype dan selalu float32
+        dtype = meta.get("dtype", "float32")
+        if str(matrix.dtype) != dtype or (meta.get("dim") and matrix.shape[1] != meta["dim"]):
+            raise ValueError(f"embeddings.npy ({matrix.dtype}, dim {matrix.shape[1]}) tidak sesuai meta.json ({dtype}, dim {meta.get('dim')})")
+        scales = np.load(index_dir / "scales.npy", mmap_mode=mmap_mode) if dtype == "int8" else None
+        labels = np.load(index_dir / "labels.npy")
+        return cls(matrix, labels, meta["names"], mode=meta["mode"], backend=backend,
+                   model_name=meta.get("model_name"), scales=scales)
+
+    @staticmethod
+    def exists(index_dir: Path) -> bool:
+        return (Path(index_dir) / "meta.json").exists()
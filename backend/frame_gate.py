@@ -0,0 +1,48 @@
+import cv2
+
+from backend.utils import DETECTOR_CASCADE, fast_detect, laplacian_variance
+
+
+class FrameGate:
+    """
+    Gerbang murah sebelum pipeline RetinaFace + ArcFace untuk mode streaming.
+
+    Frame lolos hanya jika detektor cepat (Haar atau YuNet, mengikuti
+    DETECTOR_CASCADE) menemukan wajah, wajah cukup besar relatif terhadap
+    frame, dan area wajah cukup tajam. Semua pengecekan berjalan pada frame
+    yang diperkecil sehingga biayanya beberapa milidetik.
+    """
+
+    NO_FACE, TOO_SMALL, BLURRY, PASSED = "no_face", "too_small", "blurry", "passed"
+
+    def __init__(self, min_face_ratio: float = 0.15, min_sharpness: float = 60.0, max_side: int = 320,
+                 cascade: str = DETECTOR_CASCADE):
+        self.min_face_ratio = min_face_ratio
+        self.min_sharpness = min_sharpness
+        self.max_side = max_side
+        self.cascade = cascade
+
+    def check(self, frame):
+        """
+        Returns:
+            tuple: (alasan, kotak wajah atau None, skor ketajaman atau None).
+                   alasan == FrameGate.PASSED berarti frame layak dikenali.
+        """
+        if frame is None:
+            return self.NO_FACE, None, None
+        boxes = fast_detect(frame, self.cascade, max_side=self.max_side)
+        if not boxes:
+            return self.NO_FACE, None, None
+
+        x, y, w, h = boxes[0]
+        height, width = frame.shape[:2]
+        if w / width < self.min_face_ratio:
+            return self.TOO_SMALL, boxes[0], None
+
+        # Ketajaman diukur di area wajah saja dan pada ukuran tetap,
+        # agar skornya tidak bergantung pada resolusi kamera.
+        face = cv2.resize(frame[max(y, 0):y + h, max(x, 0):x + w], (112, 112), interpolation=cv2.INTER_AREA)
+        sharpness = laplacian_variance(face)
+        if sharpness < self.min_sharpness:
+            return self.BLURRY, boxes[0], sharpness
+        return self.PASSED, boxes[0], sharpness
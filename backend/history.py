@@ -0,0 +1,115 @@
+import io
+import csv
+import json
+import base64
+import datetime
+
+# Kolom yang dikembalikan oleh endpoint riwayat dan export
+HISTORY_COLUMNS = ("id", "intern_id", "intern_name", "universitas", "kategori", "image_url",
+                   "absent_at", "absent_date", "absent_ts")
+# Filter kesamaan yang didukung: nama parameter -> kolom
+EQUALITY_FILTERS = {"intern": "intern_name", "universitas": "universitas", "kategori": "kategori"}
+EXPORT_FORMATS = {"csv": "text/csv; charset=utf-8", "jsonl": "application/x-ndjson"}
+
+
+def encode_cursor(absent_ts: int, row_id: int) -> str:
+    """Cursor keyset (absent_ts, id) baris terakhir, dalam bentuk token URL-safe."""
+    return base64.urlsafe_b64encode(f"{absent_ts}:{row_id}".encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple:
+    """Kebalikan encode_cursor(); ValueError jika token tidak valid."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        absent_ts, row_id = raw.split(":")
+        return int(absent_ts), int(row_id)
+    except Exception as e:
+        raise ValueError("cursor tidak valid") from e
+
+
+def date_bounds(start_date, end_date, timezone) -> tuple:
+    """
+    Rentang tanggal lokal (inklusif, 'YYYY-MM-DD' atau None) menjadi rentang
+    epoch [awal, akhir) agar query berjalan di index absent_ts tanpa sort.
+    """
+    def midnight(day):
+        return int(timezone.localize(datetime.datetime.combine(day, datetime.time())).timestamp())
+
+    start = datetime.date.fromisoformat(start_date) if start_date else None
+    end = datetime.date.fromisoformat(end_date) if end_date else None
+    if start and end and end < start:
+        raise ValueError("end_date lebih awal dari start_date")
+    return (midnight(start) if start else None,
+            midnight(end + datetime.timedelta(days=1)) if end else None)
+
+
+def history_query(filters: dict, timezone, cursor=None, limit=None, descending=True) -> tuple:
+    """
+    Membangun query riwayat keyset-paginated.
+
+    Urutan (absent_ts, id) mengikuti index idx_attendance_ts (rowid ikut di
+    dalam entri index), jadi SQLite cukup berjalan di index tanpa OFFSET dan
+    tanpa sort sementara, berapa pun jauhnya halaman atau lebarnya rentang.
+
+    Returns:
+        tuple: (sql, params)
+    """
+    clauses, params = [], []
+    start_ts, end_ts = date_bounds(filters.get("start_date"), filters.get("end_date"), timezone)
+    if start_ts is not None:
+        clauses.append("absent_ts >= ?"); params.append(start_ts)
+    if end_ts is not None:
+        clauses.append("absent_ts < ?"); params.append(end_ts)
+    for name, column in EQUALITY_FILTERS.items():
+        if filters.get(name):
+            clauses.append(f"{column} = ?"); params.append(filters[name])
+    if cursor:
+        absent_ts, row_id = decode_cursor(cursor)
+        clauses.append("(absent_ts, id) < (?, ?)" if descending else "(absent_ts, id) > (?, ?)")
+        params.extend((absent_ts, row_id))
+
+    direction = "DESC" if descending else "ASC"
+    sql = f"SELECT {', '.join(HISTORY_COLUMNS)} FROM attendance_logs"
+    if clauses:
+        sql += " WHERE " + " AND ".join(clauses)
+    sql += f" ORDER BY absent_ts {direction}, id {direction}"
+    if limit:
+        sql += " LIMIT ?"; params.append(limit)
+    return sql, params
+
+
+def fetch_history_page(conn, filters: dict, timezone, cursor=None, limit: int = 50) -> dict:
+    """Satu halaman riwayat (terbaru lebih dulu) beserta cursor halaman berikutnya."""
+    # Satu baris ekstra untuk mengetahui apakah masih ada halaman berikutnya
+    sql, params = history_query(filters, timezone, cursor=cursor, limit=limit + 1)
+    rows = [dict(row) for row in conn.execute(sql, params).fetchmany(limit + 1)]
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    next_cursor = encode_cursor(rows[-1]["absent_ts"], rows[-1]["id"]) if has_more else None
+    return {"items": rows, "next_cursor": next_cursor, "limit": limit}
+
+
+def stream_history(conn, filters: dict, timezone, fmt: str = "csv", batch_size: int = 500):
+    """
+    Generator export riwayat (kronologis) dalam CSV atau JSONL. Baris dibaca
+    per `batch_size` lewat fetchmany dari cursor yang sama, jadi memori tetap
+    konstan dan byte pertama (header CSV) terkirim sebelum query selesai.
+    Koneksi tidak ditutup di sini; pemanggil yang memilikinya.
+    """
+    sql, params = history_query(filters, timezone, descending=False)
+    if fmt == "csv":
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(HISTORY_COLUMNS)
+        yield buffer.getvalue()
+    cursor = conn.execute(sql, params)
+    while True:
+        rows = cursor.fetchmany(batch_size)
+        if not rows:
+            break
+        if fmt == "csv":
+            buffer.seek(0); buffer.truncate()
+            writer.writerows(tuple(row) for row in rows)
+            yield buffer.getvalue()
+        else:
+            yield "".join(json.dumps(dict(row), ensure_ascii=False) + "\n" for row in rows)
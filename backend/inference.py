@@ -0,0 +1,156 @@
+import time
+import asyncio
+import multiprocessing
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+import cv2
+import numpy as np
+
+from backend.utils import extract_face_features_batch, extract_all_face_features, warmup_models
+
+
+class InferenceBusyError(Exception):
+    """Dilempar ketika antrean inferensi penuh sehingga request harus ditolak (backpressure)."""
+
+    def __init__(self, retry_after: int):
+        super().__init__(f"Server sedang sibuk, coba lagi dalam {retry_after} detik.")
+        self.retry_after = retry_after
+
+
+@contextmanager
+def stage_timer(timings: dict, stage: str):
+    """Mencatat durasi (ms) sebuah tahap pipeline ke dalam dict `timings`."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[stage] = round((time.perf_counter() - start) * 1000, 2)
+
+
+def format_server_timing(timings: dict) -> str:
+    """Mengubah dict timing menjadi nilai header `Server-Timing`."""
+    return ", ".join(f"{stage};dur={duration}" for stage, duration in timings.items())
+
+
+def embed_frames(frames_bytes: list, pre_cropped: list = None) -> list:
+    """
+    Tahap berat pipeline /recognize: decode JPEG lalu ekstraksi embedding
+    untuk satu batch frame dengan satu panggilan DeepFace. Fungsi ini berjalan
+    di dalam worker (thread atau proses), jadi hanya menerima bytes dan
+    mengembalikan data yang bisa di-pickle. Timing tahap `detect_fast` (kaskade
+    deteksi) dan `embed` (RetinaFace pada ROI + ArcFace) adalah durasi batch
+    yang dibagi bersama oleh semua frame di dalamnya.
+
+    Frame dengan flag `pre_cropped` sudah dipotong ke wajah oleh klien, jadi
+    detektor cepat dilewati dan RetinaFace langsung berjalan pada payload.
+    """
+    pre_cropped = pre_cropped or [False] * len(frames_bytes)
+    results = []
+    frames = []
+    for frame_bytes in frames_bytes:
+        timings = {}
+        with stage_timer(timings, "decode"):
+            # Body kosong: imdecode akan memicu assertion OpenCV, perlakukan sebagai gagal decode
+            frame = cv2.imdecode(np.frombuffer(frame_bytes, np.uint8), cv2.IMREAD_COLOR) if frame_bytes else None
+        results.append({"embedding": None, "timings": timings, "batch_size": len(frames_bytes)})
+        frames.append(frame)
+
+    # Frame yang gagal di-decode tidak ikut dikirim ke DeepFace
+    valid = [i for i, frame in enumerate(frames) if frame is not None]
+    batch_timings = {}
+    cascades = [("off" if pre_cropped[i] else None) for i in valid]
+    embeddings = extract_face_features_batch([frames[i] for i in valid], cascade=cascades, timings=batch_timings)
+    for i, embedding in zip(valid, embeddings):
+        results[i]["embedding"] = embedding
+        results[i]["timings"].update(batch_timings)
+    return results
+
+
+def embed_group_frame(frame_bytes: bytes, min_face: int = 0, max_faces: int = 0) -> dict:
+    """
+    Tahap berat mode grup: decode satu frame lalu embedding semua wajahnya
+    dengan satu panggilan DeepFace. Seperti embed_frames, berjalan di worker
+    dan hanya mengembalikan data yang bisa di-pickle.
+    """
+    timings = {}
+    with stage_timer(timings, "decode"):
+        frame = cv2.imdecode(np.frombuffer(frame_bytes, np.uint8), cv2.IMREAD_COLOR) if frame_bytes else None
+    faces = [] if frame is None else extract_all_face_features(frame, timings=timings, min_face=min_face, max_faces=max_faces)
+    return {"faces": faces, "timings": timings}
+
+
+# Hasil warm-up di proses ini (setiap proses worker punya salinannya sendiri)
+_warmup_timings = None
+
+
+def warmup_worker() -> dict:
+    """Warm-up model DeepFace sekali per proses dan mengembalikan durasinya."""
+    global _warmup_timings
+    if _warmup_timings is None:
+        _warmup_timings = warmup_models()
+    return _warmup_timings
+
+
+def _init_process_worker():
+    # Setiap proses worker memuat model DeepFace sendiri satu kali saat start,
+    # bukan pada request pertama yang masuk ke proses tersebut.
+    warmup_worker()
+
+
+class InferenceExecutor:
+    """
+    Executor inferensi dengan antrean terbatas.
+
+    mode="thread"  : ThreadPoolExecutor, model dipakai bersama di satu proses.
+    mode="process" : ProcessPoolExecutor, model dimuat ulang di setiap worker.
+
+    Jumlah pekerjaan yang sedang berjalan + menunggu dibatasi oleh
+    `max_workers + max_pending`. Jika penuh, `run()` langsung melempar
+    InferenceBusyError alih-alih menumpuk request di memori.
+    """
+
+    def __init__(self, mode: str = "thread", max_workers: int = 2, max_pending: int = 8, retry_after: int = 2):
+        if mode not in ("thread", "process"):
+            raise ValueError(f"Mode executor tidak dikenal: {mode}")
+        self.mode = mode
+        self.max_workers = max_workers
+        self.capacity = max_workers + max_pending
+        self.retry_after = retry_after
+        self._inflight = 0
+        if mode == "process":
+            # 'spawn' karena TensorFlow sudah dimuat di proses ini (lewat backend.utils);
+            # fork setelah TensorFlow dimuat bisa membuat worker macet
+            self._pool = ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context("spawn"),
+                                             initializer=_init_process_worker)
+        else:
+            self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="inference")
+
+    @property
+    def depth(self) -> int:
+        """Jumlah pekerjaan yang sedang diproses atau menunggu di antrean."""
+        return self._inflight
+
+    async def run(self, fn, *args):
+        # Penghitung hanya diubah dari event loop, jadi tidak perlu lock.
+        if self._inflight >= self.capacity:
+            raise InferenceBusyError(self.retry_after)
+        self._inflight += 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._pool, fn, *args)
+        finally:
+            self._inflight -= 1
+
+    async def warmup(self) -> list:
+        """
+        Memastikan model sudah dimuat di worker sebelum menerima request.
+        Mode thread cukup sekali (model dipakai bersama), mode process
+        mengirim satu tugas per worker agar semua proses ikut dijalankan.
+        """
+        loop = asyncio.get_running_loop()
+        count = self.max_workers if self.mode == "process" else 1
+        return await asyncio.gather(*(loop.run_in_executor(self._pool, warmup_worker) for _ in range(count)))
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
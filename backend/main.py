@@ -1,26 +1,39 @@
 import os
 import time
 import json
+import hashlib
+import asyncio
 import datetime
 import uvicorn
-import sqlite3
 from threading import Timer
 from pathlib import Path
-from gtts import gTTS
 import cv2
 import numpy as np
-import joblib
 import pytz
 import webbrowser # Impor tunggal
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi import FastAPI, Request, HTTPException
-from fastapi.responses import JSONResponse, HTMLResponse
+from fastapi import FastAPI, Request, HTTPException, WebSocket, WebSocketDisconnect
+from fastapi.responses import JSONResponse, HTMLResponse, Response, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
+from starlette.concurrency import run_in_threadpool
 from contextlib import asynccontextmanager
 
-# Impor fungsi dari utils.py versi deepface kita
-from backend.utils import extract_face_features
+# Impor executor inferensi (DeepFace dijalankan di luar event loop)
+from backend.inference import InferenceExecutor, InferenceBusyError, embed_frames, embed_group_frame, stage_timer, format_server_timing
+from backend.batching import MicroBatcher
+from backend.face_index import EmbeddingIndex
+from backend.model_registry import ModelRegistry, ModelBundle
+from backend.frame_gate import FrameGate
+from backend.audio_cache import DuplicateAudioCache, AudioManifest
+from backend.aggregates import AttendanceAggregates
+from backend.attendance_cache import DailyAttendanceCache
+from backend.evidence import EvidenceWriter, evidence_relpath, evidence_url_updates, sweep_evidence
+from backend.metrics import MetricsRegistry, SlowRequestProfiler
+from backend.repeat_cache import RepeatFrameCache, frame_dhash
+from backend.history import EXPORT_FORMATS, fetch_history_page, stream_history
+from backend.database import ConnectionPool, AttendanceWriter, open_connection, migrate_schema, attendance_time_columns
+from backend.utils import MODEL_NAME
 
 # --- Konfigurasi ---
 class AppConfig:
@@ -29,70 +42,308 @@ class AppConfig:
     DB_PATH = BASE_DIR / "attendance.db"
     MODEL_DIR = BASE_DIR / "model"
     IMAGE_STORAGE_DIR = BASE_DIR / "captured_images"
+    # Bukti absensi: potongan wajah + thumbnail per folder tanggal, ditulis di background
+    EVIDENCE_QUEUE_SIZE = int(os.getenv("EVIDENCE_QUEUE_SIZE", "64"))
+    EVIDENCE_MAX_SIDE = int(os.getenv("EVIDENCE_MAX_SIDE", "320"))
+    EVIDENCE_THUMB_SIDE = int(os.getenv("EVIDENCE_THUMB_SIDE", "96"))
+    EVIDENCE_RETENTION_DAYS = int(os.getenv("EVIDENCE_RETENTION_DAYS", "90"))
+    EVIDENCE_COMPACT_AFTER_DAYS = int(os.getenv("EVIDENCE_COMPACT_AFTER_DAYS", "14"))
+    EVIDENCE_MAX_MB = int(os.getenv("EVIDENCE_MAX_MB", "2048"))
+    EVIDENCE_SWEEP_INTERVAL = float(os.getenv("EVIDENCE_SWEEP_INTERVAL", str(6 * 3600)))
     # Konfigurasi Baru untuk Frontend
     TEMPLATES_DIR = PROJECT_ROOT / "templates"
     STATIC_DIR = PROJECT_ROOT / "static"
     
+    # Registry model berversi hasil training; FACE_INDEX_DIR hanya dipakai jika registry masih kosong
+    MODEL_REGISTRY_DIR = MODEL_DIR / "registry"
+    FACE_INDEX_DIR = MODEL_DIR / "face_index"
+    # Model joblib lama, hanya dipakai untuk konversi satu kali ke FACE_INDEX_DIR
     KNN_MODEL_PATH = MODEL_DIR / "knn_model.pkl"
     LABEL_ENCODER_PATH = MODEL_DIR / "label_encoder.pkl"
+    # Backend pencarian index: "exact" atau "hnsw" (butuh hnswlib)
+    INDEX_BACKEND = os.getenv("INDEX_BACKEND", "exact")
     AUDIO_TRACKING_FILE = BASE_DIR / "audio_tracking.json"
+    AUDIO_DIR = BASE_DIR / "generated_audio"
+    DUPLICATE_AUDIO_CACHE_SIZE = 256
+    DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "4"))
+    # Riwayat absensi: ukuran halaman default/maksimal dan baris per fetchmany saat export
+    HISTORY_PAGE_SIZE = int(os.getenv("HISTORY_PAGE_SIZE", "50"))
+    HISTORY_MAX_PAGE_SIZE = int(os.getenv("HISTORY_MAX_PAGE_SIZE", "500"))
+    EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "500"))
+    # Mode streaming /ws/recognize: batas gerbang frame dan jeda antar pengenalan
+    STREAM_MIN_FACE_RATIO = float(os.getenv("STREAM_MIN_FACE_RATIO", "0.15"))
+    STREAM_MIN_SHARPNESS = float(os.getenv("STREAM_MIN_SHARPNESS", "60"))
+    STREAM_COOLDOWN = float(os.getenv("STREAM_COOLDOWN", "5"))
+    # Selama frame terus datang, satu frame per interval ini tetap dikenali penuh
+    # meski ditolak FrameGate, agar wajah yang terlewat detektor cepat tidak terkunci.
+    STREAM_FALLBACK_INTERVAL = float(os.getenv("STREAM_FALLBACK_INTERVAL", "10"))
     TIMEZONE = 'Asia/Jakarta'
     WIB = pytz.timezone(TIMEZONE)
 
+    # Konfigurasi executor inferensi: "thread" atau "process"
+    INFERENCE_MODE = os.getenv("INFERENCE_MODE", "thread")
+    INFERENCE_WORKERS = int(os.getenv("INFERENCE_WORKERS", "2"))
+    INFERENCE_MAX_PENDING = int(os.getenv("INFERENCE_MAX_PENDING", "8"))
+    INFERENCE_RETRY_AFTER = int(os.getenv("INFERENCE_RETRY_AFTER", "2"))
+    # Micro-batching: frame yang datang dalam jendela ini digabung menjadi satu batch
+    BATCH_MAX_SIZE = int(os.getenv("BATCH_MAX_SIZE", "8"))
+    BATCH_WINDOW_MS = float(os.getenv("BATCH_WINDOW_MS", "10"))
+    DISTANCE_THRESHOLD = 0.5
+    # Header dari klien yang sudah memotong wajah sendiri: detektor cepat di server dilewati
+    FACE_CROP_HEADER = "X-Face-Crop"
+    # Mode grup (/recognize/group): batas jumlah wajah per frame dan ukuran wajah minimal (px)
+    GROUP_MAX_FACES = int(os.getenv("GROUP_MAX_FACES", "10"))
+    GROUP_MIN_FACE_PX = int(os.getenv("GROUP_MIN_FACE_PX", "40"))
+    # Cache frame berulang per kiosk (dHash lalu embedding); TTL 0 = nonaktif
+    KIOSK_HEADER = "X-Kiosk-Id"
+    REPEAT_CACHE_TTL = float(os.getenv("REPEAT_CACHE_TTL", "15"))
+    REPEAT_CACHE_SIZE = int(os.getenv("REPEAT_CACHE_SIZE", "256"))
+    REPEAT_MAX_HAMMING = int(os.getenv("REPEAT_MAX_HAMMING", "6"))
+    REPEAT_MAX_DISTANCE = float(os.getenv("REPEAT_MAX_DISTANCE", "0.1"))
+    # Hot reload: interval polling CURRENT di registry (detik, 0 = nonaktif) dan
+    # token opsional untuk endpoint admin (header X-Admin-Token)
+    MODEL_WATCH_INTERVAL = float(os.getenv("MODEL_WATCH_INTERVAL", "10"))
+    ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+    # Profiler sampling untuk request pengenalan yang lebih lambat dari ini (ms); 0 = nonaktif
+    PROFILE_SLOW_MS = float(os.getenv("PROFILE_SLOW_MS", "0"))
+    PROFILE_DIR = BASE_DIR / "profiles"
+
 # Pastikan folder ada sebelum server berjalan
 AppConfig.IMAGE_STORAGE_DIR.mkdir(exist_ok=True)
 
 # --- Variabel Global & Fungsi Startup ---
-knn_model, label_encoder, audio_tracking = None, None, {}
-INTERN_CACHE, absen_tercatat = {}, set()
+# Bundle model aktif (index, audio, data intern); diganti utuh saat hot reload
+active_model = None
+model_registry = ModelRegistry(AppConfig.MODEL_REGISTRY_DIR)
+model_reload_lock = asyncio.Lock()
+inference_executor, recognition_batcher = None, None
+db_pool, attendance_writer = None, None
+evidence_writer = None
+slow_profiler = None
+repeat_cache = RepeatFrameCache(ttl=AppConfig.REPEAT_CACHE_TTL, max_entries=AppConfig.REPEAT_CACHE_SIZE,
+    max_hamming=AppConfig.REPEAT_MAX_HAMMING, max_distance=AppConfig.REPEAT_MAX_DISTANCE)
+audio_manifest = AudioManifest(AppConfig.AUDIO_DIR)
+frame_gate = FrameGate(min_face_ratio=AppConfig.STREAM_MIN_FACE_RATIO, min_sharpness=AppConfig.STREAM_MIN_SHARPNESS)
+# Agregat dashboard di memori, diperbarui setiap absensi berhasil
+attendance_aggregates = AttendanceAggregates(AppConfig.WIB)
+
+def load_attendance_names(day):
+    return [row['intern_name'] for row in query_db("SELECT intern_name FROM attendance_logs WHERE absent_date = ?", (day,))]
+
+# Nama yang sudah absen hari ini; berganti hari sendiri tepat pada batas tanggal WIB
+absen_tercatat = DailyAttendanceCache(AppConfig.WIB, load_attendance_names)
+# Status kesiapan model untuk /api/ready; /recognize menolak request sampai ready=True
+model_status = {"ready": False, "error": None, "load_times_ms": {}, "workers": [], "reload_error": None}
+
+# --- Metrik Prometheus (/metrics) ---
+metrics = MetricsRegistry()
+STAGE_SECONDS = metrics.histogram("attendance_stage_seconds", "Durasi tiap tahap pipeline pengenalan.", label_names=("stage",))
+RECOGNITION_SECONDS = metrics.histogram("attendance_recognition_seconds", "Durasi end-to-end satu pengenalan.", label_names=("transport",))
+# Bucket jarak selalu memuat DISTANCE_THRESHOLD agar proporsi di sekitar batas terlihat jelas
+MATCH_DISTANCE = metrics.histogram("attendance_match_distance", "Jarak cosine ke identitas terdekat.",
+    buckets=sorted({0.1, 0.2, 0.3, 0.4, 0.45, 0.5, 0.55, 0.6, 0.7, 0.8, 1.0, 1.2, AppConfig.DISTANCE_THRESHOLD}), label_names=("decision",))
+RECOGNITIONS = metrics.counter("attendance_recognitions_total", "Jumlah pengenalan per hasil.", label_names=("outcome",))
+REPEAT_HITS = metrics.counter("attendance_repeat_cache_hits_total", "Frame berulang yang dijawab dari cache.", label_names=("kind",))
+EVIDENCE_DROPPED = metrics.counter("attendance_evidence_dropped_total", "Bukti absensi yang dilewati karena antrean penuh.")
+EVIDENCE_DROPPED.inc(amount=0)
+metrics.gauge("attendance_match_distance_threshold", "Batas jarak untuk menerima kecocokan.", lambda: AppConfig.DISTANCE_THRESHOLD)
+metrics.gauge("attendance_inference_queue_depth", "Pekerjaan inferensi yang berjalan + menunggu.",
+    lambda: inference_executor.depth if inference_executor else 0)
+metrics.gauge("attendance_inference_queue_capacity", "Batas antrean inferensi sebelum 503.",
+    lambda: inference_executor.capacity if inference_executor else None)
+metrics.gauge("attendance_batch_pending", "Frame yang menunggu jendela micro-batch.",
+    lambda: recognition_batcher.pending if recognition_batcher else 0)
+metrics.gauge("attendance_evidence_queue_depth", "Bukti absensi yang menunggu ditulis.",
+    lambda: evidence_writer.depth if evidence_writer else 0)
+metrics.gauge("attendance_model_ready", "1 jika model sudah dimuat dan dipanaskan.", lambda: int(model_status["ready"]))
+metrics.gauge("attendance_model_info", "Versi model yang aktif.",
+    lambda: {(active_model.version,): 1} if active_model else None, label_names=("version",))
+
+def recognition_outcome(status_code, content):
+    if status_code == 200:
+        return "success" if content.get("status") == "success" else "duplicate"
+    return {400: "no_face", 404: "unknown"}.get(status_code) or content.get("status", "error")
+
+def observe_recognition(status_code, content, timings, distance, started, transport, faces=None):
+    """
+    Mencatat hasil satu pengenalan ke metrik dan, jika lambat, ke profiler.
+    Mode grup mengirim `faces` berisi (outcome, distance) per wajah.
+    """
+    outcome = recognition_outcome(status_code, content)
+    for face_outcome, face_distance in faces or [(outcome, distance)]:
+        RECOGNITIONS.inc(face_outcome)
+        if face_distance is not None:
+            MATCH_DISTANCE.observe(face_distance, "accepted" if face_distance <= AppConfig.DISTANCE_THRESHOLD else "rejected")
+    for stage, duration_ms in timings.items():
+        STAGE_SECONDS.observe(duration_ms / 1000, stage)
+    ended = time.monotonic()
+    RECOGNITION_SECONDS.observe(ended - started, transport)
+    if slow_profiler:
+        slow_profiler.record(started, ended, {"outcome": outcome, "transport": transport, "timings": dict(timings)})
+
+def init_database():
+    """Membuat pool koneksi baca dan thread penulis tunggal untuk attendance.db."""
+    global db_pool, attendance_writer
+    # Migrasi skema dijalankan sekali sebelum pool dan penulis mulai dipakai
+    conn = open_connection(AppConfig.DB_PATH)
+    try: migrate_schema(conn)
+    finally: conn.close()
+    db_pool = ConnectionPool(AppConfig.DB_PATH, size=AppConfig.DB_POOL_SIZE)
+    attendance_writer = AttendanceWriter(AppConfig.DB_PATH)
 
-def db_connect():
-    """Membuka koneksi baru ke database SQLite."""
-    # Pastikan AppConfig.DB_PATH adalah string untuk kompatibilitas sqlite3 yang lebih luas
-    conn = sqlite3.connect(str(AppConfig.DB_PATH), check_same_thread=False)
-    conn.row_factory = sqlite3.Row
-    return conn
+def convert_legacy_model():
+    """Mengonversi knn_model.pkl + label_encoder.pkl lama menjadi EmbeddingIndex di disk."""
+    import joblib
+    if not AppConfig.KNN_MODEL_PATH.exists() or not AppConfig.LABEL_ENCODER_PATH.exists():
+        raise FileNotFoundError("Index embedding maupun model KNN lama tidak ditemukan.")
+    index = EmbeddingIndex.from_legacy_knn(joblib.load(AppConfig.KNN_MODEL_PATH),
+        joblib.load(AppConfig.LABEL_ENCODER_PATH), model_name=MODEL_NAME)
+    index.save(AppConfig.FACE_INDEX_DIR)
+    print("♻️  Model KNN lama dikonversi ke index embedding.")
+
+def load_model_bundle(version=None):
+    """
+    Memuat satu set artefak model dari registry (default: versi CURRENT).
+    Jika registry masih kosong, index di FACE_INDEX_DIR dipakai sebagai versi "legacy".
+    Berjalan di luar event loop; bundle aktif tidak disentuh sampai pemuatan selesai.
+    """
+    start = time.perf_counter()
+    version = version or model_registry.current_version()
+    if version:
+        release_dir = model_registry.path(version)
+        index_dir, tracking_file = release_dir / "face_index", release_dir / "audio_tracking.json"
+    else:
+        version = "legacy"
+        if not EmbeddingIndex.exists(AppConfig.FACE_INDEX_DIR):
+            convert_legacy_model()
+        index_dir, tracking_file = AppConfig.FACE_INDEX_DIR, AppConfig.AUDIO_TRACKING_FILE
+
+    index = EmbeddingIndex.load(index_dir, backend=AppConfig.INDEX_BACKEND)
+    if index.model_name and index.model_name != MODEL_NAME:
+        # Embedding dari model lain tidak bisa dibandingkan dengan ArcFace yang sedang berjalan
+        raise ValueError(f"Index versi {version} dibuat dengan {index.model_name}, server memakai {MODEL_NAME}.")
+    with open(tracking_file, 'r') as f: tracking = json.load(f)
+    duplicate = DuplicateAudioCache(AppConfig.AUDIO_DIR, tracking, max_entries=AppConfig.DUPLICATE_AUDIO_CACHE_SIZE)
+    interns = {row['name']: row for row in query_db("SELECT id, name, universitas, kategori FROM interns")}
+    load_ms = round((time.perf_counter() - start) * 1000, 1)
+    return ModelBundle(version, index, tracking, duplicate, interns, load_ms)
+
+async def reload_model(version=None, source="admin"):
+    """
+    Memuat bundle baru di threadpool lalu menggantinya secara atomik.
+    Request yang sedang berjalan tetap memakai bundle lama yang dipegangnya.
+    """
+    global active_model
+    async with model_reload_lock:
+        try:
+            bundle = await run_in_threadpool(load_model_bundle, version)
+        except Exception as e:
+            model_status["reload_error"] = {"version": version, "error": str(e)}
+            print(f"⚠️ Gagal memuat model versi {version} ({source}): {e}")
+            raise
+        previous, active_model = active_model, bundle
+        model_status["reload_error"] = None
+        model_status["load_times_ms"]["face_index"] = bundle.load_ms
+        print(f"🔄 Model diganti ({source}): {previous.version if previous else '-'} -> {bundle.version} "
+              f"dalam {bundle.load_ms} ms.")
+        return bundle
+
+async def watch_model_registry():
+    """Polling berkala CURRENT di registry; versi baru dimuat otomatis tanpa restart."""
+    failed_version = None
+    while True:
+        await asyncio.sleep(AppConfig.MODEL_WATCH_INTERVAL)
+        current = await run_in_threadpool(model_registry.current_version)
+        if not current or current == active_model.version or current == failed_version or model_reload_lock.locked():
+            continue
+        try:
+            await reload_model(current, source="watcher")
+        except Exception:
+            # Jangan mencoba versi rusak yang sama berulang kali
+            failed_version = current
 
 def load_all_data():
-    global knn_model, label_encoder, audio_tracking, INTERN_CACHE, absen_tercatat
+    global active_model
     try:
-        # Pengecekan file model harus dilakukan di sini
-        if not AppConfig.KNN_MODEL_PATH.exists() or not AppConfig.LABEL_ENCODER_PATH.exists():
-            raise FileNotFoundError("Model KNN atau Label Encoder tidak ditemukan.")
-            
-        knn_model = joblib.load(AppConfig.KNN_MODEL_PATH)
-        label_encoder = joblib.load(AppConfig.LABEL_ENCODER_PATH)
-        print("✅ Model klasifikasi (KNN) dimuat.")
+        active_model = load_model_bundle()
+        model_status["load_times_ms"]["face_index"] = active_model.load_ms
+        index = active_model.face_index
+        print(f"✅ Model versi {active_model.version} dimuat: {len(index)} vektor, {len(index.names)} orang ({index.mode}, {index.dtype}).")
+        print(f"✅ Pemetaan audio dimuat: {len(active_model.audio_tracking)} rekaman.")
+        print(f"✅ Cache data intern dimuat: {len(active_model.interns)} data.")
         
-        with open(AppConfig.AUDIO_TRACKING_FILE, 'r') as f: audio_tracking = json.load(f)
-        print(f"✅ Pemetaan audio dimuat: {len(audio_tracking)} rekaman.")
-
-        conn = db_connect()
-        cursor = conn.cursor()
-        cursor.execute("SELECT id, name, universitas, kategori FROM interns")
-        for row in cursor.fetchall(): INTERN_CACHE[row['name']] = dict(row)
-        print(f"✅ Cache data intern dimuat: {len(INTERN_CACHE)} data.")
-        
-        # Menggunakan waktu WIB untuk penarikan cache harian
-        today_str = datetime.datetime.now(AppConfig.WIB).strftime('%Y-%m-%d')
-        cursor.execute("SELECT intern_name FROM attendance_logs WHERE date(absent_at) = ?", (today_str,))
-        absen_tercatat = {row['intern_name'] for row in cursor.fetchall()}
-        conn.close()
+        # Cache harian dimuat lazy; len() memicu pemuatan untuk hari ini (WIB)
         print(f"✅ Cache absensi hari ini dimuat: {len(absen_tercatat)} orang.")
+
+        attendance_aggregates.load(query_db)
+        print("✅ Agregat dashboard dimuat.")
         
     except FileNotFoundError as e:
         print(f"🔥 KESALAHAN KRITIS: File tidak ditemukan: {e}"); exit()
     except Exception as e:
         print(f"🔥 KESALAHAN KRITIS saat startup: {e}"); exit()
 
+async def warm_up_models():
+    """Memuat dan memanaskan RetinaFace + ArcFace di semua worker inferensi."""
+    start = time.perf_counter()
+    try:
+        model_status["workers"] = await inference_executor.warmup()
+        model_status["load_times_ms"]["warmup_total"] = round((time.perf_counter() - start) * 1000, 1)
+        model_status["ready"] = True
+        print(f"✅ Model DeepFace siap dalam {model_status['load_times_ms']['warmup_total'] / 1000:.1f} detik.")
+    except Exception as e:
+        model_status["error"] = str(e)
+        print(f"🔥 KESALAHAN KRITIS saat memuat model DeepFace: {e}")
+
+async def sweep_evidence_periodically():
+    """Retensi & kompaksi folder bukti saat startup lalu setiap EVIDENCE_SWEEP_INTERVAL detik."""
+    while True:
+        try:
+            today = datetime.datetime.now(AppConfig.WIB).date()
+            stats = await run_in_threadpool(sweep_evidence, AppConfig.IMAGE_STORAGE_DIR, today,
+                AppConfig.EVIDENCE_RETENTION_DAYS, AppConfig.EVIDENCE_COMPACT_AFTER_DAYS,
+                AppConfig.EVIDENCE_MAX_MB * 1024 * 1024)
+            # image_url di database ikut menunjuk ke thumbnail (atau NULL) agar riwayat
+            # dan export tidak merujuk potongan wajah yang sudah dihapus
+            for sql, params in evidence_url_updates(today, AppConfig.EVIDENCE_RETENTION_DAYS,
+                                                    AppConfig.EVIDENCE_COMPACT_AFTER_DAYS, stats["removed_dates"]):
+                await asyncio.wrap_future(attendance_writer.submit(sql, params))
+            print(f"🧹 Retensi bukti absensi: {stats}")
+        except Exception as e:
+            print(f"⚠️ Retensi bukti absensi gagal: {e}")
+        await asyncio.sleep(AppConfig.EVIDENCE_SWEEP_INTERVAL)
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    print("🚀 Server memulai..."); load_all_data(); yield; print("🛑 Server berhenti.")
+    global inference_executor, recognition_batcher, evidence_writer, slow_profiler
+    print("🚀 Server memulai..."); init_database(); load_all_data()
+    evidence_writer = EvidenceWriter(AppConfig.IMAGE_STORAGE_DIR, max_queue=AppConfig.EVIDENCE_QUEUE_SIZE,
+        max_side=AppConfig.EVIDENCE_MAX_SIDE, thumb_side=AppConfig.EVIDENCE_THUMB_SIDE)
+    inference_executor = InferenceExecutor(
+        mode=AppConfig.INFERENCE_MODE, max_workers=AppConfig.INFERENCE_WORKERS,
+        max_pending=AppConfig.INFERENCE_MAX_PENDING, retry_after=AppConfig.INFERENCE_RETRY_AFTER)
+    recognition_batcher = MicroBatcher(inference_executor, embed_frames, match_batch,
+        max_batch_size=AppConfig.BATCH_MAX_SIZE, window_ms=AppConfig.BATCH_WINDOW_MS)
+    print(f"✅ Executor inferensi siap: mode={AppConfig.INFERENCE_MODE}, worker={AppConfig.INFERENCE_WORKERS}, batch={AppConfig.BATCH_MAX_SIZE}.")
+    # Warm-up berjalan di background; server sudah bisa menjawab /api/ready selama proses ini
+    warmup_task = asyncio.create_task(warm_up_models())
+    watch_task = asyncio.create_task(watch_model_registry()) if AppConfig.MODEL_WATCH_INTERVAL > 0 else None
+    sweep_task = asyncio.create_task(sweep_evidence_periodically())
+    if AppConfig.PROFILE_SLOW_MS > 0:
+        slow_profiler = SlowRequestProfiler(AppConfig.PROFILE_SLOW_MS, output_dir=AppConfig.PROFILE_DIR)
+        slow_profiler.start()
+        print(f"🔬 Profiler aktif untuk request > {AppConfig.PROFILE_SLOW_MS:.0f} ms.")
+    yield
+    warmup_task.cancel(); sweep_task.cancel()
+    if watch_task: watch_task.cancel()
+    if slow_profiler: slow_profiler.stop()
+    inference_executor.shutdown(); evidence_writer.close(); attendance_writer.close(); db_pool.close_all(); print("🛑 Server berhenti.")
 
 app = FastAPI(title="DeepFace Attendance API (Local DB)", lifespan=lifespan)
 app.add_middleware(CORSMiddleware, allow_origins=["*"], allow_methods=["*"], allow_headers=["*"])
 app.mount("/static", StaticFiles(directory=str(AppConfig.STATIC_DIR.resolve())), name="static")
 app.mount("/images", StaticFiles(directory=str(AppConfig.IMAGE_STORAGE_DIR.resolve())), name="images")
+app.mount("/audio", StaticFiles(directory=str(AppConfig.AUDIO_DIR.resolve())), name="audio")
 templates = Jinja2Templates(directory=str(AppConfig.TEMPLATES_DIR.resolve()))
 
 # --- Endpoint HTML ---
@@ -109,117 +360,536 @@ async def serve_pages(request: Request, page_name: str):
     return templates.TemplateResponse(f"{page_name}.html", {"request": request})
 
 # --- Endpoint Absensi ---
+def timed_response(status_code, content, timings, headers=None):
+    """JSONResponse dengan header Server-Timing berisi durasi tiap tahap."""
+    headers = dict(headers or {})
+    headers["Server-Timing"] = format_server_timing(timings)
+    return JSONResponse(status_code=status_code, content=content, headers=headers)
+
+def match_batch(results):
+    """
+    Mencocokkan seluruh embedding dalam satu batch dengan satu perkalian
+    matriks ke index, lalu menambahkan `person_name` dan `distance` ke setiap hasil.
+    """
+    # Pastikan model dimuat sebelum digunakan; referensi diambil sekali agar
+    # seluruh batch dicocokkan ke index yang sama walau ada hot reload
+    model = active_model
+    if model is None:
+         raise RuntimeError("Index embedding belum dimuat.")
+
+    found = [r for r in results if r["embedding"] is not None]
+    if not found: return results
+
+    timings = {}
+    with stage_timer(timings, "match"):
+        embeddings = np.vstack([r["embedding"] for r in found])
+        names, distances = model.face_index.search(embeddings)
+
+        for r, name, distance in zip(found, names, distances):
+            r["distance"] = float(distance)
+            r["person_name"] = name if distance <= AppConfig.DISTANCE_THRESHOLD else "unknown"
+    for r in found: r["timings"].update(timings)
+    return results
+
+INSERT_ATTENDANCE_SQL = ("INSERT INTO attendance_logs (intern_id, intern_name, universitas, kategori, image_url, absent_at, absent_date, absent_ts) "
+                         "VALUES (:intern_id, :intern_name, :universitas, :kategori, :image_url, :absent_at, :absent_date, :absent_ts)")
+
+def attendance_row(intern_data, person_name, image_url, absent_at, absent_date, absent_ts):
+    return {"intern_id": intern_data['id'], "intern_name": person_name, "universitas": intern_data['universitas'],
+            "kategori": intern_data['kategori'], "image_url": image_url,
+            "absent_at": absent_at, "absent_date": absent_date, "absent_ts": absent_ts}
+
+def submit_evidence(frame_bytes, relpath, box=None):
+    """Menjadwalkan bukti absensi; URL gambar, atau None jika antrean penuh (dihitung sebagai drop)."""
+    if evidence_writer.submit(frame_bytes, relpath, box):
+        return f"/images/{relpath}"
+    EVIDENCE_DROPPED.inc()
+    return None
+
+def process_attendance(person_name, frame_bytes, timings):
+    """
+    Tahap setelah pencocokan: cek duplikat, jadwalkan bukti absensi, TTS dan
+    insert ke database. Dijalankan di threadpool karena insert menunggu commit.
+    Mengembalikan tuple (status_code, content).
+    """
+    model = active_model
+    # 1. Pengecekan Tidak Dikenal
+    if person_name == "unknown" or person_name not in model.interns:
+        # Mengembalikan status 404 custom (sesuai logika asli Anda)
+        return 404, {"audio_track": "S003"}
+
+    # 2. Pengecekan Duplikasi. reserve() mengecek dan menandai secara atomik untuk
+    # tanggal WIB dari timestamp absensi ini, jadi request paralel untuk orang yang
+    # sama langsung dianggap duplikat dan pergantian hari tidak butuh restart.
+    now = datetime.datetime.now(AppConfig.WIB)
+    absent_at, absent_date, absent_ts = attendance_time_columns(now)
+    if not absen_tercatat.reserve(person_name, absent_date):
+        # Klip duplikat sudah dibuat saat training, cukup kirim track ID-nya
+        with stage_timer(timings, "tts"):
+            track_id = model.duplicate_audio.track_for(person_name)
+
+        return 200, {"status": "fail", "message": f"DUPLIKAT: {person_name}", "audio_track": track_id}
+
+    # 3. Absen Berhasil
+    try:
+        intern_data = model.interns.get(person_name)
+        with stage_timer(timings, "evidence"):
+            # Decode, crop dan tulis file terjadi di thread penulis bukti; di sini hanya antre.
+            # Jika antrean penuh, absensi tetap dicatat tanpa gambar.
+            relpath = evidence_relpath(person_name, absent_date, absent_ts)
+            image_url = submit_evidence(frame_bytes, relpath)
+
+        with stage_timer(timings, "db_write"):
+            # Lewat thread penulis tunggal; insert dari beberapa kiosk digabung dalam satu transaksi
+            row = attendance_row(intern_data, person_name, image_url, absent_at, absent_date, absent_ts)
+            attendance_writer.execute(INSERT_ATTENDANCE_SQL, row)
+        attendance_aggregates.record(row)
+    except Exception:
+        absen_tercatat.release(person_name, absent_date)
+        raise
+
+    return 200, {"status": "success", "audio_track": model.audio_tracking.get(person_name)}
+
+def process_group_attendance(faces, frame_bytes, timings):
+    """
+    Versi grup dari process_attendance untuk semua wajah dalam satu frame:
+    satu query vektor ke index, cek duplikat per orang, lalu semua orang yang
+    baru datang dicatat dalam satu transaksi (submit_many).
+    Mengembalikan tuple (status_code, content) dengan status per wajah.
+    """
+    model = active_model
+    with stage_timer(timings, "match"):
+        names, distances = model.face_index.search(np.vstack([face["embedding"] for face in faces]))
+        # Satu orang hanya muncul sekali per frame; jika dua wajah cocok ke orang
+        # yang sama, hanya yang terdekat yang dipakai, sisanya tidak dikenal
+        best = {}
+        for i, (name, distance) in enumerate(zip(names, distances)):
+            if distance <= AppConfig.DISTANCE_THRESHOLD and name in model.interns:
+                if name not in best or distance < distances[best[name]]:
+                    best[name] = i
+
+    now = datetime.datetime.now(AppConfig.WIB)
+    absent_at, absent_date, absent_ts = attendance_time_columns(now)
+    results, arrived = [], []
+    for i, face in enumerate(faces):
+        name = names[i]
+        entry = {"box": list(face["box"]), "distance": round(float(distances[i]), 4)}
+        if best.get(name) != i:
+            entry.update(status="unknown", audio_track="S003")
+        elif not absen_tercatat.reserve(name, absent_date):
+            entry.update(status="duplicate", name=name, audio_track=model.duplicate_audio.track_for(name))
+        else:
+            entry.update(status="success", name=name, audio_track=model.audio_tracking.get(name))
+            arrived.append((face, name))
+        results.append(entry)
+
+    rows = []
+    try:
+        with stage_timer(timings, "evidence"):
+            for face, name in arrived:
+                relpath = evidence_relpath(name, absent_date, absent_ts)
+                image_url = submit_evidence(frame_bytes, relpath, face["box"])
+                rows.append(attendance_row(model.interns[name], name, image_url, absent_at, absent_date, absent_ts))
+        if rows:
+            with stage_timer(timings, "db_write"):
+                attendance_writer.submit_many(INSERT_ATTENDANCE_SQL, rows).result(timeout=10)
+    except Exception:
+        for _, name in arrived:
+            absen_tercatat.release(name, absent_date)
+        raise
+    for row in rows:
+        attendance_aggregates.record(row)
+
+    counts = {status: sum(r["status"] == status for r in results) for status in ("success", "duplicate", "unknown")}
+    message = f"{counts['success']} tercatat, {counts['duplicate']} duplikat, {counts['unknown']} tidak dikenal"
+    return 200, {"status": "success" if rows else "fail", "message": message, "recorded": len(rows), "faces": results}
+
+@app.get("/api/ready")
+async def get_readiness():
+    """Readiness probe: 200 jika model sudah dimuat dan dipanaskan, 503 jika belum."""
+    content = {"ready": model_status["ready"], "error": model_status["error"],
+               "load_times_ms": model_status["load_times_ms"], "workers": model_status["workers"],
+               "model_version": active_model.version if active_model else None}
+    return JSONResponse(status_code=200 if model_status["ready"] else 503, content=content)
+
+@app.get("/metrics")
+async def get_metrics():
+    """Metrik format teks Prometheus: histogram per tahap, jarak kecocokan, antrean dan hasil."""
+    return Response(content=metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+@app.get("/api/debug/slow-requests")
+async def get_slow_requests():
+    """Laporan profiler untuk request lambat terakhir (butuh PROFILE_SLOW_MS > 0)."""
+    if not slow_profiler:
+        raise HTTPException(status_code=404, detail="Profiler request lambat tidak aktif (set PROFILE_SLOW_MS)")
+    return {"threshold_ms": slow_profiler.threshold_ms, "reports": slow_profiler.reports()}
+
+@app.get("/api/audio/manifest")
+def get_audio_manifest(request: Request):
+    """
+    Daftar semua track audio (ukuran + hash isi) agar kiosk bisa mengunduh
+    track yang belum ada atau berubah sekali saat startup, lalu memutarnya dari memori.
+    """
+    content = {"base_url": "/audio", "tracks": audio_manifest.tracks()}
+    etag = '"' + hashlib.sha256(json.dumps(content, sort_keys=True).encode()).hexdigest()[:16] + '"'
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers={"ETag": etag})
+    return JSONResponse(content=content, headers={"ETag": etag, "Cache-Control": "no-cache"})
+
+@app.get("/api/model")
+async def get_model_info():
+    """Versi model aktif, waktu pemuatannya, dan versi yang tersedia di registry."""
+    return {"active": active_model.info() if active_model else None, "reloading": model_reload_lock.locked(),
+            "reload_error": model_status["reload_error"], "current": model_registry.current_version(),
+            "available": model_registry.versions()}
+
+@app.post("/api/admin/reload-model")
+async def reload_model_endpoint(request: Request, version: str = None):
+    """
+    Memuat ulang model tanpa restart. Tanpa parameter memakai versi CURRENT di
+    registry; `?version=...` memuat versi tertentu (mis. untuk rollback).
+    """
+    if AppConfig.ADMIN_TOKEN and request.headers.get("x-admin-token") != AppConfig.ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Token admin tidak valid")
+    if model_reload_lock.locked():
+        raise HTTPException(status_code=409, detail="Pemuatan model lain sedang berjalan")
+    if version and version not in model_registry.versions():
+        raise HTTPException(status_code=404, detail=f"Versi model {version} tidak ditemukan")
+    try:
+        bundle = await reload_model(version, source="admin")
+    except Exception as e:
+        return JSONResponse(status_code=500, content={"status": "error", "message": str(e),
+                                                      "active": active_model.info() if active_model else None})
+    return {"status": "success", "active": bundle.info()}
+
+def not_ready_response():
+    return 503, {"status": "loading", "message": "Model sedang dimuat, coba lagi sebentar.",
+                 "retry_after": AppConfig.INFERENCE_RETRY_AFTER}, {"Retry-After": str(AppConfig.INFERENCE_RETRY_AFTER)}
+
+def busy_response(e: InferenceBusyError):
+    return 503, {"status": "busy", "message": str(e), "retry_after": e.retry_after}, {"Retry-After": str(e.retry_after)}
+
+async def run_recognition(frame_bytes, timings, pre_cropped=False, transport="http", kiosk=None):
+    """
+    Pipeline pengenalan bersama untuk /recognize dan /ws/recognize.
+    Mengembalikan tuple (status_code, content, headers) dan mencatat metriknya.
+    """
+    started, trace = time.monotonic(), {}
+    try:
+        status_code, content, headers = await recognize_frame(frame_bytes, timings, pre_cropped, trace, kiosk)
+    except Exception:
+        RECOGNITIONS.inc("error")
+        raise
+    observe_recognition(status_code, content, timings, trace.get("distance"), started, transport)
+    return status_code, content, headers
+
+def repeat_response(entry):
+    """
+    Jawaban untuk frame berulang dari hasil yang sudah diketahui, tanpa deteksi
+    maupun database. Orang yang sudah tercatat hari ini dijawab sebagai duplikat;
+    jika belum tercatat (mis. insert sebelumnya gagal), pipeline tetap dijalankan.
+    """
+    model, person_name = active_model, entry["person_name"]
+    if person_name == "unknown" or person_name not in model.interns:
+        return 404, {"audio_track": "S003"}
+    if person_name not in absen_tercatat:
+        return None
+    return 200, {"status": "fail", "message": f"DUPLIKAT: {person_name}", "audio_track": model.duplicate_audio.track_for(person_name)}
+
+async def answer_repeat(entry, timings):
+    if entry is None:
+        return None
+    # track_for bisa membuat audio TTS baru, jadi tidak dijalankan di event loop
+    with stage_timer(timings, "repeat_cache"):
+        return await run_in_threadpool(repeat_response, entry)
+
+async def recognize_frame(frame_bytes, timings, pre_cropped, trace, kiosk):
+    if not model_status["ready"]:
+        return not_ready_response()
+
+    # Cache frame berulang hanya berlaku untuk hari dan versi model yang sama
+    use_repeat_cache = AppConfig.REPEAT_CACHE_TTL > 0
+    generation = (datetime.datetime.now(AppConfig.WIB).strftime('%Y-%m-%d'), active_model.version)
+    dhash = None
+    if use_repeat_cache:
+        with stage_timer(timings, "dhash"):
+            dhash = await run_in_threadpool(frame_dhash, frame_bytes)
+        cached = await answer_repeat(repeat_cache.lookup_hash(kiosk, dhash, generation), timings)
+        if cached:
+            REPEAT_HITS.inc("hash")
+            return (*cached, {})
+
+    # Decode + DeepFace + KNN berjalan per batch di executor, event loop tetap bebas
+    try:
+        result = await recognition_batcher.submit(frame_bytes, pre_cropped)
+    except InferenceBusyError as e:
+        return busy_response(e)
+    timings.update(result["timings"])
+    trace["distance"] = result.get("distance")
+
+    if result["embedding"] is None: return 400, {"audio_track": "S002"}, {}
+
+    if use_repeat_cache:
+        cached = await answer_repeat(repeat_cache.lookup_embedding(kiosk, result["embedding"], generation), timings)
+        if cached:
+            REPEAT_HITS.inc("embedding")
+            return (*cached, {})
+
+    status_code, content = await run_in_threadpool(process_attendance, result["person_name"], frame_bytes, timings)
+    # Frame tanpa wajah tidak disimpan: frame berikutnya yang mirip bisa saja sudah berisi orang
+    if use_repeat_cache and status_code in (200, 404):
+        repeat_cache.store(kiosk, dhash, result["embedding"], result["person_name"], generation)
+    return status_code, content, {}
+
 @app.post("/recognize")
 async def recognize_face(request: Request):
+    timings = {}
     try:
         frame_bytes = await request.body()
-        frame = cv2.imdecode(np.frombuffer(frame_bytes, np.uint8), cv2.IMREAD_COLOR)
-        
-        # Logika Absensi dan Pengenalan
-        embedding = extract_face_features(frame)
-        if embedding is None: return JSONResponse(status_code=400, content={"audio_track": "S002"})
-        
-        # Pastikan model dimuat sebelum digunakan
-        if knn_model is None or label_encoder is None:
-             raise RuntimeError("Model klasifikasi belum dimuat.")
-
-        DISTANCE_THRESHOLD = 0.5
-        distances, _ = knn_model.kneighbors(embedding)
-        closest_distance = distances[0][0]
-        predicted_label_id = knn_model.predict(embedding)[0]
-        
-        person_name = "unknown"
-        if closest_distance <= DISTANCE_THRESHOLD:
-            person_name = label_encoder.inverse_transform([predicted_label_id])[0]
-        
-        # 1. Pengecekan Duplikasi
-        if person_name in absen_tercatat:
-            # Gunakan f-string untuk path file yang dinamis
-            temp_audio_name = f"temp_{int(time.time())}.mp3"
-            temp_audio_path = AppConfig.IMAGE_STORAGE_DIR / temp_audio_name
-            
-            tts = gTTS(text=f"Anda Sudah Melakukan Absensi Hari Ini, {person_name}", lang='id')
-            tts.save(str(temp_audio_path))
-            
-            return JSONResponse(status_code=200, content={"status": "fail", "message": f"DUPLIKAT: {person_name}", "audio_track": f"/images/{temp_audio_name}"})
-        
-        # 2. Pengecekan Tidak Dikenal
-        if person_name == "unknown" or person_name not in INTERN_CACHE:
-            # Mengembalikan status 404 custom (sesuai logika asli Anda)
-            return JSONResponse(status_code=404, content={"audio_track": "S003"})
-        
-        # 3. Absen Berhasil
-        intern_data = INTERN_CACHE.get(person_name)
-        image_filename = f"{person_name}_{int(time.time())}.jpg"
-        cv2.imwrite(str(AppConfig.IMAGE_STORAGE_DIR / image_filename), frame)
-        
-        conn = db_connect()
-        cursor = conn.cursor()
-        
-        # Menggunakan WIB untuk absent_at
-        absent_time_wib = datetime.datetime.now(AppConfig.WIB).isoformat()
-        
-        cursor.execute("INSERT INTO attendance_logs (intern_id, intern_name, universitas, kategori, image_url, absent_at) VALUES (?, ?, ?, ?, ?, ?)",
-            (intern_data['id'], person_name, intern_data['universitas'], intern_data['kategori'], f"/images/{image_filename}", absent_time_wib))
-            
-        conn.commit(); conn.close(); absen_tercatat.add(person_name)
-        
-        return JSONResponse(status_code=200, content={"status": "success", "audio_track": audio_tracking.get(person_name)})
-        
+        pre_cropped = request.headers.get(AppConfig.FACE_CROP_HEADER, "").lower() in ("1", "true", "yes")
+        kiosk = request.headers.get(AppConfig.KIOSK_HEADER) or (request.client.host if request.client else None)
+        status_code, content, headers = await run_recognition(frame_bytes, timings, pre_cropped, kiosk=kiosk)
+        return timed_response(status_code, content, timings, headers)
+
     except Exception as e:
         # Menambahkan respons detail pada error 500 jika tidak di lingkungan produksi
         print(f"❌ Error di /recognize: {e}")
         return JSONResponse(status_code=500, content={"detail": f"Internal Server Error: {str(e)}"})
 
+async def recognize_group_frame(frame_bytes, timings):
+    if not model_status["ready"]:
+        return not_ready_response()
+    # Satu frame sudah berisi banyak wajah, jadi langsung ke executor tanpa micro-batcher
+    try:
+        result = await inference_executor.run(embed_group_frame, frame_bytes,
+                                              AppConfig.GROUP_MIN_FACE_PX, AppConfig.GROUP_MAX_FACES)
+    except InferenceBusyError as e:
+        return busy_response(e)
+    timings.update(result["timings"])
+    if not result["faces"]:
+        return 400, {"status": "fail", "faces": [], "audio_track": "S002"}, {}
+    status_code, content = await run_in_threadpool(process_group_attendance, result["faces"], frame_bytes, timings)
+    return status_code, content, {}
+
+@app.post("/recognize/group")
+async def recognize_group(request: Request):
+    """
+    Mode grup untuk antrean di pintu masuk: semua wajah dalam frame dikenali
+    sekaligus. Respons berisi kotak (x, y, w, h), status dan audio per wajah.
+    """
+    timings = {}
+    try:
+        frame_bytes = await request.body()
+        started = time.monotonic()
+        try:
+            status_code, content, headers = await recognize_group_frame(frame_bytes, timings)
+        except Exception:
+            RECOGNITIONS.inc("error")
+            raise
+        faces = [(face["status"], face["distance"]) for face in content.get("faces", [])]
+        observe_recognition(status_code, content, timings, None, started, "group", faces=faces)
+        return timed_response(status_code, content, timings, headers)
+
+    except Exception as e:
+        print(f"❌ Error di /recognize/group: {e}")
+        return JSONResponse(status_code=500, content={"detail": f"Internal Server Error: {str(e)}"})
+
+@app.websocket("/ws/recognize")
+async def recognize_stream(websocket: WebSocket):
+    """
+    Mode streaming: kiosk mengirim frame JPEG (pesan biner) secara terus-menerus
+    dengan laju rendah. Setiap frame melewati FrameGate yang murah; hanya frame
+    yang lolos yang masuk ke pipeline DeepFace. Server mengirim event JSON:
+
+      {"event": "gate", "reason": ...}  saat status gerbang berubah
+      {"event": "result", "status_code": ..., ...}  hasil pengenalan
+
+    Setelah satu hasil, pengenalan berikutnya menunggu wajah meninggalkan kamera
+    atau STREAM_COOLDOWN detik, supaya orang yang berdiri di depan kamera
+    tidak dikenali berulang kali. Jika FrameGate terus menolak, satu frame per
+    STREAM_FALLBACK_INTERVAL detik tetap dikirim ke pipeline penuh; hasil
+    "tidak ada wajah" dari frame cadangan ini tidak dikirim ke kiosk.
+    """
+    await websocket.accept()
+    kiosk = websocket.headers.get(AppConfig.KIOSK_HEADER) or (websocket.client.host if websocket.client else None)
+    last_reason, recognizing, armed, last_result_at = None, False, True, 0.0
+    last_attempt_at = time.monotonic()
+    recognition_task = None
+
+    async def recognize(frame_bytes, fallback=False):
+        nonlocal recognizing, armed, last_result_at
+        timings = {}
+        try:
+            status_code, content, _ = await run_recognition(frame_bytes, timings, transport="ws", kiosk=kiosk)
+            if fallback and status_code == 400:
+                return
+            if status_code != 503:
+                armed, last_result_at = False, time.monotonic()
+            await websocket.send_json({"event": "result", "status_code": status_code, "timings": timings, **content})
+        except WebSocketDisconnect:
+            pass
+        except Exception as e:
+            print(f"❌ Error di /ws/recognize: {e}")
+        finally:
+            recognizing = False
+
+    try:
+        while True:
+            frame_bytes = await websocket.receive_bytes()
+            # Frame yang datang saat pengenalan masih berjalan dibuang (frame terbaru yang menang)
+            if recognizing:
+                continue
+
+            frame = None
+            if frame_bytes:
+                frame = await run_in_threadpool(cv2.imdecode, np.frombuffer(frame_bytes, np.uint8), cv2.IMREAD_COLOR)
+            reason, box, _ = await run_in_threadpool(frame_gate.check, frame)
+            if reason != last_reason:
+                last_reason = reason
+                await websocket.send_json({"event": "gate", "reason": reason, "box": list(box) if box else None})
+
+            if reason == FrameGate.NO_FACE:
+                armed = True
+            elif time.monotonic() - last_result_at >= AppConfig.STREAM_COOLDOWN:
+                armed = True
+            fallback = reason != FrameGate.PASSED
+            if not armed or (fallback and time.monotonic() - last_attempt_at < AppConfig.STREAM_FALLBACK_INTERVAL):
+                continue
+
+            recognizing, last_attempt_at = True, time.monotonic()
+            # Referensi task disimpan agar tidak dibersihkan garbage collector sebelum selesai
+            recognition_task = asyncio.create_task(recognize(frame_bytes, fallback))
+    except WebSocketDisconnect:
+        pass
+    finally:
+        # Kiosk terputus: hasil pengenalan yang masih berjalan tidak bisa dikirim lagi.
+        # Absensi yang sudah masuk ke thread penulis tetap tersimpan.
+        if recognition_task is not None and not recognition_task.done():
+            recognition_task.cancel()
+            try:
+                await recognition_task
+            except asyncio.CancelledError:
+                pass
+
 # --- API Endpoints untuk Dashboard ---
+# Endpoint dashboard memakai `def` biasa agar FastAPI menjalankannya di threadpool,
+# sehingga query SQLite tidak menahan event loop.
 def query_db(query, args=(), one=False):
-    conn = db_connect(); cur = conn.cursor(); cur.execute(query, args)
-    rv = cur.fetchall(); conn.close()
+    with db_pool.connection() as conn:
+        rv = conn.execute(query, args).fetchall()
     return (dict(rv[0]) if rv else None) if one else [dict(row) for row in rv]
 
+def etag_json(request: Request, build):
+    """
+    JSONResponse dengan ETag dari versi agregat. Jika dashboard mengirim
+    If-None-Match yang sama, balas 304 tanpa membangun body sama sekali.
+    """
+    etag = attendance_aggregates.etag()
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers={"ETag": etag})
+    return JSONResponse(content=build(), headers={"ETag": etag, "Cache-Control": "no-cache"})
+
 @app.get("/api/system-start-date")
-async def get_system_start_date():
-    first_log = query_db("SELECT MIN(absent_at) as start_date FROM attendance_logs", one=True)
-    start_date = first_log['start_date'] if first_log and first_log['start_date'] else datetime.datetime.now(AppConfig.WIB).isoformat()
+def get_system_start_date():
+    first_absent_at = attendance_aggregates.first_absent_at()
+    start_date = first_absent_at if first_absent_at else datetime.datetime.now(AppConfig.WIB).isoformat()
     return {"system_start_date": start_date, "current_date": datetime.datetime.now(AppConfig.WIB).isoformat()}
 
+# Dashboard dilayani dari agregat di memori; SQLite hanya dibaca sekali saat startup.
 @app.get("/api/today-active-interns")
-async def get_today_active_interns():
-    # Menggunakan datetime dari pytz untuk mendapatkan tanggal hari ini sesuai WIB
-    today_wib = datetime.datetime.now(AppConfig.WIB).strftime('%Y-%m-%d')
-    rows = query_db("SELECT intern_name, universitas, kategori, absent_at, image_url, intern_id FROM attendance_logs WHERE date(absent_at) = ? ORDER BY absent_at DESC", [today_wib])
-    active_interns = [{"name": r['intern_name'], "jobdesk": f"{r['kategori']} - {r['universitas']}", "recognition_time": r['absent_at'], "capture_image": r['image_url'], "intern_id": r['intern_id']} for r in rows]
-    return {"total_active": len(active_interns), "active_interns": active_interns}
+def get_today_active_interns(request: Request):
+    return etag_json(request, attendance_aggregates.today_snapshot)
 
 # ... (get_attendance_dates endpoint tidak diubah)
 
 @app.get("/api/attendance-dates-with-range")
-async def get_attendance_dates_with_range():
-    start_row = query_db("SELECT MIN(date(absent_at)) as start_date FROM attendance_logs", one=True)
-    
-    if not start_row or not start_row['start_date']: return {"date_range": [], "total_dates": 0}
-    
-    start_date = datetime.datetime.strptime(start_row['start_date'], '%Y-%m-%d').date()
-    end_date = datetime.datetime.now(AppConfig.WIB).date() # Menggunakan WIB untuk tanggal akhir
-    
-    attended_dates = {row['attendance_date'] for row in query_db("SELECT DISTINCT date(absent_at) as attendance_date FROM attendance_logs")}
-    date_range = []; current_date = start_date
-    
-    while current_date <= end_date:
-        date_str = current_date.strftime('%Y-%m-%d')
-        date_range.append({"date": date_str, "has_attendance": date_str in attended_dates})
-        current_date += datetime.timedelta(days=1)
-        
-    return {"date_range": date_range, "total_dates": len(attended_dates)}
+def get_attendance_dates_with_range(request: Request):
+    return etag_json(request, attendance_aggregates.date_range)
 
 # ... (endpoint API lainnya tidak diubah karena sudah benar)
 
 @app.get("/api/attendance-summary")
-async def get_attendance_summary():
-    # Menggunakan datetime dari pytz untuk mendapatkan tanggal hari ini sesuai WIB
-    today_wib = datetime.datetime.now(AppConfig.WIB).strftime('%Y-%m-%d')
-    result = query_db("SELECT COUNT(id) as total FROM attendance_logs WHERE date(absent_at) = ?", [today_wib], one=True)
-    return {"total_attendees": result['total'] if result else 0}
+def get_attendance_summary(request: Request):
+    return etag_json(request, lambda: {"total_attendees": attendance_aggregates.today_snapshot()["total_active"]})
+
+def history_filters(start_date, end_date, intern, universitas, kategori) -> dict:
+    return {"start_date": start_date, "end_date": end_date, "intern": intern,
+            "universitas": universitas, "kategori": kategori}
+
+@app.get("/api/history")
+def get_attendance_history(start_date: str = None, end_date: str = None, intern: str = None,
+                           universitas: str = None, kategori: str = None, cursor: str = None, limit: int = None):
+    """Riwayat absensi terbaru lebih dulu, dipaginasi dengan cursor dari `next_cursor`."""
+    limit = min(max(limit or AppConfig.HISTORY_PAGE_SIZE, 1), AppConfig.HISTORY_MAX_PAGE_SIZE)
+    filters = history_filters(start_date, end_date, intern, universitas, kategori)
+    try:
+        with db_pool.connection() as conn:
+            return fetch_history_page(conn, filters, AppConfig.WIB, cursor=cursor, limit=limit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/api/history/export")
+def export_attendance_history(format: str = "csv", start_date: str = None, end_date: str = None,
+                              intern: str = None, universitas: str = None, kategori: str = None):
+    """
+    Export riwayat (kronologis) sebagai CSV atau JSONL yang di-stream per batch.
+    Export memakai koneksi sendiri, bukan dari pool, karena cursor-nya tetap
+    terbuka selama unduhan berjalan dan tidak boleh menahan koneksi dashboard.
+    """
+    if format not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Format tidak dikenal: {format} (csv atau jsonl)")
+    filters = history_filters(start_date, end_date, intern, universitas, kategori)
+    conn = open_connection(AppConfig.DB_PATH)
+    rows = stream_history(conn, filters, AppConfig.WIB, fmt=format, batch_size=AppConfig.EXPORT_BATCH_SIZE)
+    try:
+        # Validasi filter (tanggal) sebelum header 200 terkirim
+        first = next(rows)
+    except StopIteration:
+        first = ""
+    except BaseException as e:
+        # Stream belum dimulai, jadi body() tidak akan menutup koneksinya
+        conn.close()
+        if isinstance(e, ValueError):
+            raise HTTPException(status_code=400, detail=str(e))
+        raise
+
+    def body():
+        try:
+            yield first
+            yield from rows
+        finally:
+            conn.close()
+
+    filename = f"riwayat_absensi_{start_date or 'awal'}_{end_date or 'akhir'}.{format}"
+    return StreamingResponse(body(), media_type=EXPORT_FORMATS[format],
+                             headers={"Content-Disposition": f'attachment; filename="{filename}"'})
+
+@app.get("/api/events")
+async def stream_attendance_events(request: Request):
+    """
+    Server-Sent Events: dashboard menerima event `checkin` dan `rollover` tanpa
+    polling. Event `hello` membawa roster hari ini, jadi klien yang tersambung
+    ulang (dan mungkin melewatkan event) langsung sinkron.
+    """
+    queue = attendance_aggregates.subscribe()
+
+    async def event_stream():
+        try:
+            yield f"retry: 5000\nevent: hello\ndata: {json.dumps(attendance_aggregates.hello_event())}\n\n"
+            while not await request.is_disconnected():
+                try:
+                    yield await asyncio.wait_for(queue.get(), timeout=15)
+                except asyncio.TimeoutError:
+                    # Lewat tengah malam WIB tanpa absensi baru: kirim `rollover` lewat
+                    # antrean semua pelanggan (paling lambat satu interval keep-alive)
+                    attendance_aggregates.ensure_day()
+                    # Komentar keep-alive agar proxy tidak menutup koneksi yang diam
+                    yield ": ping\n\n"
+        finally:
+            attendance_aggregates.unsubscribe(queue)
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
 
 
 # --- Main Runner ---
@@ -0,0 +1,203 @@
+import sys
+import time
+import bisect
+import threading
+from pathlib import Path
+from collections import deque, Counter as StackCounter
+
+# Bucket latensi (detik): 1 ms sampai 10 detik
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _format_labels(labels: dict) -> str:
+    if not labels:
+        return ""
+    parts = ",".join('{}="{}"'.format(k, str(v).replace("\\", "\\\\").replace('"', '\\"')) for k, v in labels.items())
+    return "{" + parts + "}"
+
+
+def _format_value(value) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Counter Prometheus dengan label; nilai hanya bertambah."""
+
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, label_names=()):
+        self.name, self.help, self.label_names = name, help_text, tuple(label_names)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            items = list(self._values.items())
+        for label_values, value in items:
+            yield self.name, dict(zip(self.label_names, label_values)), value
+
+
+class Gauge:
+    """Gauge yang nilainya dibaca saat /metrics diminta, lewat fungsi `read`."""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, help_text: str, read, label_names=()):
+        self.name, self.help, self.label_names = name, help_text, tuple(label_names)
+        # read() mengembalikan angka, atau dict {tuple label: angka} jika ada label
+        self.read = read
+
+    def samples(self):
+        value = self.read()
+        if value is None:
+            return
+        items = value.items() if isinstance(value, dict) else [((), value)]
+        for label_values, v in items:
+            yield self.name, dict(zip(self.label_names, label_values)), v
+
+
+class Histogram:
+    """Histogram Prometheus (bucket kumulatif, _sum dan _count) dengan label."""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, buckets=LATENCY_BUCKETS, label_names=()):
+        self.name, self.help, self.label_names = name, help_text, tuple(label_names)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *label_values):
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][bisect.bisect_left(self.buckets, value)] += 1
+            series[1] += value
+            series[2] += 1
+
+    def samples(self):
+        with self._lock:
+            items = [(k, (list(v[0]), v[1], v[2])) for k, v in self._series.items()]
+        for label_values, (counts, total, count) in items:
+            labels = dict(zip(self.label_names, label_values))
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                yield f"{self.name}_bucket", {**labels, "le": le}, cumulative
+            yield f"{self.name}_sum", labels, total
+            yield f"{self.name}_count", labels, count
+
+
+class MetricsRegistry:
+    """Kumpulan metrik yang dirender ke format teks Prometheus untuk /metrics."""
+
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, *args, **kwargs) -> Counter:
+        return self.register(Counter(*args, **kwargs))
+
+    def gauge(self, *args, **kwargs) -> Gauge:
+        return self.register(Gauge(*args, **kwargs))
+
+    def histogram(self, *args, **kwargs) -> Histogram:
+        return self.register(Histogram(*args, **kwargs))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            try:
+                for name, labels, value in metric.samples():
+                    lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+            except Exception as e:
+                # Satu gauge yang gagal dibaca tidak boleh menggagalkan seluruh scrape
+                lines.append(f"# ERROR {metric.name}: {e}")
+        return "\n".join(lines) + "\n"
+
+
+class SlowRequestProfiler:
+    """
+    Profiler sampling untuk request lambat. Thread sampler mengambil stack
+    semua thread setiap `interval_ms` ke ring buffer. Ketika sebuah request
+    selesai lebih lama dari `threshold_ms`, sampel dalam rentang waktu request
+    itu digabung menjadi stack "folded" (format flamegraph) beserta jumlahnya.
+    Karena pipeline berjalan di beberapa thread (event loop, executor, penulis
+    SQLite), semua thread ikut disampel; nama thread menjadi frame pertama.
+    """
+
+    def __init__(self, threshold_ms: float, interval_ms: float = 10, window_s: float = 30, keep: int = 20,
+                 output_dir: Path = None, max_depth: int = 40):
+        self.threshold_ms = threshold_ms
+        self.interval = interval_ms / 1000
+        self.max_depth = max_depth
+        self.output_dir = Path(output_dir) if output_dir else None
+        self._samples = deque(maxlen=max(1, int(window_s / self.interval)))
+        self._reports = deque(maxlen=keep)
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="slow-request-profiler", daemon=True)
+
+    def start(self):
+        if self.output_dir:
+            self.output_dir.mkdir(parents=True, exist_ok=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join(timeout=2)
+
+    def _run(self):
+        own_id = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            now = time.monotonic()
+            names = {t.ident: t.name for t in threading.enumerate()}
+            stacks = []
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                # Frame dibaca langsung (tanpa traceback/linecache) agar sampling tetap murah
+                entries = []
+                while frame is not None and len(entries) < self.max_depth:
+                    entries.append((frame.f_code.co_filename, frame.f_code.co_name, frame.f_lineno))
+                    frame = frame.f_back
+                # Thread idle (menunggu lock/antrean) tidak menarik untuk dianalisis
+                if not entries or entries[0][1] in ("wait", "select", "_worker", "get", "_wait_for_tstate_lock"):
+                    continue
+                folded = ";".join(f"{Path(filename).name}:{name}:{lineno}" for filename, name, lineno in reversed(entries))
+                stacks.append(f"{names.get(thread_id, thread_id)};{folded}")
+            with self._lock:
+                self._samples.append((now, stacks))
+
+    def record(self, started: float, ended: float, info: dict):
+        """Dipanggil setelah request selesai (waktu dari time.monotonic())."""
+        duration_ms = (ended - started) * 1000
+        if duration_ms < self.threshold_ms:
+            return None
+        with self._lock:
+            window = [stacks for ts, stacks in self._samples if started <= ts <= ended]
+        counts = StackCounter(stack for stacks in window for stack in stacks)
+        report = {"at": time.strftime("%Y-%m-%dT%H:%M:%S"), "duration_ms": round(duration_ms, 1), "samples": len(window),
+                  **info, "top_stacks": [{"stack": s, "count": c} for s, c in counts.most_common(10)]}
+        with self._lock:
+            self._reports.append(report)
+        if self.output_dir:
+            path = self.output_dir / f"slow-{int(time.time() * 1000)}.folded"
+            path.write_text("".join(f"{s} {c}\n" for s, c in counts.items()))
+            report["folded_file"] = str(path)
+        return report
+
+    def reports(self) -> list:
+        with self._lock:
+            return list(self._reports)
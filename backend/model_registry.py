@@ -0,0 +1,100 @@
+import os
+import json
+import shutil
+import datetime
+from pathlib import Path
+
+
+class ModelRegistry:
+    """
+    Registry artefak model berversi di disk:
+
+        <root>/<versi>/face_index/          index embedding (EmbeddingIndex.save)
+        <root>/<versi>/audio_tracking.json  snapshot pemetaan nama -> track audio
+        <root>/<versi>/manifest.json        metadata rilis
+        <root>/CURRENT                      nama versi yang aktif
+
+    Training menulis versi baru sampai lengkap, baru kemudian CURRENT diganti
+    secara atomik (os.replace), jadi server tidak pernah membaca artefak
+    setengah jadi. Versi lama tetap ada untuk rollback sampai dipangkas.
+    """
+
+    CURRENT_FILE = "CURRENT"
+
+    def __init__(self, root: Path):
+        self.root = Path(root)
+
+    def path(self, version: str) -> Path:
+        return self.root / version
+
+    def versions(self) -> list:
+        """Versi yang sudah diaktifkan minimal sekali (punya manifest), terlama lebih dulu."""
+        if not self.root.is_dir():
+            return []
+        return sorted(p.name for p in self.root.iterdir() if (p / "manifest.json").exists())
+
+    def current_version(self):
+        try:
+            version = (self.root / self.CURRENT_FILE).read_text().strip()
+        except FileNotFoundError:
+            return None
+        return version if version and (self.path(version) / "manifest.json").exists() else None
+
+    def manifest(self, version: str) -> dict:
+        with open(self.path(version) / "manifest.json", "r") as f:
+            return json.load(f)
+
+    def create_version(self) -> tuple:
+        """Membuat folder kosong untuk versi baru. Mengembalikan (versi, path)."""
+        base = datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
+        version, suffix = base, 1
+        while self.path(version).exists():
+            suffix += 1
+            version = f"{base}-{suffix}"
+        self.path(version).mkdir(parents=True)
+        return version, self.path(version)
+
+    def activate(self, version: str, manifest: dict = None):
+        """Menulis manifest lalu menjadikan `version` aktif dengan mengganti CURRENT secara atomik."""
+        manifest = {"version": version, "created_at": datetime.datetime.now().isoformat(), **(manifest or {})}
+        with open(self.path(version) / "manifest.json", "w") as f:
+            json.dump(manifest, f, indent=2)
+        tmp_path = self.root / f"{self.CURRENT_FILE}.tmp"
+        tmp_path.write_text(version)
+        os.replace(tmp_path, self.root / self.CURRENT_FILE)
+
+    def discard(self, version: str):
+        """Menghapus versi yang gagal dibuat (belum pernah diaktifkan)."""
+        shutil.rmtree(self.path(version), ignore_errors=True)
+
+    def prune(self, keep: int = 3) -> list:
+        """Menghapus versi terlama, menyisakan `keep` versi terbaru dan versi aktif."""
+        current = self.current_version()
+        old = [v for v in self.versions()[:-keep] if v != current] if keep > 0 else []
+        for version in old:
+            shutil.rmtree(self.path(version), ignore_errors=True)
+        return old
+
+
+class ModelBundle:
+    """
+    Satu set artefak yang dipakai jalur /recognize: index embedding, pemetaan
+    audio, cache klip duplikat dan data intern. Server memegang satu bundle
+    aktif dan menggantinya sebagai satu referensi, sehingga request yang sedang
+    berjalan tetap memakai bundle lama sampai selesai.
+    """
+
+    def __init__(self, version, face_index, audio_tracking, duplicate_audio, interns, load_ms):
+        self.version = version
+        self.face_index = face_index
+        self.audio_tracking = audio_tracking
+        self.duplicate_audio = duplicate_audio
+        self.interns = interns
+        self.load_ms = load_ms
+        self.loaded_at = datetime.datetime.now().isoformat()
+
+    def info(self) -> dict:
+        return {"version": self.version, "loaded_at": self.loaded_at, "load_ms": self.load_ms,
+                "vectors": len(self.face_index), "persons": len(self.face_index.names),
+                "mode": self.face_index.mode, "dtype": self.face_index.dtype,
+                "index_bytes": self.face_index.nbytes, "interns": len(self.interns)}
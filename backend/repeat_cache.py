@@ -0,0 +1,105 @@
+import time
+import threading
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+
+
+def frame_dhash(frame_bytes: bytes):
+    """
+    Difference hash 64-bit dari frame JPEG. Decode memakai skala 1/8 dan
+    grayscale (IMREAD_REDUCED_GRAYSCALE_8) sehingga jauh lebih murah dari
+    decode penuh. Mengembalikan None jika bytes kosong atau bukan gambar.
+    """
+    # imdecode pada buffer kosong memicu assertion OpenCV, bukan None
+    if not frame_bytes:
+        return None
+    gray = cv2.imdecode(np.frombuffer(frame_bytes, np.uint8), cv2.IMREAD_REDUCED_GRAYSCALE_8)
+    if gray is None or gray.size == 0:
+        return None
+    small = cv2.resize(gray, (9, 8), interpolation=cv2.INTER_AREA)
+    bits = (small[:, 1:] > small[:, :-1]).ravel()
+    return int(np.packbits(bits).view(">u8")[0])
+
+
+class RepeatFrameCache:
+    """
+    Cache hasil pengenalan jangka pendek per kiosk untuk frame yang berulang
+    (tombol ditekan berkali-kali, orang masih berdiri di depan kamera).
+
+    Pencarian pertama memakai dHash frame (jarak Hamming <= `max_hamming`),
+    sebelum decode penuh dan deteksi wajah. Jika meleset, pencarian kedua
+    memakai embedding (jarak cosine <= `max_distance`) setelah inferensi,
+    sebelum pengecekan duplikat dan database. Entri kedaluwarsa setelah
+    `ttl` detik, jumlahnya dibatasi `max_entries` (LRU), dan seluruh cache
+    dikosongkan jika tanggal atau versi model berubah.
+    """
+
+    def __init__(self, ttl: float = 15, max_entries: int = 256, max_hamming: int = 6, max_distance: float = 0.1):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_hamming = max_hamming
+        self.max_distance = max_distance
+        self._entries = OrderedDict()
+        self._generation = None
+        self._next_id = 0
+        self._lock = threading.Lock()
+
+    def _sync_locked(self, generation):
+        if generation != self._generation:
+            # Hari baru (absensi kemarin tidak berlaku) atau model baru (embedding & nama bisa berubah)
+            self._entries.clear()
+            self._generation = generation
+
+    def _live_locked(self, kiosk):
+        now = time.monotonic()
+        for entry_id, entry in list(self._entries.items()):
+            if now - entry["at"] > self.ttl:
+                del self._entries[entry_id]
+            elif entry["kiosk"] == kiosk:
+                yield entry_id, entry
+
+    def lookup_hash(self, kiosk, dhash, generation):
+        """Entri untuk frame yang hampir identik dari kiosk yang sama, atau None."""
+        if dhash is None:
+            return None
+        with self._lock:
+            self._sync_locked(generation)
+            for entry_id, entry in self._live_locked(kiosk):
+                if entry["dhash"] is not None and bin(entry["dhash"] ^ dhash).count("1") <= self.max_hamming:
+                    self._entries.move_to_end(entry_id)
+                    return entry
+        return None
+
+    def lookup_embedding(self, kiosk, embedding, generation):
+        """Entri dengan embedding yang hampir sama dari kiosk yang sama, atau None."""
+        if embedding is None:
+            return None
+        query = np.asarray(embedding, dtype=np.float32).ravel()
+        query = query / (np.linalg.norm(query) or 1.0)
+        with self._lock:
+            self._sync_locked(generation)
+            for entry_id, entry in self._live_locked(kiosk):
+                if entry["embedding"] is not None and 1.0 - float(np.dot(entry["embedding"], query)) <= self.max_distance:
+                    self._entries.move_to_end(entry_id)
+                    return entry
+        return None
+
+    def store(self, kiosk, dhash, embedding, person_name, generation):
+        """Menyimpan hasil pengenalan (person_name atau "unknown") untuk frame ini."""
+        vector = None
+        if embedding is not None:
+            vector = np.asarray(embedding, dtype=np.float32).ravel()
+            vector = vector / (np.linalg.norm(vector) or 1.0)
+        with self._lock:
+            self._sync_locked(generation)
+            self._next_id += 1
+            self._entries[self._next_id] = {"kiosk": kiosk, "dhash": dhash, "embedding": vector,
+                                            "person_name": person_name, "at": time.monotonic()}
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
@@ -1,19 +1,24 @@
 import os
 import sys
+import time
 import numpy as np
-import joblib
 import json
 import csv
+import shutil
 import sqlite3
 from pathlib import Path
-from sklearn.neighbors import KNeighborsClassifier
-from sklearn.preprocessing import LabelEncoder
 from gtts import gTTS
 
 # --- Konfigurasi ---
 PROJECT_ROOT = Path(__file__).resolve().parent.parent
 sys.path.insert(0, str(PROJECT_ROOT))
-from backend.utils import extract_face_features
+from backend.utils import MODEL_NAME
+from backend.face_index import EmbeddingIndex
+from backend.embedding_cache import EmbeddingCache, file_hash
+from backend.dataset_embedding import embed_images, OK, FAILED
+from backend.audio_cache import render_duplicate_clips
+from backend.database import migrate_schema
+from backend.model_registry import ModelRegistry
 
 DATASET_DIR = PROJECT_ROOT / "data" / "dataset"
 MODEL_DIR = PROJECT_ROOT / "backend" / "model"
@@ -21,6 +26,17 @@ AUDIO_FILES_DIR = PROJECT_ROOT / "backend" / "generated_audio"
 DB_PATH = PROJECT_ROOT / "backend" / "attendance.db"
 INTERNS_CSV_PATH = PROJECT_ROOT / "interns.csv"
 AUDIO_TRACKING_FILE = PROJECT_ROOT / "backend" / "audio_tracking.json"
+MODEL_REGISTRY_DIR = MODEL_DIR / "registry"
+# Jumlah versi model yang disimpan di registry (untuk rollback)
+MODEL_KEEP_VERSIONS = int(os.getenv("MODEL_KEEP_VERSIONS", "3"))
+EMBEDDING_CACHE_PATH = MODEL_DIR / "embedding_cache.db"
+# "samples" = satu vektor per foto, "centroid" = satu vektor rata-rata per orang
+INDEX_MODE = os.getenv("INDEX_MODE", "samples")
+# Tipe penyimpanan index: float32, float16 atau int8 (ukur dulu dengan benchmarks/index_quantization.py)
+INDEX_DTYPE = os.getenv("INDEX_DTYPE", "float32")
+# Jumlah proses ekstraksi paralel (default: jumlah core) dan ukuran batch ArcFace
+TRAIN_WORKERS = int(os.getenv("TRAIN_WORKERS", str(os.cpu_count() or 1)))
+TRAIN_BATCH_SIZE = int(os.getenv("TRAIN_BATCH_SIZE", "8"))
 
 # --- FUNGSI DATABASE (Tidak ada perubahan) ---
 def create_or_update_local_db():
@@ -31,9 +47,8 @@ def create_or_update_local_db():
         with open(INTERNS_CSV_PATH, mode='r', encoding='utf-8') as f:
             local_data = {row['name']: row for row in csv.DictReader(f)}
         conn = sqlite3.connect(DB_PATH)
+        migrate_schema(conn)
         cursor = conn.cursor()
-        cursor.execute("CREATE TABLE IF NOT EXISTS interns (id INTEGER PRIMARY KEY, name TEXT UNIQUE, universitas TEXT, kategori TEXT)")
-        cursor.execute("CREATE TABLE IF NOT EXISTS attendance_logs (id INTEGER PRIMARY KEY, intern_id INTEGER, intern_name TEXT, universitas TEXT, kategori TEXT, image_url TEXT, absent_at TEXT)")
         cursor.execute("SELECT name FROM interns")
         db_names = {row[0] for row in cursor.fetchall()}
         new_names = set(local_data.keys()) - db_names
@@ -95,48 +110,107 @@ def generate_all_audio_files(labels):
             print("   ✅ Semua file audio nama sudah lengkap.")
     except Exception as e:
         print(f"   ❌ Gagal membuat audio per nama: {e}. Pastikan terkoneksi internet.")
+        return
 
-# --- FUNGSI TRAINING (Tidak ada perubahan) ---
-def train_model_full():
-    print("\n🧠 Memulai proses training penuh dengan DeepFace...")
-    embeddings, labels = [], []
+    # 3. Buat Audio Duplikat per Nama (D<track>.mp3), diputar saat absen ganda
+    print("\n   🔁 Membuat audio duplikat per nama...")
+    if not render_duplicate_clips(AUDIO_FILES_DIR, {label: audio_tracking[label] for label in labels}):
+        print("   ✅ Semua file audio duplikat sudah lengkap.")
+
+# --- FUNGSI TRAINING (Incremental dengan cache embedding per gambar) ---
+def list_dataset_images():
+    """Mengembalikan list (nama orang, path gambar) dari seluruh dataset."""
+    images = []
     for person_dir in sorted(DATASET_DIR.iterdir()):
         if not person_dir.is_dir(): continue
-        person_name = person_dir.name
-        img_count = 0
-        for img_path in person_dir.glob("*.jpg"):
-            emb_list = extract_face_features(str(img_path))
-            if emb_list:
-                embeddings.extend(emb_list)
-                labels.extend([person_name] * len(emb_list))
-                img_count += len(emb_list)
+        images.extend((person_dir.name, img_path) for img_path in sorted(person_dir.glob("*.jpg")))
+    return images
+
+def train_model_full(index_dir, use_cache=True):
+    print("\n🧠 Memulai proses training dengan DeepFace...")
+    images = list_dataset_images()
+    hashes = [file_hash(img_path) for _, img_path in images]
+
+    MODEL_DIR.mkdir(exist_ok=True)
+    cache = EmbeddingCache(EMBEDDING_CACHE_PATH, MODEL_NAME)
+    try:
+        cached = cache.get_many(hashes) if use_cache else {}
+        # Hanya gambar baru atau yang isinya berubah yang perlu diekstrak ulang
+        to_extract = [(h, img_path) for h, (_, img_path) in zip(hashes, images) if h not in cached]
+        print(f"   ♻️  {len(images) - len(to_extract)} gambar dari cache, {len(to_extract)} gambar perlu diekstrak.")
+
+        started = time.perf_counter()
+        results = embed_images(to_extract, workers=TRAIN_WORKERS, batch_size=TRAIN_BATCH_SIZE)
+        new_entries, status_counts, failures = [], {}, []
+        for h, img_path, embedding, status, error in results:
+            status_counts[status] = status_counts.get(status, 0) + 1
+            if status != OK: failures.append((img_path, status, error))
+            # Error tak terduga tidak disimpan ke cache agar dicoba lagi di training berikutnya
+            if status == FAILED: continue
+            cached[h] = embedding
+            new_entries.append((h, img_path, embedding))
+        cache.put_many(new_entries)
+        if to_extract:
+            elapsed = time.perf_counter() - started
+            print(f"   📊 Ekstraksi {len(to_extract)} gambar dalam {elapsed:.1f} detik "
+                  f"({len(to_extract) / elapsed:.1f} gambar/detik, {TRAIN_WORKERS} worker): {status_counts}")
+            for img_path, status, error in failures[:20]:
+                print(f"      ⚠️  {img_path.relative_to(DATASET_DIR)}: {status}{f' ({error})' if error else ''}")
+            if len(failures) > 20: print(f"      ... dan {len(failures) - 20} gambar lainnya.")
+        removed = cache.prune(hashes)
+        if removed: print(f"   🗑️  {removed} entri cache untuk gambar yang sudah dihapus dibersihkan.")
+    finally:
+        cache.close()
+
+    embeddings, labels, counts = [], [], {}
+    for (person_name, _), h in zip(images, hashes):
+        counts.setdefault(person_name, 0)
+        if cached.get(h) is not None:
+            embeddings.append(cached[h])
+            labels.append(person_name)
+            counts[person_name] += 1
+    for person_name, img_count in counts.items():
         print(f"   👤 {person_name}: {img_count} wajah diekstrak.")
     if not embeddings:
         print("\n❌ Tidak ada wajah yang berhasil diekstrak!"); return False, []
     
-    embeddings, labels = np.array(embeddings), np.array(labels)
-    label_encoder = LabelEncoder().fit(labels)
-    print(f"\nDEBUG [Training]: LabelEncoder dilatih dengan kelas -> {list(label_encoder.classes_)}\n")
-    knn = KNeighborsClassifier(n_neighbors=1, metric='cosine').fit(embeddings, label_encoder.transform(labels))
-    MODEL_DIR.mkdir(exist_ok=True)
-    joblib.dump(knn, MODEL_DIR / "knn_model.pkl")
-    joblib.dump(label_encoder, MODEL_DIR / "label_encoder.pkl")
-    print(f"\n✅ Training selesai! Model disimpan."); return True, set(labels)
+    index = EmbeddingIndex.build(np.array(embeddings, dtype=np.float32), labels, mode=INDEX_MODE, model_name=MODEL_NAME, dtype=INDEX_DTYPE)
+    print(f"\nDEBUG [Training]: Index dibangun dengan kelas -> {index.names}\n")
+    index.save(index_dir)
+    print(f"\n✅ Training selesai! Index ({index.mode}, {index.dtype}, {len(index)} vektor, {index.nbytes / 1024:.0f} KB) disimpan."); return True, set(labels)
+
+def publish_release(registry, version, unique_labels):
+    """Melengkapi versi baru dengan snapshot audio lalu menjadikannya aktif di registry."""
+    release_dir = registry.path(version)
+    shutil.copy(AUDIO_TRACKING_FILE, release_dir / "audio_tracking.json")
+    registry.activate(version, {"model_name": MODEL_NAME, "index_mode": INDEX_MODE, "index_dtype": INDEX_DTYPE,
+                                "persons": len(unique_labels)})
+    removed = registry.prune(keep=MODEL_KEEP_VERSIONS)
+    print(f"📦 Model versi {version} diaktifkan; server memuatnya otomatis atau lewat /api/admin/reload-model.")
+    if removed: print(f"   🗑️  Versi lama dihapus: {', '.join(removed)}")
 
 # --- FUNGSI UTAMA (Panggil fungsi audio yang baru) ---
 def main():
     print("="*50); print("🤖 SCRIPT TRAINING (ENGINE: DEEPFACE)"); print("="*50)
     if not DATASET_DIR.is_dir():
         print(f"❌ Dataset tidak ditemukan."); return
+    # '--full' mengabaikan cache dan mengekstrak ulang seluruh dataset
+    use_cache = "--full" not in sys.argv[1:]
+    # Artefak ditulis ke versi baru; server baru melihatnya setelah semuanya lengkap
+    registry = ModelRegistry(MODEL_REGISTRY_DIR)
+    version, release_dir = registry.create_version()
     try:
-        success, unique_labels = train_model_full()
+        success, unique_labels = train_model_full(release_dir / "face_index", use_cache=use_cache)
         if success:
             generate_all_audio_files(unique_labels) # <-- Panggil fungsi audio yang baru
             create_or_update_local_db()
+            publish_release(registry, version, unique_labels)
             print("\n🎉 Semua proses (Training, Audio, & DB) selesai!")
         else:
+            registry.discard(version)
             print("\n❌ Proses training gagal.")
     except Exception as e:
+        registry.discard(version)
         print(f"\n❌ Terjadi error tak terduga: {e}")
 
 if __name__ == "__main__":
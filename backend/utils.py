@@ -1,34 +1,116 @@
 from deepface import DeepFace
+import os
+import time
+import threading
+from pathlib import Path
 import cv2
 import numpy as np
 
 # ArcFace adalah salah satu model paling akurat saat ini 
 # dan lebih tangguh dalam menghadapi variasi seperti kacamata.
 MODEL_NAME = "ArcFace"
+DETECTOR_BACKEND = "retinaface"
 
-def extract_face_features(image_path_or_array):
+# Kaskade deteksi sebelum RetinaFace:
+#   "off"   : RetinaFace pada frame penuh (perilaku lama)
+#   "haar"  : Haar cascade hanya menentukan ROI; RetinaFace berjalan pada
+#             potongan ROI untuk alignment. Jika Haar tidak menemukan wajah
+#             (atau RetinaFace tidak menemukan wajah di ROI), RetinaFace tetap
+#             berjalan pada frame penuh: Haar melewatkan banyak wajah valid
+#             (6/16 captured_images, 38/133 foto dataset), jadi tidak boleh
+#             menjadi penolak
+#   "yunet" : sama seperti "haar" tetapi memakai YuNet (cv2.FaceDetectorYN);
+#             jatuh kembali ke Haar jika file model ONNX-nya tidak ada
+DETECTOR_CASCADE = os.getenv("DETECTOR_CASCADE", "haar")
+# Margin ROI relatif terhadap sisi kotak wajah, agar RetinaFace tetap melihat dagu & dahi
+CASCADE_ROI_MARGIN = float(os.getenv("CASCADE_ROI_MARGIN", 0.5))
+YUNET_MODEL_PATH = Path(os.getenv("YUNET_MODEL_PATH", Path(__file__).resolve().parent / "model" / "face_detection_yunet_2023mar.onnx"))
+
+def is_detected_face(obj: dict) -> bool:
+    """
+    Dengan enforce_detection=False, DeepFace mengembalikan region seluruh
+    gambar (face_confidence 0, tanpa posisi mata) jika tidak ada wajah.
+    Region seperti itu bukan wajah dan embedding-nya tidak bermakna.
+    """
+    return obj["facial_area"]["w"] != 0 and obj.get("face_confidence", 0) > 0
+
+def preload_models():
+    """
+    Memuat bobot model pengenal (ArcFace) dan detektor (RetinaFace) ke memori.
+    DeepFace menyimpan model yang sudah dibangun di cache internalnya,
+    sehingga pemanggilan represent() berikutnya tidak perlu memuat ulang.
+    """
+    DeepFace.build_model(model_name=MODEL_NAME, task="facial_recognition")
+    DeepFace.build_model(model_name=DETECTOR_BACKEND, task="face_detector")
+
+def warmup_models():
+    """
+    Memuat model lalu menjalankan satu inferensi dummy agar graf TensorFlow
+    sudah ter-trace sebelum request pertama datang.
+
+    Returns:
+        dict: durasi (ms) tiap tahap pemuatan.
+    """
+    timings = {}
+    start = time.perf_counter()
+    DeepFace.build_model(model_name=MODEL_NAME, task="facial_recognition")
+    timings["load_recognizer_ms"] = round((time.perf_counter() - start) * 1000, 1)
+
+    start = time.perf_counter()
+    DeepFace.build_model(model_name=DETECTOR_BACKEND, task="face_detector")
+    timings["load_detector_ms"] = round((time.perf_counter() - start) * 1000, 1)
+
+    # Gambar abu-abu polos: detektor dan ArcFace tetap berjalan penuh sekali
+    start = time.perf_counter()
+    # (kaskade dimatikan: cukup satu kali RetinaFace pada frame penuh)
+    dummy = np.full((224, 224, 3), 128, dtype=np.uint8)
+    extract_face_features(dummy, cascade="off")
+    fast_detect(dummy, DETECTOR_CASCADE)
+    timings["warmup_inference_ms"] = round((time.perf_counter() - start) * 1000, 1)
+    return timings
+
+def extract_face_features(image_path_or_array, cascade: str = None, timings: dict = None, raise_errors: bool = False):
     """
     Mengekstrak fitur wajah (embedding) dari sebuah gambar menggunakan DeepFace.
     Fungsi ini bisa menerima path file (string) atau gambar dalam bentuk array numpy.
 
+    Args:
+        cascade: mode kaskade deteksi (lihat DETECTOR_CASCADE); None = default.
+        timings: dict opsional untuk durasi (ms) tahap `detect_fast` dan `embed`.
+        raise_errors: teruskan error DeepFace alih-alih mengembalikan None,
+                      agar pemanggil bisa membedakan "gagal" dari "tanpa wajah".
+
     Returns:
         list: Sebuah list berisi satu embedding jika wajah terdeteksi, 
               atau None jika tidak ada wajah.
     """
+    timings = {} if timings is None else timings
+    roi = cascade_roi(image_path_or_array, cascade, timings)
+    start = time.perf_counter()
     try:
         # DeepFace.represent() adalah fungsi inti untuk mengubah wajah menjadi angka.
         # 'enforce_detection=False' memastikan program tidak error jika tidak ada wajah,
         # melainkan mengembalikan hasil yang bisa kita periksa.
         embedding_objs = DeepFace.represent(
-            img_path=image_path_or_array, 
+            img_path=roi, 
             model_name=MODEL_NAME, 
             enforce_detection=False,
-            detector_backend='retinaface' # Menggunakan backend deteksi yang cepat
+            detector_backend=DETECTOR_BACKEND # RetinaFace untuk deteksi akhir & alignment
         )
 
+        # ROI dari detektor cepat bisa salah (false positive); coba frame penuh
+        if not embedding_objs or not is_detected_face(embedding_objs[0]):
+            if roi is not image_path_or_array:
+                embedding_objs = DeepFace.represent(
+                    img_path=image_path_or_array,
+                    model_name=MODEL_NAME,
+                    enforce_detection=False,
+                    detector_backend=DETECTOR_BACKEND
+                )
+
         # Hasilnya adalah list, karena satu gambar bisa punya banyak wajah.
         # Kita periksa apakah ada hasil dan apakah wajah benar-benar terdeteksi.
-        if not embedding_objs or embedding_objs[0]["facial_area"]["w"] == 0:
+        if not embedding_objs or not is_detected_face(embedding_objs[0]):
             # print(f"Wajah tidak terdeteksi di {image_path_or_array}")
             return None
 
@@ -42,12 +124,226 @@ def extract_face_features(image_path_or_array):
     except Exception as e:
         # Terkadang DeepFace bisa error jika file gambar rusak, dll.
         # print(f"Error saat mengekstrak fitur: {e}")
+        if raise_errors:
+            raise
         return None
+    finally:
+        timings["embed"] = round((time.perf_counter() - start) * 1000, 2)
+
+def extract_face_features_batch(images, cascade: str = None, timings: dict = None, return_errors: bool = False):
+    """
+    Versi batch dari extract_face_features untuk banyak gambar sekaligus.
+    Detektor cepat memotong ROI wajah lebih dulu (frame tanpa ROI dikirim
+    utuh), lalu semuanya dikirim ke DeepFace dalam satu panggilan. Deteksi
+    RetinaFace tetap per gambar, tetapi ArcFace dijalankan sebagai satu
+    forward pass untuk seluruh wajah di dalam batch.
+
+    Args:
+        cascade: satu mode kaskade untuk semua gambar, atau list satu mode per gambar.
+        return_errors: gambar yang gagal diproses (bukan karena tanpa wajah)
+                       berisi objek Exception-nya, bukan None.
+
+    Returns:
+        list: Satu elemen per gambar input, formatnya sama dengan
+              extract_face_features ([embedding] atau None), atau Exception
+              jika return_errors aktif.
+    """
+    images = list(images)
+    timings = {} if timings is None else timings
+    cascades = cascade if isinstance(cascade, (list, tuple)) else [cascade] * len(images)
+    rois = [cascade_roi(img, mode, timings, accumulate=True) for img, mode in zip(images, cascades)]
+    features = [None] * len(images)
+    candidates = list(range(len(images)))
+    if not candidates:
+        return features
+
+    start = time.perf_counter()
+    try:
+        results = DeepFace.represent(
+            img_path=[rois[i] for i in candidates],
+            model_name=MODEL_NAME,
+            enforce_detection=False,
+            detector_backend=DETECTOR_BACKEND
+        )
+    except Exception:
+        # Jika satu gambar di batch bermasalah, seluruh batch gagal.
+        # Jatuh kembali ke jalur per gambar agar gambar lain tetap diproses.
+        for i in candidates:
+            try:
+                features[i] = extract_face_features(images[i], cascade=cascades[i], raise_errors=return_errors)
+            except Exception as e:
+                features[i] = e
+        timings["embed"] = round((time.perf_counter() - start) * 1000, 2)
+        return features
+    timings["embed"] = round((time.perf_counter() - start) * 1000, 2)
+
+    # Untuk batch berisi satu gambar DeepFace bisa mengembalikan list datar.
+    if results and isinstance(results[0], dict):
+        results = [results]
+
+    for i, embedding_objs in zip(candidates, results):
+        if embedding_objs and is_detected_face(embedding_objs[0]):
+            features[i] = [embedding_objs[0]["embedding"]]
 
-def detect_face(frame: np.ndarray):
+    # ROI yang tidak berisi wajah menurut RetinaFace: ulangi pada frame penuh
+    retry = [i for i in candidates if features[i] is None and rois[i] is not images[i]]
+    if retry:
+        start = time.perf_counter()
+        for i, feature in zip(retry, extract_face_features_batch([images[i] for i in retry], cascade="off",
+                                                                 return_errors=return_errors)):
+            features[i] = feature
+        timings["embed"] = round(timings["embed"] + (time.perf_counter() - start) * 1000, 2)
+    return features
+
+def extract_all_face_features(image: np.ndarray, timings: dict = None,
+                              min_face: int = 0, max_faces: int = 0):
+    """
+    Mengekstrak embedding untuk SEMUA wajah di dalam frame (mode grup).
+    RetinaFace berjalan sekali pada frame penuh dan ArcFace menghitung
+    embedding setiap wajah yang ditemukannya. Detektor cepat tidak dipakai
+    sebagai gerbang karena sering melewatkan wajah yang valid.
+
+    Args:
+        min_face: sisi terpendek kotak wajah (px) minimal; wajah yang lebih kecil
+                  (mis. orang jauh di belakang antrean) diabaikan.
+        max_faces: batas jumlah wajah terbesar yang diproses (0 = tanpa batas).
+
+    Returns:
+        list: dict {"embedding", "box": (x, y, w, h), "confidence", "left_eye",
+              "right_eye"} per wajah (posisi mata bisa None),
+              diurutkan dari wajah terbesar. List kosong jika tidak ada wajah.
+    """
+    timings = {} if timings is None else timings
+    start = time.perf_counter()
+    try:
+        embedding_objs = DeepFace.represent(
+            img_path=image,
+            model_name=MODEL_NAME,
+            enforce_detection=False,
+            detector_backend=DETECTOR_BACKEND
+        )
+    except Exception:
+        return []
+    finally:
+        timings["embed"] = round((time.perf_counter() - start) * 1000, 2)
+
+    faces = []
+    for obj in embedding_objs or []:
+        area = obj["facial_area"]
+        if not is_detected_face(obj) or min(area["w"], area["h"]) < min_face:
+            continue
+        faces.append({"embedding": obj["embedding"], "box": (int(area["x"]), int(area["y"]), int(area["w"]), int(area["h"])),
+                      "confidence": float(obj.get("face_confidence", 0)),
+                      "left_eye": area.get("left_eye"), "right_eye": area.get("right_eye")})
+    faces.sort(key=lambda f: f["box"][2] * f["box"][3], reverse=True)
+    return faces[:max_faces] if max_faces > 0 else faces
+
+def cascade_roi(image, cascade: str = None, timings: dict = None, accumulate: bool = False):
+    """
+    Tahap pertama kaskade: detektor cepat pada frame, lalu potong ROI wajah
+    terbesar beserta marginnya.
+
+    Returns:
+        Gambar (atau path) yang diteruskan ke RetinaFace. Frame dikembalikan
+        utuh jika detektor cepat tidak menemukan wajah, pada mode "off", dan
+        untuk input berupa path.
+    """
+    cascade = cascade or DETECTOR_CASCADE
+    if cascade == "off" or not isinstance(image, np.ndarray):
+        return image
+    start = time.perf_counter()
+    try:
+        boxes = fast_detect(image, cascade)
+        return crop_face_roi(image, boxes[0], CASCADE_ROI_MARGIN) if boxes else image
+    finally:
+        if timings is not None:
+            elapsed = round((time.perf_counter() - start) * 1000, 2)
+            timings["detect_fast"] = round(timings.get("detect_fast", 0) + elapsed, 2) if accumulate else elapsed
+
+def fast_detect(frame: np.ndarray, cascade: str = "haar", max_side: int = 320):
+    """Detektor cepat sesuai mode kaskade; hasilnya sama dengan detect_face()."""
+    if cascade == "yunet":
+        return detect_face_yunet(frame, max_side=max_side)
+    return detect_face(frame, max_side=max_side)
+
+def crop_face_roi(frame: np.ndarray, box, margin: float) -> np.ndarray:
+    """Memotong kotak (x, y, w, h) yang diperbesar `margin` di setiap sisi, dibatasi tepi frame."""
+    x, y, w, h = box
+    pad_x, pad_y = int(w * margin), int(h * margin)
+    height, width = frame.shape[:2]
+    x0, y0 = max(0, x - pad_x), max(0, y - pad_y)
+    x1, y1 = min(width, x + w + pad_x), min(height, y + h + pad_y)
+    return frame[y0:y1, x0:x1]
+
+# Detektor Haar bawaan OpenCV: jauh kurang akurat dari RetinaFace, tetapi cukup
+# murah (beberapa ms di CPU) untuk menyaring frame tanpa wajah.
+_HAAR_CASCADE = None
+_haar_lock = threading.Lock()
+
+def _get_haar_cascade():
+    global _HAAR_CASCADE
+    with _haar_lock:
+        if _HAAR_CASCADE is None:
+            _HAAR_CASCADE = cv2.CascadeClassifier(cv2.data.haarcascades + "haarcascade_frontalface_default.xml")
+        return _HAAR_CASCADE
+
+def detect_face(frame: np.ndarray, max_side: int = 320):
     """
-    Fungsi ini sekarang hanya sebagai placeholder. 
-    DeepFace menangani deteksi wajahnya sendiri di dalam `represent()`.
-    Kita tetap menyimpannya agar struktur kode kita mirip dengan sebelumnya.
+    Deteksi wajah cepat (Haar cascade) pada versi frame yang diperkecil.
+
+    Returns:
+        list: kotak wajah (x, y, w, h) dalam koordinat frame asli,
+              diurutkan dari yang terbesar. List kosong jika tidak ada wajah.
     """
-    return frame
\ No newline at end of file
+    if frame is None or frame.size == 0:
+        return []
+    height, width = frame.shape[:2]
+    scale = min(1.0, max_side / max(height, width))
+    small = cv2.resize(frame, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA) if scale < 1.0 else frame
+    gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY) if small.ndim == 3 else small
+    gray = cv2.equalizeHist(gray)
+    # CascadeClassifier tidak aman dipakai bersamaan dari banyak thread
+    cascade = _get_haar_cascade()
+    with _haar_lock:
+        boxes = cascade.detectMultiScale(gray, scaleFactor=1.15, minNeighbors=5, minSize=(24, 24))
+    boxes = [tuple(int(round(v / scale)) for v in box) for box in boxes]
+    return sorted(boxes, key=lambda b: b[2] * b[3], reverse=True)
+
+# YuNet (OpenCV Zoo) lebih tahan pose & cahaya dibanding Haar dengan biaya yang mirip.
+# Modelnya tidak disertakan di repo; unduh face_detection_yunet_2023mar.onnx ke YUNET_MODEL_PATH.
+_YUNET = None
+_yunet_lock = threading.Lock()
+
+def _get_yunet():
+    global _YUNET
+    with _yunet_lock:
+        if _YUNET is None:
+            if YUNET_MODEL_PATH.exists() and hasattr(cv2, "FaceDetectorYN"):
+                _YUNET = cv2.FaceDetectorYN.create(str(YUNET_MODEL_PATH), "", (320, 320), 0.7, 0.3, 50)
+            else:
+                print(f"⚠️ Model YuNet tidak ditemukan di {YUNET_MODEL_PATH}, kaskade memakai Haar.")
+                _YUNET = False
+        return _YUNET
+
+def detect_face_yunet(frame: np.ndarray, max_side: int = 320):
+    """Seperti detect_face(), tetapi memakai YuNet. Jatuh kembali ke Haar jika model tidak tersedia."""
+    detector = _get_yunet()
+    if not detector:
+        return detect_face(frame, max_side)
+    if frame is None or frame.size == 0:
+        return []
+    height, width = frame.shape[:2]
+    scale = min(1.0, max_side / max(height, width))
+    small = cv2.resize(frame, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA) if scale < 1.0 else frame
+    with _yunet_lock:
+        detector.setInputSize((small.shape[1], small.shape[0]))
+        _, faces = detector.detect(small)
+    if faces is None:
+        return []
+    boxes = [tuple(int(round(v / scale)) for v in face[:4]) for face in faces]
+    return sorted(boxes, key=lambda b: b[2] * b[3], reverse=True)
+
+def laplacian_variance(image: np.ndarray) -> float:
+    """Ukuran ketajaman: variansi Laplacian. Semakin kecil, semakin blur."""
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim == 3 else image
+    return float(cv2.Laplacian(gray, cv2.CV_64F).var())
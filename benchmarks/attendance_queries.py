@@ -0,0 +1,107 @@
+"""
+Benchmark query dashboard absensi pada data sintetis.
+
+Membuat database sementara berisi N baris log (beberapa ukuran), lalu
+membandingkan query lama (date(absent_at), full scan) dengan query baru
+(absent_date ber-index). Jalankan dari root proyek:
+
+    python -m benchmarks.attendance_queries --sizes 10000 100000 1000000
+"""
+import sys
+import time
+import random
+import sqlite3
+import argparse
+import tempfile
+import datetime
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+from backend.database import migrate_schema, attendance_time_columns, CONNECTION_PRAGMAS
+
+WIB = datetime.timezone(datetime.timedelta(hours=7))
+
+LEGACY_QUERIES = {
+    "today_active": ("SELECT intern_name, universitas, kategori, absent_at, image_url, intern_id FROM attendance_logs "
+                     "WHERE date(absent_at) = ? ORDER BY absent_at DESC", True),
+    "summary": ("SELECT COUNT(id) FROM attendance_logs WHERE date(absent_at) = ?", True),
+    "start_date": ("SELECT MIN(date(absent_at)) FROM attendance_logs", False),
+    "distinct_dates": ("SELECT DISTINCT date(absent_at) FROM attendance_logs", False),
+}
+
+NEW_QUERIES = {
+    "today_active": ("SELECT intern_name, universitas, kategori, absent_at, image_url, intern_id FROM attendance_logs "
+                     "WHERE absent_date = ? ORDER BY absent_ts DESC", True),
+    "summary": ("SELECT COUNT(*) FROM attendance_logs WHERE absent_date = ?", True),
+    "start_date": ("SELECT MIN(absent_date) FROM attendance_logs", False),
+    "distinct_dates": ("""
+        WITH RECURSIVE days(d) AS (
+            SELECT MIN(absent_date) FROM attendance_logs
+            UNION ALL
+            SELECT (SELECT MIN(absent_date) FROM attendance_logs WHERE absent_date > days.d) FROM days WHERE days.d IS NOT NULL
+        ) SELECT d FROM days WHERE d IS NOT NULL""", False),
+}
+
+
+def generate_logs(conn, rows, interns=300, seed=42):
+    """Mengisi attendance_logs dengan `rows` baris: `interns` orang per hari, mundur dari hari ini."""
+    rng = random.Random(seed)
+    today = datetime.datetime.now(WIB).replace(hour=0, minute=0, second=0, microsecond=0)
+    conn.executemany("INSERT OR IGNORE INTO interns (id, name, universitas, kategori) VALUES (?, ?, ?, ?)",
+                     [(i, f"Intern {i}", f"Universitas {i % 20}", "Mahasiswa Internship") for i in range(interns)])
+
+    def batches():
+        written, day = 0, 0
+        while written < rows:
+            base = today - datetime.timedelta(days=day)
+            batch = []
+            for i in range(min(interns, rows - written)):
+                at = base + datetime.timedelta(hours=7, seconds=rng.randint(0, 3 * 3600))
+                absent_at, absent_date, absent_ts = attendance_time_columns(at)
+                batch.append((i, f"Intern {i}", f"Universitas {i % 20}", "Mahasiswa Internship",
+                              f"/images/Intern {i}_{absent_ts}.jpg", absent_at, absent_date, absent_ts))
+            yield batch
+            written += len(batch); day += 1
+
+    with conn:
+        for batch in batches():
+            conn.executemany("INSERT INTO attendance_logs (intern_id, intern_name, universitas, kategori, image_url, "
+                             "absent_at, absent_date, absent_ts) VALUES (?, ?, ?, ?, ?, ?, ?, ?)", batch)
+
+
+def time_query(conn, sql, args, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        conn.execute(sql, args).fetchall()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def run(sizes, repeat):
+    today = datetime.datetime.now(WIB).strftime('%Y-%m-%d')
+    print(f"{'baris':>10} {'query':<16} {'lama (ms)':>10} {'baru (ms)':>10}")
+    for size in sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            conn = sqlite3.connect(str(Path(tmp) / "bench.db"))
+            for pragma in CONNECTION_PRAGMAS:
+                conn.execute(pragma)
+            migrate_schema(conn)
+            generate_logs(conn, size)
+            conn.execute("ANALYZE")
+            for name, (sql, uses_today) in NEW_QUERIES.items():
+                args = (today,) if uses_today else ()
+                legacy_sql, _ = LEGACY_QUERIES[name]
+                legacy_ms = time_query(conn, legacy_sql, args, repeat)
+                new_ms = time_query(conn, sql, args, repeat)
+                print(f"{size:>10} {name:<16} {legacy_ms:>10.2f} {new_ms:>10.2f}")
+            conn.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    run(args.sizes, args.repeat)
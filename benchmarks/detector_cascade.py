@@ -0,0 +1,139 @@
+"""
+Perbandingan akurasi dan latensi kaskade deteksi pada gambar `captured_images`.
+
+Setiap gambar diproses dengan jalur lama (RetinaFace pada frame penuh, mode
+"off") dan dengan kaskade detektor cepat -> RetinaFace pada ROI (frame penuh
+jika detektor cepat tidak menemukan wajah; kolom "roi" menghitung gambar yang
+memakai ROI). Label yang
+diharapkan diambil dari nama file (`<nama>_<waktu>.jpg`), lalu hasilnya
+dicocokkan ke index wajah. Butuh DeepFace dan index hasil training.
+Jalankan dari root proyek:
+
+    python -m benchmarks.detector_cascade --modes off haar yunet --repeat 3
+"""
+import sys
+import json
+import time
+import argparse
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+from backend.utils import extract_face_features, fast_detect, preload_models
+from backend.face_index import EmbeddingIndex, l2_normalize
+from backend.model_registry import ModelRegistry
+
+DEFAULT_IMAGE_DIR = PROJECT_ROOT / "backend" / "captured_images"
+# Index versi aktif di registry, atau index lama jika registry masih kosong
+_registry = ModelRegistry(PROJECT_ROOT / "backend" / "model" / "registry")
+DEFAULT_INDEX_DIR = (_registry.path(_registry.current_version()) / "face_index" if _registry.current_version()
+                     else PROJECT_ROOT / "backend" / "model" / "face_index")
+
+
+def expected_name(path: Path) -> str:
+    # Nama file: "<nama>_<epoch>.jpg" atau "<nama>_<YYYYMMDD>_<HHMMSS>.jpg"
+    parts = path.stem.split("_")
+    while len(parts) > 1 and parts[-1].isdigit():
+        parts.pop()
+    return "_".join(parts)
+
+
+def percentile(values, q):
+    return float(np.percentile(values, q)) if values else 0.0
+
+
+def run_mode(images, mode, index, threshold, repeat):
+    """Mengembalikan hasil per gambar: nama, jarak, embedding, dan timing terbaik dari `repeat` kali."""
+    results = []
+    for path, frame in images:
+        best = None
+        for _ in range(repeat):
+            timings = {}
+            start = time.perf_counter()
+            features = extract_face_features(frame, cascade=mode, timings=timings)
+            timings["total"] = round((time.perf_counter() - start) * 1000, 2)
+            if best is None or timings["total"] < best[1]["total"]:
+                best = (features, timings)
+        features, timings = best
+        entry = {"image": path.name, "expected": expected_name(path), "timings": timings,
+                 "roi": mode != "off" and bool(fast_detect(frame, mode)), "face": features is not None, "name": None, "distance": None, "embedding": None}
+        if features:
+            embedding = l2_normalize(np.asarray(features[0], dtype=np.float32)[None, :])
+            names, distances = index.search(embedding)
+            entry["embedding"] = embedding[0]
+            entry["distance"] = round(float(distances[0]), 4)
+            entry["name"] = names[0] if distances[0] <= threshold else "unknown"
+        results.append(entry)
+    return results
+
+
+def summarize(results, baseline=None):
+    totals = [r["timings"]["total"] for r in results]
+    summary = {
+        "images": len(results),
+        "roi_used": sum(r["roi"] for r in results),
+        "faces_found": sum(r["face"] for r in results),
+        "correct": sum(r["name"] == r["expected"] for r in results),
+        "unknown": sum(r["name"] == "unknown" for r in results),
+        "total_ms_p50": round(percentile(totals, 50), 2),
+        "total_ms_p95": round(percentile(totals, 95), 2),
+        "detect_fast_ms_mean": round(float(np.mean([r["timings"].get("detect_fast", 0) for r in results])), 2),
+        "embed_ms_mean": round(float(np.mean([r["timings"].get("embed", 0) for r in results])), 2),
+    }
+    if baseline is not None:
+        # Kesepakatan keputusan dengan jalur lama, dan pergeseran embedding antar jalur
+        summary["agree_with_off"] = sum(r["name"] == b["name"] for r, b in zip(results, baseline))
+        drift = [float(1.0 - np.dot(r["embedding"], b["embedding"])) for r, b in zip(results, baseline)
+                 if r["embedding"] is not None and b["embedding"] is not None]
+        summary["embedding_drift_mean"] = round(float(np.mean(drift)), 4) if drift else None
+    return summary
+
+
+def run(image_dir, index_dir, modes, repeat, threshold, output):
+    paths = sorted(p for p in Path(image_dir).iterdir() if p.suffix.lower() in (".jpg", ".jpeg", ".png"))
+    images = [(p, frame) for p in paths if (frame := cv2.imread(str(p))) is not None]
+    if not images:
+        print(f"❌ Tidak ada gambar di {image_dir}")
+        return
+    index = EmbeddingIndex.load(index_dir)
+    preload_models()
+    # Satu kali per mode tanpa dihitung, agar trace TensorFlow tidak masuk ke latensi
+    for mode in modes:
+        extract_face_features(images[0][1], cascade=mode)
+
+    print(f"📸 {len(images)} gambar dari {image_dir}, repeat={repeat}")
+    per_mode, summaries = {}, {}
+    for mode in modes:
+        per_mode[mode] = run_mode(images, mode, index, threshold, repeat)
+    baseline = per_mode.get("off")
+    for mode in modes:
+        summaries[mode] = summarize(per_mode[mode], baseline if mode != "off" else None)
+
+    print(f"{'mode':<6} {'roi':>5} {'wajah':>6} {'benar':>6} {'sama':>6} {'p50 ms':>8} {'p95 ms':>8} {'cepat ms':>9} {'embed ms':>9}")
+    for mode, s in summaries.items():
+        agree = s.get("agree_with_off", "-")
+        print(f"{mode:<6} {s['roi_used']:>5} {s['faces_found']:>6} {s['correct']:>6} {agree:>6} {s['total_ms_p50']:>8.1f} "
+              f"{s['total_ms_p95']:>8.1f} {s['detect_fast_ms_mean']:>9.1f} {s['embed_ms_mean']:>9.1f}")
+
+    if output:
+        for results in per_mode.values():
+            for r in results:
+                r.pop("embedding")
+        with open(output, "w") as f:
+            json.dump({"summary": summaries, "images": per_mode}, f, indent=2)
+        print(f"💾 Hasil lengkap disimpan ke {output}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--images", type=Path, default=DEFAULT_IMAGE_DIR)
+    parser.add_argument("--index", type=Path, default=DEFAULT_INDEX_DIR)
+    parser.add_argument("--modes", nargs="+", default=["off", "haar", "yunet"], choices=["off", "haar", "yunet"])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--threshold", type=float, default=0.5)
+    parser.add_argument("--output", type=Path, help="file JSON untuk hasil per gambar")
+    args = parser.parse_args()
+    run(args.images, args.index, args.modes, args.repeat, args.threshold, args.output)
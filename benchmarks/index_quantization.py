@@ -0,0 +1,131 @@
+"""
+Mengukur kehilangan akurasi dan penghematan memori dari kuantisasi index
+embedding (float32 -> float16 / int8).
+
+Akurasi diukur leave-one-out pada index versi aktif (mode "samples"): setiap
+foto dataset dipakai sebagai query terhadap semua foto lain, lalu keputusan
+(nama atau "unknown" pada --threshold) dibandingkan dengan index float32.
+Opsi --scale menambah baris sintetis untuk melihat ukuran, latensi dan
+memori sementara pencarian saat roster membesar. Tidak butuh DeepFace.
+Jalankan dari root proyek:
+
+    python -m benchmarks.index_quantization --dtypes float32 float16 int8 --scale 10000 100000
+"""
+import sys
+import json
+import time
+import argparse
+import tracemalloc
+from pathlib import Path
+
+import numpy as np
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+from backend.face_index import EmbeddingIndex, INDEX_DTYPES, l2_normalize
+from backend.model_registry import ModelRegistry
+
+# Index versi aktif di registry, atau index lama jika registry masih kosong
+_registry = ModelRegistry(PROJECT_ROOT / "backend" / "model" / "registry")
+DEFAULT_INDEX_DIR = (_registry.path(_registry.current_version()) / "face_index" if _registry.current_version()
+                     else PROJECT_ROOT / "backend" / "model" / "face_index")
+
+
+def leave_one_out(index, threshold, chunk=256):
+    """Nama keputusan dan jarak terdekat per baris, tanpa mencocokkan baris ke dirinya sendiri."""
+    queries = index.vectors()
+    names, distances = [], []
+    for start in range(0, len(queries), chunk):
+        sims = index.backend.similarities(l2_normalize(queries[start:start + chunk]))
+        rows = np.arange(start, min(start + chunk, len(queries)))
+        sims[rows - start, rows] = -np.inf
+        best = np.argmax(sims, axis=1)
+        dist = 1.0 - sims[rows - start, best]
+        distances.extend(dist.tolist())
+        names.extend(index.names[index.labels[b]] if d <= threshold else "unknown" for b, d in zip(best, dist))
+    return names, np.asarray(distances)
+
+
+def evaluate(reference, dtypes, threshold):
+    expected = [reference.names[label] for label in reference.labels]
+    ref_names, ref_dist = leave_one_out(reference, threshold)
+    results = {}
+    for dtype in dtypes:
+        index = reference if dtype == "float32" else reference.quantized(dtype)
+        names, dist = leave_one_out(index, threshold)
+        error = np.abs(dist - ref_dist)
+        results[dtype] = {
+            "bytes": index.nbytes,
+            "correct": sum(n == e for n, e in zip(names, expected)),
+            "agree_with_float32": sum(n == r for n, r in zip(names, ref_names)),
+            "distance_error_mean": round(float(error.mean()), 6),
+            "distance_error_max": round(float(error.max()), 6),
+        }
+    return results
+
+
+def scale_test(reference, dtypes, rows, repeat=20, seed=7):
+    """Latensi pencarian dan memori sementara (tracemalloc) untuk roster sintetis sebesar `rows`."""
+    rng = np.random.default_rng(seed)
+    base = reference.vectors()
+    extra = max(rows - len(base), 0)
+    matrix = np.vstack([base, l2_normalize(rng.normal(size=(extra, reference.dim)))])
+    labels = np.concatenate([reference.labels, np.full(extra, len(reference.names), dtype=np.int32)])
+    synthetic = EmbeddingIndex(matrix, labels, reference.names + ["_synthetic"], model_name=reference.model_name)
+    query = base[:1]
+    results = {}
+    for dtype in dtypes:
+        index = synthetic if dtype == "float32" else synthetic.quantized(dtype)
+        index.search(query)
+        start = time.perf_counter()
+        for _ in range(repeat):
+            index.search(query)
+        latency_ms = (time.perf_counter() - start) * 1000 / repeat
+        tracemalloc.start()
+        index.search(query)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        results[dtype] = {"rows": len(index), "bytes": index.nbytes, "search_ms": round(latency_ms, 3),
+                          "search_peak_bytes": peak}
+    return results
+
+
+def run(index_dir, dtypes, threshold, scales, output):
+    reference = EmbeddingIndex.load(index_dir)
+    if reference.dtype != "float32":
+        print(f"⚠️ Index di {index_dir} sudah {reference.dtype}; akurasi dibandingkan terhadap hasil dequantize-nya.")
+        reference = reference.quantized("float32")
+    report = {"index": str(index_dir), "vectors": len(reference), "persons": len(reference.names), "threshold": threshold}
+    print(f"📦 {len(reference)} vektor, {len(reference.names)} orang, dim {reference.dim} ({reference.mode})")
+
+    if reference.mode == "samples":
+        report["accuracy"] = evaluate(reference, dtypes, threshold)
+        print(f"{'dtype':<8} {'KB':>8} {'benar':>6} {'sama':>6} {'Δjarak rata2':>13} {'Δjarak maks':>12}")
+        for dtype, r in report["accuracy"].items():
+            print(f"{dtype:<8} {r['bytes'] / 1024:>8.1f} {r['correct']:>6} {r['agree_with_float32']:>6} "
+                  f"{r['distance_error_mean']:>13.6f} {r['distance_error_max']:>12.6f}")
+    else:
+        print("⚠️ Leave-one-out butuh index mode 'samples'; uji akurasi dilewati.")
+
+    report["scale"] = {}
+    for rows in scales:
+        report["scale"][rows] = scale_test(reference, dtypes, rows)
+        for dtype, r in report["scale"][rows].items():
+            print(f"   {rows:>8} baris {dtype:<8} {r['bytes'] / 1024 / 1024:>8.1f} MB  "
+                  f"cari {r['search_ms']:>7.2f} ms  memori sementara {r['search_peak_bytes'] / 1024 / 1024:>6.1f} MB")
+
+    if output:
+        with open(output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"💾 Hasil disimpan ke {output}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--index", type=Path, default=DEFAULT_INDEX_DIR)
+    parser.add_argument("--dtypes", nargs="+", default=list(INDEX_DTYPES), choices=INDEX_DTYPES)
+    parser.add_argument("--threshold", type=float, default=0.5)
+    parser.add_argument("--scale", nargs="*", type=int, default=[], help="jumlah baris roster sintetis untuk uji skala")
+    parser.add_argument("--output", type=Path, help="file JSON untuk hasil lengkap")
+    args = parser.parse_args()
+    run(args.index, args.dtypes, args.threshold, args.scale, args.output)
@@ -0,0 +1,382 @@
+"""
+Benchmark & load test pipeline pengenalan, tanpa kamera dan tanpa jaringan.
+
+Server dijalankan di proses ini (uvicorn, port lokal) dengan database dan
+folder bukti sementara, lalu:
+
+  1. latensi per tahap /recognize (dari header Server-Timing) untuk request berurutan;
+  2. p50/p95/p99 end-to-end untuk N kiosk simulasi yang mengirim bersamaan;
+  3. efek cache frame berulang: frame yang sama dikirim dua kali dari satu kiosk;
+  4. throughput training (train_model_full) dengan dan tanpa cache embedding.
+
+Tahap 1 dan 2 mengirim X-Kiosk-Id unik per request, jadi cache frame berulang
+(dikunci per kiosk) tidak pernah kena dan angkanya bisa dibandingkan dengan
+hasil sebelum cache itu ada. Efek cache dilaporkan tersendiri di tahap 3.
+
+Frame diambil dari backend/captured_images, data/dataset, dan frame sintetis
+(frame kosong tanpa wajah, wajah kecil di kanvas 1280x720). Dengan
+--represent stub, DeepFace.represent diganti StubRepresent yang mengembalikan
+embedding dari index dengan latensi buatan, sehingga overhead di luar model
+bisa diukur tersendiri. Jalankan dari root proyek:
+
+    python -m benchmarks.recognition_pipeline --represent stub --kiosks 1 4 8 --output bench.json
+    python -m benchmarks.recognition_pipeline --represent real --compare bench.json
+"""
+import os
+import sys
+import json
+import time
+import zlib
+import shutil
+import itertools
+import socket
+import argparse
+import datetime
+import tempfile
+import platform
+import threading
+import subprocess
+from pathlib import Path
+
+import cv2
+import numpy as np
+import requests
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+
+CAPTURED_DIR = PROJECT_ROOT / "backend" / "captured_images"
+DATASET_DIR = PROJECT_ROOT / "data" / "dataset"
+STAGES = ("dhash", "repeat_cache", "decode", "detect_fast", "embed", "match", "queue", "evidence", "db_write", "tts", "response")
+KIOSK_HEADER = "X-Kiosk-Id"
+# Sumber X-Kiosk-Id unik untuk request yang tidak boleh kena cache frame berulang
+_kiosk_ids = itertools.count()
+
+
+class StubRepresent:
+    """
+    Pengganti DeepFace.represent untuk benchmark. Setiap panggilan tidur
+    `batch_ms + image_ms * jumlah gambar`, lalu mengembalikan satu baris index
+    yang dipilih dari hash piksel (jadi selalu cocok dengan seseorang).
+    Gambar polos (tanpa variasi piksel) dianggap tidak berisi wajah.
+    """
+
+    def __init__(self, matrix: np.ndarray, image_ms: float = 25.0, batch_ms: float = 5.0):
+        self.matrix = np.asarray(matrix, dtype=np.float32)
+        self.image_ms = image_ms
+        self.batch_ms = batch_ms
+
+    def __call__(self, img_path, model_name=None, enforce_detection=True, detector_backend=None, **kwargs):
+        images = img_path if isinstance(img_path, list) else [img_path]
+        time.sleep((self.batch_ms + self.image_ms * len(images)) / 1000)
+        results = [self._one(img) for img in images]
+        return results if isinstance(img_path, list) else results[0]
+
+    def _one(self, img):
+        if isinstance(img, str):
+            img = cv2.imread(img)
+        if img is None or img.size == 0 or float(img.std()) < 1.0:
+            return [{"embedding": [0.0] * self.matrix.shape[1], "facial_area": {"x": 0, "y": 0, "w": 0, "h": 0}, "face_confidence": 0}]
+        row = zlib.crc32(np.ascontiguousarray(img[::8, ::8]).tobytes()) % len(self.matrix)
+        return [{"embedding": self.matrix[row].tolist(),
+                 "facial_area": {"x": 0, "y": 0, "w": img.shape[1], "h": img.shape[0]}, "face_confidence": 1.0}]
+
+
+def install_stub(image_ms, batch_ms):
+    """Memasang StubRepresent ke DeepFace; build_model dijadikan no-op agar tidak mengunduh bobot."""
+    from deepface import DeepFace
+    from backend.model_registry import ModelRegistry
+    from backend.face_index import EmbeddingIndex
+    registry = ModelRegistry(PROJECT_ROOT / "backend" / "model" / "registry")
+    version = registry.current_version()
+    index_dir = registry.path(version) / "face_index" if version else PROJECT_ROOT / "backend" / "model" / "face_index"
+    DeepFace.represent = StubRepresent(EmbeddingIndex.load(index_dir).vectors(), image_ms, batch_ms)
+    DeepFace.build_model = lambda *args, **kwargs: None
+
+
+def load_frames(limit_per_source=40, seed=7):
+    """List (sumber, bytes JPEG) dari gambar tersimpan dan frame sintetis."""
+    rng = np.random.default_rng(seed)
+    frames = []
+    captured = sorted(CAPTURED_DIR.glob("*.jpg"))[:limit_per_source]
+    dataset = sorted(DATASET_DIR.glob("*/*.jpg")) if DATASET_DIR.is_dir() else []
+    dataset = [dataset[i] for i in rng.permutation(len(dataset))[:limit_per_source]]
+    for source, paths in (("captured", captured), ("dataset", dataset)):
+        frames.extend((source, p.read_bytes()) for p in paths)
+
+    # Frame kiosk tanpa orang: harus berakhir S002 tanpa menyentuh RetinaFace
+    blank = np.full((720, 1280, 3), 90, dtype=np.uint8)
+    frames.append(("synthetic_empty", cv2.imencode(".jpg", blank)[1].tobytes()))
+    # Wajah dataset ditempel di kanvas besar berderau: mensimulasikan orang yang agak jauh
+    for path in dataset[:10]:
+        face = cv2.imread(str(path))
+        if face is None:
+            continue
+        canvas = rng.integers(0, 255, size=(720, 1280, 3), dtype=np.uint8)
+        face = cv2.resize(face, (240, int(240 * face.shape[0] / face.shape[1])))[:480]
+        canvas[120:120 + face.shape[0], 520:520 + face.shape[1]] = face
+        frames.append(("synthetic_canvas", cv2.imencode(".jpg", canvas)[1].tobytes()))
+    return frames
+
+
+def parse_server_timing(header: str) -> dict:
+    timings = {}
+    for part in filter(None, (p.strip() for p in (header or "").split(","))):
+        name, _, dur = part.partition(";dur=")
+        if dur:
+            timings[name] = float(dur)
+    return timings
+
+
+def percentiles(values) -> dict:
+    if not values:
+        return {"count": 0}
+    arr = np.asarray(values)
+    return {"count": len(values), "mean": round(float(arr.mean()), 2), "p50": round(float(np.percentile(arr, 50)), 2),
+            "p95": round(float(np.percentile(arr, 95)), 2), "p99": round(float(np.percentile(arr, 99)), 2)}
+
+
+class BenchServer:
+    """Menjalankan backend.main di thread uvicorn dengan database & folder bukti sementara."""
+
+    def __init__(self, workdir: Path, allow_repeat: bool):
+        import uvicorn
+        import backend.main as server
+        self.server_module = server
+        db_copy = workdir / "attendance.db"
+        shutil.copy(server.AppConfig.DB_PATH, db_copy)
+        server.AppConfig.DB_PATH = db_copy
+        server.AppConfig.IMAGE_STORAGE_DIR = workdir / "captured_images"
+        server.AppConfig.IMAGE_STORAGE_DIR.mkdir()
+        if allow_repeat:
+            # Setiap frame dihitung sebagai absensi baru agar tahap evidence & db_write ikut terukur
+            server.absen_tercatat.reserve = lambda name, day: True
+
+        with socket.socket() as s:
+            s.bind(("127.0.0.1", 0))
+            self.port = s.getsockname()[1]
+        self.base_url = f"http://127.0.0.1:{self.port}"
+        self._server = uvicorn.Server(uvicorn.Config(server.app, host="127.0.0.1", port=self.port, log_level="warning"))
+        self._thread = threading.Thread(target=self._server.run, daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        deadline = time.monotonic() + 600
+        while time.monotonic() < deadline:
+            try:
+                if requests.get(f"{self.base_url}/api/ready", timeout=2).status_code == 200:
+                    return self
+            except requests.exceptions.RequestException:
+                pass
+            time.sleep(0.2)
+        raise RuntimeError("Server benchmark tidak siap dalam 10 menit")
+
+    def __exit__(self, *exc):
+        self._server.should_exit = True
+        self._thread.join(timeout=30)
+
+
+def post_frame(session, url, frame_bytes, kiosk=None):
+    """Mengirim satu frame; tanpa `kiosk` setiap request memakai X-Kiosk-Id baru (cache frame berulang tidak kena)."""
+    kiosk = kiosk or f"bench-{next(_kiosk_ids)}"
+    start = time.perf_counter()
+    response = session.post(url, data=frame_bytes, headers={"Content-Type": "image/jpeg", KIOSK_HEADER: kiosk}, timeout=60)
+    total_ms = (time.perf_counter() - start) * 1000
+    timings = parse_server_timing(response.headers.get("Server-Timing"))
+    # Sisa waktu di luar tahap yang dicatat server: HTTP, serialisasi, event loop
+    timings["response"] = round(max(total_ms - sum(timings.values()), 0), 2)
+    return response.status_code, total_ms, timings
+
+
+def bench_stages(base_url, frames, count):
+    """Request berurutan (satu kiosk) untuk memecah latensi per tahap."""
+    per_stage = {stage: [] for stage in STAGES}
+    totals, statuses = [], {}
+    with requests.Session() as session:
+        for i in range(count):
+            status, total_ms, timings = post_frame(session, f"{base_url}/recognize", frames[i % len(frames)][1])
+            statuses[status] = statuses.get(status, 0) + 1
+            totals.append(total_ms)
+            for stage, value in timings.items():
+                per_stage.setdefault(stage, []).append(value)
+    return {"total": percentiles(totals), "statuses": statuses,
+            "stages": {stage: percentiles(values) for stage, values in per_stage.items() if values}}
+
+
+def bench_load(base_url, frames, kiosks, requests_per_kiosk, think_ms):
+    """N kiosk bersamaan, masing-masing dengan koneksi sendiri."""
+    latencies, statuses, stage_values = [], {}, {}
+    lock = threading.Lock()
+    barrier = threading.Barrier(kiosks)
+
+    def kiosk(k):
+        with requests.Session() as session:
+            barrier.wait()
+            for i in range(requests_per_kiosk):
+                frame = frames[(k * 7 + i) % len(frames)][1]
+                try:
+                    status, total_ms, timings = post_frame(session, f"{base_url}/recognize", frame)
+                except requests.exceptions.RequestException:
+                    status, total_ms, timings = "error", None, {}
+                with lock:
+                    statuses[status] = statuses.get(status, 0) + 1
+                    if total_ms is not None:
+                        latencies.append(total_ms)
+                    for stage, value in timings.items():
+                        stage_values.setdefault(stage, []).append(value)
+                if think_ms:
+                    time.sleep(think_ms / 1000)
+
+    threads = [threading.Thread(target=kiosk, args=(k,)) for k in range(kiosks)]
+    started = time.perf_counter()
+    for t in threads: t.start()
+    for t in threads: t.join()
+    elapsed = time.perf_counter() - started
+    return {"kiosks": kiosks, "requests": kiosks * requests_per_kiosk, "elapsed_s": round(elapsed, 2),
+            "throughput_rps": round(kiosks * requests_per_kiosk / elapsed, 2),
+            "statuses": {str(k): v for k, v in statuses.items()}, "latency_ms": percentiles(latencies),
+            "stage_mean_ms": {s: round(float(np.mean(v)), 2) for s, v in stage_values.items()}}
+
+
+def repeat_hits(base_url) -> dict:
+    """Nilai counter attendance_repeat_cache_hits_total per jenis dari /metrics."""
+    hits = {"hash": 0.0, "embedding": 0.0}
+    for line in requests.get(f"{base_url}/metrics", timeout=10).text.splitlines():
+        for kind in hits:
+            if line.startswith(f'attendance_repeat_cache_hits_total{{kind="{kind}"}}'):
+                hits[kind] = float(line.rsplit(" ", 1)[1])
+    return hits
+
+
+def bench_repeat(base_url, frames, count):
+    """
+    Efek cache frame berulang: setiap frame dikirim dua kali berturut-turut
+    dari satu kiosk. Latensi kiriman pertama (selalu miss) dibandingkan dengan
+    kiriman ulang, beserta jumlah hit dari /metrics. Tanpa --keep-duplicates
+    orang yang dikenal tidak pernah tercatat, jadi hit hanya terjadi untuk
+    wajah tak dikenal; pakai --keep-duplicates untuk melihat hit duplikat.
+    """
+    first, repeat, statuses = [], [], {}
+    before = repeat_hits(base_url)
+    with requests.Session() as session:
+        for i in range(count):
+            frame = frames[i % len(frames)][1]
+            kiosk = f"bench-repeat-{i}"
+            _, total_ms, _ = post_frame(session, f"{base_url}/recognize", frame, kiosk)
+            first.append(total_ms)
+            status, total_ms, _ = post_frame(session, f"{base_url}/recognize", frame, kiosk)
+            repeat.append(total_ms)
+            statuses[status] = statuses.get(status, 0) + 1
+    after = repeat_hits(base_url)
+    return {"pairs": count, "first_ms": percentiles(first), "repeat_ms": percentiles(repeat),
+            "repeat_statuses": {str(k): v for k, v in statuses.items()},
+            "hits": {kind: int(after[kind] - before[kind]) for kind in after}}
+
+
+def bench_training(workdir: Path, workers: int, batch_size: int):
+    """Throughput train_model_full: ekstraksi penuh (cache kosong) lalu training ulang dari cache."""
+    from backend import train_model
+    train_model.EMBEDDING_CACHE_PATH = workdir / "embedding_cache.db"
+    train_model.TRAIN_WORKERS, train_model.TRAIN_BATCH_SIZE = workers, batch_size
+    images = len(train_model.list_dataset_images())
+    result = {"images": images, "workers": workers, "batch_size": batch_size}
+    for label, use_cache in (("cold", False), ("cached", True)):
+        start = time.perf_counter()
+        ok, _ = train_model.train_model_full(workdir / f"face_index_{label}", use_cache=use_cache)
+        elapsed = time.perf_counter() - start
+        result[label] = {"ok": ok, "elapsed_s": round(elapsed, 2), "images_per_s": round(images / elapsed, 2) if elapsed else None}
+    return result
+
+
+def compare(current: dict, baseline_path: Path):
+    """Mencetak selisih p50/p95 terhadap hasil JSON sebelumnya."""
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    print(f"\n📈 Dibandingkan dengan {baseline_path} ({baseline['meta'].get('git_commit')}):")
+    for stage, now in current.get("stages", {}).get("stages", {}).items():
+        before = baseline.get("stages", {}).get("stages", {}).get(stage)
+        if before and "p50" in before and "p50" in now:
+            print(f"   {stage:<12} p50 {before['p50']:>8.2f} -> {now['p50']:>8.2f} ms   p95 {before['p95']:>8.2f} -> {now['p95']:>8.2f} ms")
+    before_load = {run["kiosks"]: run for run in baseline.get("load", [])}
+    for run in current.get("load", []):
+        before = before_load.get(run["kiosks"])
+        if before and "p95" in before["latency_ms"] and "p95" in run["latency_ms"]:
+            print(f"   {run['kiosks']:>3} kiosk   p95 {before['latency_ms']['p95']:>8.2f} -> {run['latency_ms']['p95']:>8.2f} ms   "
+                  f"rps {before['throughput_rps']:>6.2f} -> {run['throughput_rps']:>6.2f}")
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=PROJECT_ROOT, capture_output=True, text=True).stdout.strip()
+    except OSError:
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--represent", choices=["stub", "real"], default="stub")
+    parser.add_argument("--stub-image-ms", type=float, default=25.0, help="latensi buatan per gambar (stub)")
+    parser.add_argument("--stub-batch-ms", type=float, default=5.0, help="latensi buatan per panggilan (stub)")
+    parser.add_argument("--stage-requests", type=int, default=50)
+    parser.add_argument("--kiosks", type=int, nargs="+", default=[1, 4, 8])
+    parser.add_argument("--requests-per-kiosk", type=int, default=20)
+    parser.add_argument("--think-ms", type=float, default=0)
+    parser.add_argument("--repeat-pairs", type=int, default=30, help="jumlah pasangan frame untuk uji cache frame berulang (0 = lewati)")
+    parser.add_argument("--keep-duplicates", action="store_true", help="jangan lewati pengecekan duplikat harian")
+    parser.add_argument("--train", action="store_true", help="ukur juga throughput train_model_full")
+    parser.add_argument("--train-workers", type=int, default=1)
+    parser.add_argument("--train-batch-size", type=int, default=8)
+    parser.add_argument("--output", type=Path, help="file JSON hasil benchmark")
+    parser.add_argument("--compare", type=Path, help="file JSON hasil sebelumnya untuk dibandingkan")
+    args = parser.parse_args()
+
+    # Watcher registry tidak dibutuhkan; stub hanya terpasang di proses ini, jadi executor harus thread
+    os.environ.setdefault("MODEL_WATCH_INTERVAL", "0")
+    if args.represent == "stub":
+        os.environ["INFERENCE_MODE"] = "thread"
+        install_stub(args.stub_image_ms, args.stub_batch_ms)
+        if args.train_workers > 1:
+            print("⚠️ Stub tidak terpasang di proses worker training, --train-workers dipaksa 1.")
+            args.train_workers = 1
+
+    frames = load_frames()
+    print(f"📸 {len(frames)} frame ({', '.join(sorted({s for s, _ in frames}))}), represent={args.represent}")
+    result = {"meta": {"git_commit": git_commit(), "timestamp": datetime.datetime.now().isoformat(),
+                       "python": platform.python_version(), "machine": platform.machine(), "cpu_count": os.cpu_count(),
+                       "args": {k: (str(v) if isinstance(v, Path) else v) for k, v in vars(args).items()}}}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        workdir = Path(tmp)
+        with BenchServer(workdir, allow_repeat=not args.keep_duplicates) as server:
+            result["stages"] = bench_stages(server.base_url, frames, args.stage_requests)
+            print(f"\n⏱️  Per tahap ({args.stage_requests} request berurutan), ms:")
+            for stage, s in result["stages"]["stages"].items():
+                print(f"   {stage:<12} p50 {s['p50']:>8.2f}   p95 {s['p95']:>8.2f}   p99 {s['p99']:>8.2f}")
+            result["load"] = []
+            print(f"\n🚦 Load test ({args.requests_per_kiosk} request per kiosk):")
+            for kiosks in args.kiosks:
+                run = bench_load(server.base_url, frames, kiosks, args.requests_per_kiosk, args.think_ms)
+                result["load"].append(run)
+                lat = run["latency_ms"]
+                print(f"   {kiosks:>3} kiosk  p50 {lat.get('p50', 0):>8.2f}  p95 {lat.get('p95', 0):>8.2f}  "
+                      f"p99 {lat.get('p99', 0):>8.2f} ms  {run['throughput_rps']:>6.2f} req/s  {run['statuses']}")
+            if args.repeat_pairs:
+                result["repeat_cache"] = rc = bench_repeat(server.base_url, frames, args.repeat_pairs)
+                print(f"\n🔁 Cache frame berulang ({args.repeat_pairs} pasang frame, kiosk yang sama):")
+                print(f"   kiriman pertama p50 {rc['first_ms'].get('p50', 0):>8.2f} ms   "
+                      f"kiriman ulang p50 {rc['repeat_ms'].get('p50', 0):>8.2f} ms   hit {rc['hits']}")
+        if args.train:
+            print("\n🧠 Throughput training:")
+            result["training"] = bench_training(workdir, args.train_workers, args.train_batch_size)
+            print(f"   {json.dumps(result['training'])}")
+
+    if args.compare:
+        compare(result, args.compare)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(result, f, indent=2)
+        print(f"\n💾 Hasil disimpan ke {args.output}")
+
+
+if __name__ == "__main__":
+    main()
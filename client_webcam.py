@@ -2,61 +2,222 @@ import cv2
 import requests
 import time
 import os
+import sys
+import json
+import threading
+import io
+import queue
+import hashlib
 import pygame
-import tempfile
+import socket
 
 SERVER_URL_BASE = "http://127.0.0.1:8000"
 RECOGNIZE_URL = f"{SERVER_URL_BASE}/recognize"
+GROUP_URL = f"{SERVER_URL_BASE}/recognize/group"
+AUDIO_MANIFEST_URL = f"{SERVER_URL_BASE}/api/audio/manifest"
+STREAM_URL = SERVER_URL_BASE.replace("http", "ws", 1) + "/ws/recognize"
+# Mode streaming: laju dan ukuran frame yang dikirim ke server
+STREAM_FPS = 3
+STREAM_MAX_WIDTH = 640
+# Mode tombol: wajah dipotong di klien lalu dikirim dengan header X-Face-Crop,
+# sehingga server melewati deteksi pada frame penuh
+CLIENT_FACE_CROP = True
+CROP_MARGIN = 0.5          # sama dengan CASCADE_ROI_MARGIN di server
+CROP_MAX_SIDE = 256        # ArcFace memakai 112x112; sisa resolusi untuk alignment RetinaFace
+# Kualitas JPEG menyesuaikan latensi upload yang terukur
+JPEG_QUALITY_MIN, JPEG_QUALITY_MAX = 50, 90
+TARGET_UPLOAD_MS = 250
+# Identitas kiosk untuk cache frame berulang di server
+KIOSK_ID = os.getenv("KIOSK_ID", socket.gethostname())
 LOCAL_AUDIO_DIR = os.path.join(os.path.dirname(__file__), 'backend', 'generated_audio')
 
-def play_audio(track_info: str):
-    if not track_info: return
-    try:
-        # Periksa apakah track_info adalah URL dari server (diawali dengan '/')
+# Satu session dengan pool koneksi untuk semua request ke server (keep-alive)
+http = requests.Session()
+http.mount("http://", requests.adapters.HTTPAdapter(pool_connections=2, pool_maxsize=4))
+http.mount("https://", requests.adapters.HTTPAdapter(pool_connections=2, pool_maxsize=4))
+
+def file_digest(path: str) -> str:
+    """Hash isi file dengan format yang sama seperti manifest server (SHA-256, 16 karakter)."""
+    with open(path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()[:16]
+
+class AudioPlayer:
+    """
+    Pemutar audio untuk kiosk. Saat startup seluruh track disinkronkan dengan
+    manifest server (hanya yang belum ada atau berubah yang diunduh) lalu
+    di-decode sekali menjadi pygame.mixer.Sound di memori. Pemutaran berjalan
+    di thread sendiri lewat antrean, jadi loop kamera tidak pernah menunggu
+    audio selesai; beberapa track (mode grup) diputar bergantian.
+    """
+
+    def __init__(self, audio_dir: str = LOCAL_AUDIO_DIR):
+        self.audio_dir = audio_dir
+        self._sounds = {}
+        self._lock = threading.Lock()
+        self._queue = queue.Queue()
+        threading.Thread(target=self._run, name="audio-player", daemon=True).start()
+
+    def sync(self):
+        """Unduh track yang hilang/berubah sesuai manifest, lalu muat semuanya ke memori."""
+        os.makedirs(self.audio_dir, exist_ok=True)
+        try:
+            response = http.get(AUDIO_MANIFEST_URL, timeout=5)
+            response.raise_for_status()
+            tracks = response.json()["tracks"]
+        except (requests.exceptions.RequestException, ValueError, KeyError) as e:
+            print(f"⚠️ Manifest audio tidak bisa diambil ({e}), memakai file lokal saja.")
+            tracks = {os.path.splitext(name)[0]: None for name in os.listdir(self.audio_dir) if name.endswith('.mp3')}
+
+        downloaded = 0
+        for track_id, info in tracks.items():
+            file_path = os.path.join(self.audio_dir, f"{track_id}.mp3")
+            if info and (not os.path.exists(file_path) or file_digest(file_path) != info["hash"]):
+                if self._download(track_id) is None:
+                    continue
+                downloaded += 1
+            self._load(track_id, file_path)
+        print(f"🔊 Audio siap: {len(self._sounds)} track di memori ({downloaded} diunduh).")
+
+    def play(self, track_info: str):
+        """Menjadwalkan pemutaran; langsung kembali."""
+        if track_info:
+            self._queue.put(track_info)
+
+    def _download(self, track_id: str):
+        """Mengunduh /audio/<track_id>.mp3 ke folder lokal (atomik). Mengembalikan path atau None."""
+        file_path = os.path.join(self.audio_dir, f"{track_id}.mp3")
+        try:
+            response = http.get(f"{SERVER_URL_BASE}/audio/{track_id}.mp3", timeout=5)
+            response.raise_for_status()
+            tmp_path = file_path + ".tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(response.content)
+            os.replace(tmp_path, file_path)
+            return file_path
+        except (requests.exceptions.RequestException, OSError) as e:
+            print(f"⚠️ Gagal mengunduh audio {track_id}: {e}")
+            return None
+
+    def _load(self, track_id: str, file_path: str):
+        try:
+            sound = pygame.mixer.Sound(file_path)
+        except (pygame.error, FileNotFoundError) as e:
+            print(f"⚠️ Audio {track_id} tidak bisa dimuat: {e}")
+            return None
+        with self._lock:
+            self._sounds[track_id] = sound
+        return sound
+
+    def _sound_for(self, track_info: str):
         if track_info.startswith('/'):
-            # Ini adalah audio dinamis, kita perlu mengunduhnya
-            audio_url = f"{SERVER_URL_BASE}{track_info}"
-            print(f"🔊 Mengunduh audio dinamis dari {audio_url}...")
-            
-            response = requests.get(audio_url, stream=True)
-            response.raise_for_status() # Akan error jika gagal diunduh
-            
-            # Simpan ke file temporer
-            with tempfile.NamedTemporaryFile(delete=False, suffix='.mp3') as tmp_file:
-                for chunk in response.iter_content(chunk_size=8192):
-                    tmp_file.write(chunk)
-                tmp_file_path = tmp_file.name
-
-            # Putar file temporer
-            pygame.mixer.music.load(tmp_file_path)
-            pygame.mixer.music.play()
-            while pygame.mixer.music.get_busy(): # Tunggu sampai selesai
-                pygame.time.Clock().tick(10)
-            
-            # Hapus file temporer setelah selesai diputar
-            os.remove(tmp_file_path)
-
-        else:
-            # Ini adalah audio lokal yang sudah ada
-            file_path = os.path.join(LOCAL_AUDIO_DIR, f"{track_info}.mp3")
-            if os.path.exists(file_path):
-                pygame.mixer.music.load(file_path)
-                pygame.mixer.music.play()
-                print(f"🔊 Memutar audio lokal: {track_info}.mp3")
-            else:
-                print(f"⚠️ File audio lokal tidak ditemukan: {track_info}.mp3")
+            # Audio dinamis dari server (URL): di-decode langsung dari memori, tidak disimpan
+            response = http.get(f"{SERVER_URL_BASE}{track_info}", timeout=10)
+            response.raise_for_status()
+            return pygame.mixer.Sound(file=io.BytesIO(response.content))
+        with self._lock:
+            sound = self._sounds.get(track_info)
+        if sound is not None:
+            return sound
+        # Track baru sejak sinkronisasi (mis. klip duplikat D0001): unduh sekali lalu simpan di memori
+        file_path = os.path.join(self.audio_dir, f"{track_info}.mp3")
+        if not os.path.exists(file_path) and self._download(track_info) is None:
+            return None
+        return self._load(track_info, file_path)
+
+    def _run(self):
+        while True:
+            track_info = self._queue.get()
+            try:
+                sound = self._sound_for(track_info)
+                if sound is None:
+                    print(f"⚠️ File audio tidak ditemukan: {track_info}")
+                    continue
+                channel = sound.play()
+                print(f"🔊 Memutar audio: {track_info}")
+                # Hanya thread ini yang menunggu; track berikutnya di antrean menyusul
+                while channel is not None and channel.get_busy():
+                    time.sleep(0.05)
+            except Exception as e:
+                print(f"❌ Error saat memutar audio: {e}")
+
+audio_player = None
+
+def start_audio():
+    """Inisialisasi mixer dan pemutar; sinkronisasi track berjalan di background."""
+    global audio_player
+    pygame.mixer.init()
+    audio_player = AudioPlayer()
+    threading.Thread(target=audio_player.sync, name="audio-sync", daemon=True).start()
+
+def play_audio(track_info: str):
+    if audio_player is not None:
+        audio_player.play(track_info)
+
+_face_cascade = None
+
+def crop_face(frame):
+    """
+    Deteksi wajah cepat (Haar) di klien lalu potong wajah terbesar beserta margin
+    dan perkecil ke CROP_MAX_SIDE. Mengembalikan (gambar, True) jika wajah
+    ditemukan, atau (frame yang diperkecil, False) agar server tetap memutuskan.
+    """
+    global _face_cascade
+    if _face_cascade is None:
+        _face_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + "haarcascade_frontalface_default.xml")
+    scale = min(1.0, 320 / max(frame.shape[:2]))
+    gray = cv2.equalizeHist(cv2.cvtColor(cv2.resize(frame, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA), cv2.COLOR_BGR2GRAY))
+    boxes = _face_cascade.detectMultiScale(gray, scaleFactor=1.15, minNeighbors=5, minSize=(24, 24))
+    if len(boxes) == 0:
+        small_scale = min(1.0, STREAM_MAX_WIDTH / frame.shape[1])
+        return cv2.resize(frame, None, fx=small_scale, fy=small_scale, interpolation=cv2.INTER_AREA), False
+
+    x, y, w, h = (int(v / scale) for v in max(boxes, key=lambda b: b[2] * b[3]))
+    pad_x, pad_y = int(w * CROP_MARGIN), int(h * CROP_MARGIN)
+    crop = frame[max(0, y - pad_y):y + h + pad_y, max(0, x - pad_x):x + w + pad_x]
+    crop_scale = min(1.0, CROP_MAX_SIDE / max(crop.shape[:2]))
+    if crop_scale < 1.0:
+        crop = cv2.resize(crop, None, fx=crop_scale, fy=crop_scale, interpolation=cv2.INTER_AREA)
+    return crop, True
+
+class AdaptiveJpegQuality:
+    """
+    Kualitas JPEG yang mengikuti latensi upload: turun cepat saat jaringan
+    lambat, naik perlahan saat kembali lancar. Latensi upload diperkirakan dari
+    waktu round-trip dikurangi total durasi di header Server-Timing.
+    """
+
+    def __init__(self, quality=80):
+        self.quality = quality
+        self.upload_ms = None
 
-    except Exception as e:
-        print(f"❌ Error saat memutar audio: {e}")
+    def encode(self, image):
+        _, image_bytes = cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, self.quality])
+        return image_bytes.tobytes()
+
+    def observe(self, round_trip_ms, server_timing=""):
+        server_ms = 0.0
+        for part in server_timing.split(","):
+            if "dur=" in part:
+                server_ms += float(part.split("dur=")[1])
+        sample = max(round_trip_ms - server_ms, 0.0)
+        # Rata-rata bergerak agar satu request lambat tidak langsung menjatuhkan kualitas
+        self.upload_ms = sample if self.upload_ms is None else 0.7 * self.upload_ms + 0.3 * sample
+        if self.upload_ms > TARGET_UPLOAD_MS:
+            self.quality = max(JPEG_QUALITY_MIN, self.quality - 10)
+        elif self.upload_ms < TARGET_UPLOAD_MS / 2:
+            self.quality = min(JPEG_QUALITY_MAX, self.quality + 5)
 
 def run_webcam_attendance():
     pygame.init()
-    pygame.mixer.init()
+    start_audio()
     cap = cv2.VideoCapture(0)
     if not cap.isOpened():
         print("❌ Error: Tidak bisa membuka kamera.")
         return
-    print("✅ Kamera siap. Tekan 'SPASI' untuk absen, 'Q' untuk keluar.")
+    print("✅ Kamera siap. Tekan 'SPASI' untuk absen, 'G' untuk absen grup, 'Q' untuk keluar.")
+    jpeg_quality = AdaptiveJpegQuality()
+    # Jeda singkat setelah absen tanpa menghentikan preview kamera
+    ready_at = 0.0
 
     while True:
         ret, frame = cap.read()
@@ -67,13 +228,25 @@ def run_webcam_attendance():
 
         if key == ord('q'):
             break
+        elif key in (ord(' '), ord('g')) and time.monotonic() < ready_at:
+            continue
         elif key == ord(' '):
             print("\n📸 Mengambil gambar...")
-            _, image_bytes = cv2.imencode('.jpg', frame)
+            headers = {'Content-Type': 'image/jpeg', 'X-Kiosk-Id': KIOSK_ID}
+            if CLIENT_FACE_CROP:
+                image, cropped = crop_face(frame)
+                if cropped:
+                    headers['X-Face-Crop'] = '1'
+                image_bytes = jpeg_quality.encode(image)
+            else:
+                _, image_bytes = cv2.imencode('.jpg', frame)
+                image_bytes = image_bytes.tobytes()
             
-            print("✈️  Mengirim gambar ke server...")
+            print(f"✈️  Mengirim gambar ke server ({len(image_bytes) // 1024} KB, kualitas {jpeg_quality.quality})...")
             try:
-                response = requests.post(RECOGNIZE_URL, data=image_bytes.tobytes(), headers={'Content-Type': 'image/jpeg'}, timeout=17)
+                started = time.perf_counter()
+                response = http.post(RECOGNIZE_URL, data=image_bytes, headers=headers, timeout=17)
+                jpeg_quality.observe((time.perf_counter() - started) * 1000, response.headers.get('Server-Timing', ''))
                 
                 result = response.json()
                 print(f"💬 Server: {result.get('message', 'N/A')}")
@@ -82,12 +255,101 @@ def run_webcam_attendance():
             except requests.exceptions.RequestException as e:
                 print(f"❌ Gagal terhubung ke server: {e}")
             
-            time.sleep(1) # Beri jeda singkat
+            ready_at = time.monotonic() + 1 # Beri jeda singkat
+            print("\n✅ Kamera siap kembali...")
+        elif key == ord('g'):
+            # Mode grup: frame penuh (tanpa crop) agar semua wajah dalam antrean ikut dikenali
+            print("\n📸 Mengambil gambar grup...")
+            image_bytes = jpeg_quality.encode(frame)
+            try:
+                started = time.perf_counter()
+                response = http.post(GROUP_URL, data=image_bytes, timeout=30,
+                                     headers={'Content-Type': 'image/jpeg', 'X-Kiosk-Id': KIOSK_ID})
+                jpeg_quality.observe((time.perf_counter() - started) * 1000, response.headers.get('Server-Timing', ''))
+                result = response.json()
+                print(f"💬 Server: {result.get('message', 'N/A')}")
+                if not result.get('faces'):
+                    play_audio(result.get('audio_track'))
+                for face in result.get('faces', []):
+                    print(f"   {face['status']:<9} {face.get('name', '-')} {face['box']}")
+                    # Antrean pemutar memutar audio tiap wajah bergantian
+                    play_audio(face.get('audio_track'))
+            except requests.exceptions.RequestException as e:
+                print(f"❌ Gagal terhubung ke server: {e}")
+
+            ready_at = time.monotonic() + 1
             print("\n✅ Kamera siap kembali...")
 
     cap.release()
     cv2.destroyAllWindows()
     pygame.quit()
 
+def run_streaming_attendance():
+    """
+    Mode tanpa tombol: frame kecil dikirim terus-menerus lewat WebSocket
+    (STREAM_FPS per detik) dan server yang memutuskan kapan mengenali wajah.
+    """
+    from websockets.sync.client import connect
+    from websockets.exceptions import ConnectionClosed
+
+    pygame.init()
+    start_audio()
+    cap = cv2.VideoCapture(0)
+    if not cap.isOpened():
+        print("❌ Error: Tidak bisa membuka kamera.")
+        return
+
+    status = {"text": "Menghubungkan..."}
+
+    def receive_events(ws):
+        # Event dari server diterima di thread terpisah agar loop kamera tidak tertahan
+        try:
+            for message in ws:
+                event = json.loads(message)
+                if event.get("event") == "gate":
+                    status["text"] = f"Gerbang: {event['reason']}"
+                elif event.get("event") == "result":
+                    status["text"] = event.get("message", str(event.get("status_code")))
+                    print(f"💬 Server: {event.get('message', event.get('status_code'))}")
+                    play_audio(event.get("audio_track"))
+        except ConnectionClosed:
+            status["text"] = "Koneksi terputus"
+
+    try:
+        with connect(STREAM_URL, max_size=None, additional_headers={'X-Kiosk-Id': KIOSK_ID}) as ws:
+            print("✅ Mode streaming aktif. Berdiri di depan kamera untuk absen, 'Q' untuk keluar.")
+            threading.Thread(target=receive_events, args=(ws,), daemon=True).start()
+            interval, last_sent = 1.0 / STREAM_FPS, 0.0
+            while True:
+                ret, frame = cap.read()
+                if not ret: break
+
+                if time.monotonic() - last_sent >= interval:
+                    last_sent = time.monotonic()
+                    scale = min(1.0, STREAM_MAX_WIDTH / frame.shape[1])
+                    small = cv2.resize(frame, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA) if scale < 1.0 else frame
+                    _, image_bytes = cv2.imencode('.jpg', small, [cv2.IMWRITE_JPEG_QUALITY, 80])
+                    try:
+                        ws.send(image_bytes.tobytes())
+                    except ConnectionClosed:
+                        print("❌ Koneksi streaming ke server terputus.")
+                        break
+
+                display_frame = frame.copy()
+                cv2.putText(display_frame, status["text"], (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 0), 2)
+                cv2.imshow('Webcam Absensi (Streaming)', display_frame)
+                if cv2.waitKey(1) & 0xFF == ord('q'):
+                    break
+    except OSError as e:
+        print(f"❌ Gagal terhubung ke server: {e}")
+
+    cap.release()
+    cv2.destroyAllWindows()
+    pygame.quit()
+
 if __name__ == "__main__":
-    run_webcam_attendance()
\ No newline at end of file
+    # 'python client_webcam.py --stream' untuk mode streaming tanpa tombol
+    if "--stream" in sys.argv[1:]:
+        run_streaming_attendance()
+    else:
+        run_webcam_attendance()
\ No newline at end of file
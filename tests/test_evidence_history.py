@@ -0,0 +1,56 @@
+import datetime
+
+import pytest
+import pytz
+
+pytest.importorskip("cv2")
+pytest.importorskip("deepface")
+
+from backend.database import attendance_time_columns, migrate_schema, open_connection
+from backend.evidence import THUMBS_DIR, evidence_relpath, evidence_url_updates, sweep_evidence
+from backend.history import fetch_history_page
+
+WIB = pytz.timezone("Asia/Jakarta")
+TODAY = datetime.date(2026, 3, 31)
+
+
+def _insert_with_evidence(conn, root, name, days_ago):
+    """Menyimpan satu absensi beserta potongan wajah dan thumbnail-nya."""
+    now = WIB.localize(datetime.datetime.combine(TODAY - datetime.timedelta(days=days_ago), datetime.time(8)))
+    absent_at, absent_date, absent_ts = attendance_time_columns(now)
+    relpath = evidence_relpath(name, absent_date, absent_ts)
+    crop = root / relpath
+    thumb = crop.parent / THUMBS_DIR / crop.name
+    thumb.parent.mkdir(parents=True, exist_ok=True)
+    crop.write_bytes(b"crop")
+    thumb.write_bytes(b"thumb")
+    conn.execute(
+        "INSERT INTO attendance_logs (intern_name, image_url, absent_at, absent_date, absent_ts) VALUES (?, ?, ?, ?, ?)",
+        (name, f"/images/{relpath}", absent_at, absent_date, absent_ts))
+
+
+@pytest.mark.parametrize("max_bytes", [0, 1])
+def test_history_urls_exist_after_sweep(tmp_path, max_bytes):
+    root = tmp_path / "captured_images"
+    conn = open_connection(tmp_path / "attendance.db")
+    migrate_schema(conn)
+    for name, days_ago in (("today", 0), ("recent", 3), ("compacted", 20), ("expired", 120)):
+        _insert_with_evidence(conn, root, name, days_ago)
+    conn.commit()
+
+    stats = sweep_evidence(root, TODAY, retention_days=90, compact_after_days=14, max_bytes=max_bytes)
+    # Dua kali: pembaruan harus idempoten
+    for _ in range(2):
+        with conn:
+            for sql, params in evidence_url_updates(TODAY, 90, 14, stats["removed_dates"]):
+                conn.execute(sql, params)
+
+    items = {row["intern_name"]: row for row in fetch_history_page(conn, {}, WIB, limit=10)["items"]}
+    assert items["expired"]["image_url"] is None
+    for row in items.values():
+        if row["image_url"]:
+            assert (root / row["image_url"].removeprefix("/images/")).is_file(), row
+    if not max_bytes:
+        assert f"/{THUMBS_DIR}/" in items["compacted"]["image_url"]
+        assert f"/{THUMBS_DIR}/" not in items["recent"]["image_url"]
+    conn.close()